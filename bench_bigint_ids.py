@@ -0,0 +1,254 @@
+import argparse
+import os
+import shutil
+import tempfile
+import time
+from datetime import datetime, timedelta
+import numpy as np
+from sqlalchemy import BigInteger, MetaData, String, create_engine, text
+from models import Base
+from migrate_ids import migrate_ids
+
+# Index sizes and query times of the VARCHAR id schema against the BIGINT
+# schema from models.py, on one synthetic dataset: the VARCHAR database is
+# built first, copied and migrated with migrate_ids.py, then the same queries
+# run on both. Sizes come from SQLite's dbstat table, every query is timed as
+# the best of a few runs. Queries the BIGINT schema makes slower are marked.
+# Every id read back from the migrated database must equal the VARCHAR one.
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--users", type=int, default=1_000_000)
+parser.add_argument("--tweets", type=int, default=1_000_000)
+parser.add_argument("--edges", type=int, default=2_000_000, help="rows per edge table")
+parser.add_argument("--lookups", type=int, default=10_000)
+parser.add_argument("--repeat", type=int, default=3)
+args = parser.parse_args()
+
+QUERIES = {
+    "most followed (join)": """
+        SELECT users.id, users.username, COUNT(*) AS edges
+        FROM followers JOIN users ON users.id = followers.user_id
+        GROUP BY users.id ORDER BY edges DESC LIMIT 100
+    """,
+    "in-degree (aggregate)": """
+        SELECT following_id, COUNT(*) AS edges FROM following
+        GROUP BY following_id ORDER BY edges DESC LIMIT 100
+    """,
+    "tweets per author (join)": """
+        SELECT tweets.author_id, users.username, COUNT(*), SUM(tweets.like_count)
+        FROM tweets JOIN users ON users.id = tweets.author_id
+        GROUP BY tweets.author_id
+    """,
+    "mutual follows (self join)": """
+        SELECT COUNT(*) FROM following AS a JOIN following AS b
+        ON b.user_id = a.following_id AND b.following_id = a.user_id
+    """,
+}
+LOOKUP = "SELECT follower_id FROM followers WHERE user_id = :user_id"
+# Id columns compared before and after the migration, users apart
+ID_COLUMNS = {
+    "tweets": ["id", "author_id", "conversation_id"],
+    "following": ["user_id", "following_id"],
+    "followers": ["user_id", "follower_id"],
+}
+
+rng = np.random.default_rng(7)
+# Accounts from before 2013 have short ids, newer ones are 19-digit snowflakes
+user_ids = np.where(
+    rng.random(args.users) < 0.5,
+    rng.integers(10_000_000, 3_000_000_000, args.users),
+    rng.integers(1_300_000_000_000_000_000, 1_700_000_000_000_000_000, args.users),
+)
+user_ids = np.unique(user_ids)
+# Most edges point at stored users, the rest at accounts never collected
+outside_ids = rng.integers(1_000_000_000_000_000_000, 1_700_000_000_000_000_000, args.users)
+
+
+def edge_ids(count):
+    sources = user_ids[rng.integers(0, len(user_ids) // 10, count)]
+    targets = np.where(
+        rng.random(count) < 0.7,
+        user_ids[rng.zipf(1.3, count) % len(user_ids)],
+        outside_ids[rng.integers(0, len(outside_ids), count)],
+    )
+    return sources, targets
+
+
+# models.py with every id column as VARCHAR, the schema before the migration
+def legacy_metadata():
+    metadata = MetaData()
+    for table in Base.metadata.sorted_tables:
+        copy = table.to_metadata(metadata)
+        for column in copy.columns:
+            if isinstance(column.type, BigInteger):
+                column.type = String()
+    return metadata
+
+
+def insert(connection, table, rows, chunk=100_000):
+    for offset in range(0, len(rows), chunk):
+        connection.execute(table.insert(), rows[offset : offset + chunk])
+
+
+def build(path):
+    engine = create_engine(f"sqlite:///{path}")
+    metadata = legacy_metadata()
+    metadata.create_all(engine)
+    tables = metadata.tables
+    with engine.begin() as connection:
+        insert(
+            connection,
+            tables["users"],
+            [
+                {"id": str(user_id), "username": f"user{n}", "followers_count": n % 5000}
+                for n, user_id in enumerate(user_ids.tolist())
+            ],
+        )
+        authors = user_ids[rng.integers(0, len(user_ids), args.tweets)].tolist()
+        first_tweet = 1_640_000_000_000_000_000
+        insert(
+            connection,
+            tables["tweets"],
+            [
+                {
+                    "id": str(first_tweet + n * 4099),
+                    "text": f"Tweet {n} #prostreno",
+                    "created_at": datetime(2022, 1, 1) + timedelta(seconds=n * 10),
+                    "author_id": str(author_id),
+                    "conversation_id": str(first_tweet + (n - n % 5) * 4099),
+                    "like_count": n % 50,
+                }
+                for n, author_id in enumerate(authors)
+            ],
+        )
+        for name, target in (("following", "following_id"), ("followers", "follower_id")):
+            sources, targets = edge_ids(args.edges)
+            edges = {(int(source), int(target_id)) for source, target_id in zip(sources, targets)}
+            insert(
+                connection,
+                tables[name],
+                [{"user_id": str(source), target: str(target_id)} for source, target_id in edges],
+            )
+    engine.dispose()
+
+
+# Rows, bytes of every table and bytes of its indexes, from dbstat
+def sizes(engine):
+    with engine.connect() as connection:
+        owners = dict(
+            connection.execute(text("SELECT name, tbl_name FROM sqlite_master")).all()
+        )
+        pages = connection.execute(
+            text("SELECT name, SUM(pgsize) FROM dbstat GROUP BY name")
+        ).all()
+    result = {}
+    for name, size in pages:
+        table = owners.get(name)
+        if table is None:
+            continue
+        rows, data, indexes = result.get(table, (0, 0, 0))
+        if name == table:
+            data += size
+        else:
+            indexes += size
+        result[table] = (rows, data, indexes)
+    with engine.connect() as connection:
+        for table, (_, data, indexes) in result.items():
+            rows = connection.execute(text(f"SELECT COUNT(*) FROM {table}")).scalar()
+            result[table] = (rows, data, indexes)
+    return result
+
+
+def time_queries(engine, lookup_ids):
+    timings = {}
+    with engine.connect() as connection:
+        for name, query in QUERIES.items():
+            best = None
+            for _ in range(args.repeat):
+                start = time.perf_counter()
+                connection.execute(text(query)).all()
+                elapsed = time.perf_counter() - start
+                best = elapsed if best is None else min(best, elapsed)
+            timings[name] = best
+        start = time.perf_counter()
+        for user_id in lookup_ids:
+            connection.execute(text(LOOKUP), {"user_id": user_id}).all()
+        timings[f"{len(lookup_ids)} follower lookups"] = time.perf_counter() - start
+    return timings
+
+
+def id_rows(engine, table, columns, where="1 = 1"):
+    query = f"SELECT {', '.join(columns)} FROM {table} WHERE {where}"
+    with engine.connect() as connection:
+        return {
+            tuple(None if value is None else int(value) for value in row)
+            for row in connection.execute(text(query))
+        }
+
+
+# Whether the ids came through the shadow columns unchanged. The migration
+# adds placeholder users for edge targets that were not stored, nothing else.
+def ids_round_trip(legacy_engine, bigint_engine):
+    checks = {}
+    for table, columns in ID_COLUMNS.items():
+        checks[table] = id_rows(legacy_engine, table, columns) == id_rows(
+            bigint_engine, table, columns
+        )
+    legacy_users = id_rows(legacy_engine, "users", ["id"])
+    bigint_users = id_rows(bigint_engine, "users", ["id"])
+    placeholders = id_rows(bigint_engine, "users", ["id"], "placeholder = 1")
+    checks["users"] = bigint_users - placeholders == legacy_users
+    return checks
+
+
+directory = tempfile.mkdtemp()
+legacy_path = os.path.join(directory, "varchar.db")
+bigint_path = os.path.join(directory, "bigint.db")
+
+start = time.perf_counter()
+build(legacy_path)
+print(f"Built the VARCHAR database in {time.perf_counter() - start:.0f}s.")
+shutil.copyfile(legacy_path, bigint_path)
+bigint_engine = create_engine(f"sqlite:///{bigint_path}")
+start = time.perf_counter()
+migrate_ids(bigint_engine)
+migration_time = time.perf_counter() - start
+
+legacy_engine = create_engine(f"sqlite:///{legacy_path}")
+lookup_ids = user_ids[rng.integers(0, len(user_ids) // 10, args.lookups)].tolist()
+results = {
+    "varchar": (sizes(legacy_engine), time_queries(legacy_engine, [str(n) for n in lookup_ids])),
+    "bigint": (sizes(bigint_engine), time_queries(bigint_engine, lookup_ids)),
+}
+
+print(
+    f"\n{len(user_ids)} users, {args.tweets} tweets, {args.edges} edges per table, "
+    f"migrated in {migration_time:.1f}s"
+)
+# The migration adds placeholder users for edge targets, compare bytes per row
+print(
+    f"{'table':>10} {'varchar rows':>13} {'data':>9} {'indexes':>9} {'index B/row':>12} "
+    f"{'bigint rows':>12} {'data':>9} {'indexes':>9} {'index B/row':>12}"
+)
+for table in ("users", "tweets", "following", "followers"):
+    line = f"{table:>10}"
+    for schema in ("varchar", "bigint"):
+        rows, data, indexes = results[schema][0][table]
+        line += (
+            f" {rows:>12} {data / 2**20:>6.1f} MB {indexes / 2**20:>6.1f} MB "
+            f"{indexes / max(rows, 1):>12.1f}"
+        )
+    print(line)
+print(f"\n{'query':>28} {'varchar':>9} {'bigint':>9} {'speedup':>8}")
+for name, legacy_time in results["varchar"][1].items():
+    bigint_time = results["bigint"][1][name]
+    speedup = legacy_time / bigint_time
+    print(
+        f"{name:>28} {legacy_time:>8.3f}s {bigint_time:>8.3f}s {speedup:>7.2f}x"
+        f"{'  slower' if speedup < 1 else ''}"
+    )
+checks = ids_round_trip(legacy_engine, bigint_engine)
+print(
+    "\nids unchanged by the migration: "
+    + ", ".join(f"{table} {'ok' if ok else 'DIFF'}" for table, ok in checks.items())
+)
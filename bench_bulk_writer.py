@@ -0,0 +1,96 @@
+import argparse
+import os
+import tempfile
+import time
+from datetime import datetime, timedelta
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import sessionmaker
+from models import Base, Tweet, User
+from bulk_writer import BulkWriter
+
+# Benchmark the tweet write path: the old per-row existence query + ORM add
+# against BulkWriter, writing pages of 100 tweets with 10% already stored.
+# Pass --url to run against a local Postgres instead of a SQLite file.
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--rows", type=int, default=1_000_000)
+parser.add_argument("--orm-rows", type=int, default=20_000)
+parser.add_argument("--url")
+args = parser.parse_args()
+
+authors = [4_000_000 + n for n in range(1000)]
+start_date = datetime(2023, 4, 1)
+
+
+def tweet_rows(count, first_id):
+    for n in range(count):
+        # Every tenth tweet repeats an id written earlier, as reruns do
+        tweet_id = first_id + (n - n % 10 if n % 10 == 9 else n)
+        yield {
+            "id": tweet_id,
+            "text": f"Tweet {tweet_id} o prostřeno",
+            "created_at": start_date + timedelta(seconds=tweet_id - first_id),
+            "author_id": authors[n % len(authors)],
+        }
+
+
+def pages(rows, size=100):
+    page = []
+    for row in rows:
+        page.append(row)
+        if len(page) == size:
+            yield page
+            page = []
+    if page:
+        yield page
+
+
+def new_session():
+    url = args.url or f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'bench.db')}"
+    engine = create_engine(url)
+    Base.metadata.drop_all(engine)
+    Base.metadata.create_all(engine)
+    session = sessionmaker(bind=engine)()
+    session.execute(User.__table__.insert(), [{"id": author} for author in authors])
+    session.commit()
+    return session
+
+
+# The old 3_user_tweets_grabber.py path
+def orm_write(session, count):
+    for page in pages(tweet_rows(count, 10**12)):
+        for row in page:
+            if session.get(Tweet, (row["id"], row["created_at"])) is None:
+                session.add(Tweet(**row))
+        session.commit()
+
+
+def bulk_write(session, count):
+    writer = BulkWriter(session, max_rows=10_000)
+    writer.register(Tweet, conflict="nothing")
+    for page in pages(tweet_rows(count, 10**12)):
+        writer.add_many(Tweet, page)
+        writer.flush_if_due()
+    writer.flush()
+    return writer.flushes
+
+
+results = []
+for name, write, count in (
+    ("per-row ORM", orm_write, args.orm_rows),
+    ("BulkWriter", bulk_write, args.rows),
+):
+    session = new_session()
+    start = time.perf_counter()
+    write(session, count)
+    elapsed = time.perf_counter() - start
+    stored = session.execute(text("SELECT COUNT(*) FROM tweets")).scalar()
+    session.close()
+    results.append((name, count, stored, elapsed))
+
+print(f"\ndatabase: {args.url or 'sqlite'}")
+for name, count, stored, elapsed in results:
+    print(
+        f"{name:>12}: {count} rows offered, {stored} stored in {elapsed:.2f} s "
+        f"({count / elapsed:,.0f} rows/s)"
+    )
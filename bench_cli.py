@@ -0,0 +1,201 @@
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+# Startup time and per-request latency of prostreno.py.
+#   startup   wall time of a fresh process for --help and two light commands,
+#             the CLI as it is (lazy imports, schema checked, not created)
+#             against the same commands with every pipeline module imported up
+#             front and create_all() on start, as the numbered scripts did
+#   counts    /2/tweets/counts/all requests of the search planner with a new
+#             connection per request (requests.get) and through one keep-alive
+#             session, with and without gzip bodies
+#   runs      consecutive small crawls as the snowball and the queue workers
+#             make them, with a new aiohttp session per run and with the
+#             engine's session kept open between runs
+# The mock API charges connect_latency for every new connection, standing in
+# for the TCP and TLS handshakes with api.twitter.com.
+
+EAGER_MODULES = [
+    "sqlalchemy.orm",
+    "models",
+    "rate_limit",
+    "bulk_writer",
+    "crawler",
+    "crawl_state",
+    "user_source",
+    "endpoints",
+    "timeline_sync",
+    "tweet_search",
+    "user_hydration",
+    "response_archive",
+    "tweepy_crawler",
+    "network_graph",
+]
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--repeat", type=int, default=5, help="process starts per command")
+parser.add_argument("--connect-latency", type=float, default=0.05)
+parser.add_argument("--latency", type=float, default=0.01)
+parser.add_argument("--counts", type=int, default=100, help="counts requests")
+parser.add_argument("--runs", type=int, default=50, help="consecutive crawls")
+parser.add_argument("--keys-per-run", type=int, default=24)
+parser.add_argument("--eager", nargs=argparse.REMAINDER, help=argparse.SUPPRESS)
+args = parser.parse_args()
+
+# The CLI with everything loaded and the schema created before the command
+if args.eager is not None:
+    import importlib
+
+    for name in EAGER_MODULES:
+        importlib.import_module(name)
+    import prostreno
+    from models import Base
+
+    if "--help" not in args.eager:
+        Base.metadata.create_all(prostreno.database(args.eager[1]))
+    prostreno.main(args.eager)
+    sys.exit()
+
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from bulk_writer import BulkWriter
+from crawler import CrawlEngine, Endpoint
+from endpoints import following_endpoint
+from mock_api import MockTwitterAPI
+from models import Base, User
+from prostreno import http_session
+from rate_limit import TokenPool
+from tweet_search import fetch_counts
+
+repository = os.path.dirname(os.path.abspath(__file__))
+tokens = ["token0", "token1", "token2"]
+
+
+def best_time(command, env):
+    best = None
+    for _ in range(args.repeat):
+        start = time.perf_counter()
+        subprocess.run(command, cwd=repository, env=env, stdout=subprocess.DEVNULL, check=True)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+# A migrated database with a small, fully hydrated follow graph
+def small_database(api):
+    path = os.path.join(tempfile.mkdtemp(), "cli.db")
+    engine = create_engine(f"sqlite:///{path}")
+    Base.metadata.create_all(engine)
+    session = sessionmaker(bind=engine)()
+    writer = BulkWriter(session)
+    endpoint = following_endpoint(writer)
+    for user_id in range(1_000_000, 1_000_200):
+        writer.add(User, {"id": user_id})
+        endpoint.on_page(user_id, api._following({}, str(user_id))[1])
+    writer.flush()
+    session.query(User).update({User.created_at: datetime(2020, 1, 1)})
+    session.commit()
+    session.close()
+    engine.dispose()
+    return f"sqlite:///{path}"
+
+
+def startup(api):
+    url = small_database(api)
+    env = dict(os.environ, DATABASE_URL=url, API_BASE_URL=api.base_url)
+    env.pop("ARCHIVE_DIR", None)
+    results = []
+    for command in (["--help"], ["--url", url, "hydrate"], ["--url", url, "analyze"]):
+        lazy = best_time([sys.executable, "prostreno.py"] + command, env)
+        eager = best_time(
+            [sys.executable, os.path.abspath(__file__), "--eager"] + command, env
+        )
+        results.append((" ".join(command).replace(url, "DB"), eager, lazy))
+    return results
+
+
+def counts(api):
+    pool = TokenPool(tokens, max_in_flight=1)
+    start = datetime(2023, 4, 1, tzinfo=timezone.utc)
+    identity = http_session()
+    identity.headers["Accept-Encoding"] = "identity"
+    results = []
+    for name, http in (
+        ("requests.get", None),
+        ("session", http_session()),
+        ("session, no gzip", identity),
+    ):
+        before = api.stats()
+        elapsed = time.perf_counter()
+        for n in range(args.counts):
+            moment = start + timedelta(days=n % 50)
+            fetch_counts(api.base_url, pool, "prostreno", moment, moment + timedelta(days=1), "hour", http)
+        elapsed = time.perf_counter() - elapsed
+        after = api.stats()
+        results.append(
+            (
+                name,
+                elapsed / args.counts,
+                after["connections"] - before["connections"],
+                (after["bytes_sent"] - before["bytes_sent"]) / args.counts,
+            )
+        )
+        if http is not None:
+            http.close()
+    return results
+
+
+def runs(api):
+    endpoint = Endpoint("following", "/2/users/{key}/following", {"max_results": 100}, lambda key, data: None)
+    batches = [
+        list(range(2_000_000 + n * args.keys_per_run, 2_000_000 + (n + 1) * args.keys_per_run))
+        for n in range(args.runs)
+    ]
+    results = []
+    for name, persistent in (("session per run", False), ("kept open", True)):
+        crawl_engine = CrawlEngine(api.base_url, tokens, progress_every=10**9)
+        before = api.stats()
+        requests_made = 0
+        start = time.perf_counter()
+        for batch in batches:
+            requests_made += crawl_engine.run(endpoint, batch).requests
+            if not persistent:
+                crawl_engine.close()
+        elapsed = time.perf_counter() - start
+        crawl_engine.close()
+        after = api.stats()
+        results.append(
+            (name, elapsed / requests_made, after["connections"] - before["connections"], requests_made)
+        )
+    return results
+
+
+with MockTwitterAPI(
+    latency=args.latency, connect_latency=args.connect_latency, compress=True, max_edges=250
+) as api:
+    startup_results = startup(api)
+    counts_results = counts(api)
+    runs_results = runs(api)
+
+print(f"\nBest of {args.repeat} process starts")
+print(f"{'command':>20} {'eager':>8} {'lazy':>8} {'speedup':>8}")
+for command, eager, lazy in startup_results:
+    print(f"{command:>20} {eager * 1000:>6.0f}ms {lazy * 1000:>6.0f}ms {eager / lazy:>7.2f}x")
+
+print(
+    f"\n{args.counts} counts requests, {args.latency * 1000:.0f} ms per request, "
+    f"{args.connect_latency * 1000:.0f} ms per new connection"
+)
+print(f"{'client':>20} {'per request':>12} {'connections':>12} {'bytes/request':>14}")
+for name, latency, connections, size in counts_results:
+    print(f"{name:>20} {latency * 1000:>10.1f}ms {connections:>12} {size:>14.0f}")
+
+print(f"\n{args.runs} crawls of {args.keys_per_run} users")
+print(f"{'aiohttp session':>20} {'per request':>12} {'connections':>12} {'requests':>9}")
+for name, latency, connections, requests_made in runs_results:
+    print(f"{name:>20} {latency * 1000:>10.2f}ms {connections:>12} {requests_made:>9}")
@@ -0,0 +1,88 @@
+import argparse
+import os
+import tempfile
+import time
+import requests
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from models import Base, Following
+from crawler import CrawlEngine
+from bulk_writer import BulkWriter
+from endpoints import following_endpoint
+from mock_api import MockTwitterAPI
+
+# Benchmark a following crawl against the local mock API with simulated
+# latency: the old serial requests loop versus the async crawl engine.
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--users", type=int, default=300)
+parser.add_argument("--latency", type=float, default=0.02)
+parser.add_argument("--tokens", type=int, default=3)
+parser.add_argument("--concurrency", type=int, default=4)
+args = parser.parse_args()
+
+user_ids = [2_000_000 + n * 37 for n in range(args.users)]
+bearer_tokens = [f"token{n}" for n in range(args.tokens)]
+
+
+def new_session():
+    path = os.path.join(tempfile.mkdtemp(), "bench.db")
+    engine = create_engine(f"sqlite:///{path}")
+    Base.metadata.create_all(engine)
+    return sessionmaker(bind=engine)()
+
+
+# The loop every grabber used to carry, without the 429 branch
+def serial_crawl(session, base_url):
+    request_count = 0
+    for user_id in user_ids:
+        url = f"{base_url}/2/users/{user_id}/following"
+        params = {"max_results": 100}
+        while True:
+            headers = {"Authorization": f"Bearer {bearer_tokens[0]}"}
+            response = requests.get(url, headers=headers, params=params)
+            request_count += 1
+            data = response.json()
+            for following_data in data.get("data", []):
+                session.add(Following(following_id=following_data["id"], user_id=user_id))
+            session.commit()
+            if "next_token" in data.get("meta", {}):
+                params["pagination_token"] = data["meta"]["next_token"]
+            else:
+                break
+    return request_count
+
+
+results = []
+with MockTwitterAPI(latency=args.latency) as api:
+    session = new_session()
+    start = time.perf_counter()
+    request_count = serial_crawl(session, api.base_url)
+    elapsed = time.perf_counter() - start
+    results.append(("serial", request_count, session.query(Following).count(), elapsed))
+
+    session = new_session()
+    writer = BulkWriter(session)
+    crawl_engine = CrawlEngine(
+        api.base_url,
+        bearer_tokens,
+        per_token_concurrency=args.concurrency,
+        progress_every=args.users,
+        writer=writer,
+    )
+    start = time.perf_counter()
+    stats = crawl_engine.run(following_endpoint(writer), user_ids)
+    crawl_engine.close()
+    elapsed = time.perf_counter() - start
+    results.append(("async engine", stats.requests, session.query(Following).count(), elapsed))
+
+print(
+    f"\nusers: {args.users}, latency: {args.latency * 1000:.0f} ms, "
+    f"tokens: {args.tokens}, in-flight per token: {args.concurrency}"
+)
+for name, request_count, edges, elapsed in results:
+    print(
+        f"{name:>12}: {request_count} requests, {edges} edges in {elapsed:.2f} s "
+        f"({request_count / elapsed:.1f} requests/s)"
+    )
+print(f"speedup: {results[0][3] / results[1][3]:.1f}x")
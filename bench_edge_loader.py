@@ -0,0 +1,116 @@
+import argparse
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import numpy as np
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import sessionmaker
+from models import Base, Following
+from edge_loader import COPY_SIGNATURE, CopySink, IdBuffer, copy_row_dtype, read_ids
+
+# Time and peak memory of reading the following table: one ORM object per edge
+# with session.query(Following).all() against read_ids() from edge_loader.py.
+# Each measurement runs in a fresh process. Without a PostgreSQL server here,
+# the COPY path is measured by feeding a synthetic binary COPY stream through
+# CopySink in the chunk sizes psycopg2 writes.
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--edges", type=int, default=2_000_000)
+parser.add_argument("--copy-edges", type=int, default=20_000_000)
+parser.add_argument("--child", nargs=2, metavar=("MODE", "DB"))
+args = parser.parse_args()
+
+
+def peak_rss():
+    try:
+        with open("/proc/self/status") as status:
+            for line in status:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def child(mode, path):
+    baseline = peak_rss()
+    start = time.perf_counter()
+    if mode == "copy":
+        # A block of binary COPY rows written repeatedly, 8 KB per write like psycopg2
+        block_ids = 1_500_000_000_000_000_000 + np.arange(200_000, dtype=np.int64) * 7919
+        records = np.zeros(len(block_ids), dtype=copy_row_dtype(2))
+        records["count"] = 2
+        records["length0"] = records["length1"] = 8
+        records["value0"] = block_ids
+        records["value1"] = block_ids[::-1]
+        block = records.tobytes()
+        header = COPY_SIGNATURE + bytes(8)
+        baseline = peak_rss()
+        start = time.perf_counter()
+        buffer = IdBuffer(2, args.copy_edges)
+        sink = CopySink(buffer, 2)
+        sink.write(header)
+        for _ in range(args.copy_edges // 200_000):
+            for offset in range(0, len(block), 8192):
+                sink.write(block[offset : offset + 8192])
+        sink.write(b"\xff\xff")
+        sink.close()
+        edges = buffer.array()
+        assert edges[-1, 0] == block_ids[-1] and edges[-1, 1] == block_ids[0]
+        count = len(edges)
+    else:
+        session = sessionmaker(bind=create_engine(f"sqlite:///{path}"))()
+        if mode == "orm":
+            edges = session.query(Following).all()
+            count = len(edges)
+        else:
+            edges = read_ids(session, "following", ["user_id", "following_id"])
+            count = len(edges)
+    elapsed = time.perf_counter() - start
+    print(f"{count} {elapsed:.2f} {peak_rss() - baseline:.1f}")
+
+
+if args.child:
+    child(*args.child)
+    sys.exit()
+
+path = os.path.join(tempfile.mkdtemp(), "edges.db")
+engine = create_engine(f"sqlite:///{path}")
+Base.metadata.create_all(engine)
+rng = np.random.default_rng(1)
+sources = 1_000_000_000 + rng.integers(0, 200_000, args.edges)
+targets = 1_000_000_000 + rng.integers(0, 2_000_000, args.edges)
+with engine.begin() as connection:
+    for offset in range(0, args.edges, 500_000):
+        connection.execute(
+            text("INSERT OR IGNORE INTO following (user_id, following_id) VALUES (:u, :f)"),
+            [
+                {"u": int(source), "f": int(target)}
+                for source, target in zip(
+                    sources[offset : offset + 500_000], targets[offset : offset + 500_000]
+                )
+            ],
+        )
+engine.dispose()
+
+print(f"{'source':>16} {'edges':>10} {'time':>7} {'memory':>10} {'per edge':>9}")
+for mode, label in (
+    ("orm", "ORM .all()"),
+    ("loader", "read_ids SQLite"),
+    ("copy", "binary COPY"),
+):
+    output = subprocess.run(
+        [sys.executable, __file__, "--child", mode, path]
+        + ["--copy-edges", str(args.copy_edges)],
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout.split()
+    count, elapsed, memory = int(output[0]), float(output[1]), float(output[2])
+    print(
+        f"{label:>16} {count:>10} {elapsed:>6.2f}s {memory:>7.0f} MB "
+        f"{memory * 2**20 / max(count, 1):>7.0f} B"
+    )
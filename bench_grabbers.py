@@ -0,0 +1,180 @@
+import argparse
+import os
+import runpy
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import sessionmaker
+from models import Base, User
+from mock_api import MockTwitterAPI, redirect_requests
+
+# End-to-end crawl benchmark: every grabber script runs unchanged in its own
+# process against the local mock API and a SQLite database, configured only
+# through the environment (DATABASE_URL, API_BASE_URL, BEARER_TOKEN*). The
+# tweepy V2 scripts reach the mock through redirect_requests().
+# 1 and 2 run in pipeline order on one database seeded with bare user ids; the
+# timeline and edge grabbers then each start from a copy of its state. Rate
+# limits, latency and injected 5xx errors are set on the mock, and requests,
+# 429s, errors and the time the server sat idle are counted on its side, so
+# every script is measured the same way whatever it prints. Pages per minute
+# counts the requests answered with data, so the V2 scripts' 1000-user pages
+# can be compared with the 100-user pages of the V1 scripts next to rows/s.
+
+DEFAULT_SCRIPTS = [
+    "1_tweet_grabber.py",
+    "2_user_grabber.py",
+    "3_user_tweets_grabber.py",
+    "3_user_tweets_grabberV2.py",
+    "4_user_following_grabber.py",
+    "4_user_following_grabberV2.py",
+    "5_user_followers_grabber.py",
+    "5_user_followers_grabberV2.py",
+]
+# Scripts that build the state the others start from
+PIPELINE = {"1_tweet_grabber.py", "2_user_grabber.py"}
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--scripts", default=",".join(DEFAULT_SCRIPTS))
+parser.add_argument("--seed-users", type=int, default=300)
+parser.add_argument("--suspended", type=int, default=10, help="seed users the API reports as suspended")
+parser.add_argument("--latency", type=float, default=0.01)
+parser.add_argument("--max-edges", type=int, default=150)
+parser.add_argument("--max-tweets", type=int, default=60)
+parser.add_argument("--error-rate", type=float, default=0.0)
+parser.add_argument(
+    "--rate-limit", default=None, metavar="REQUESTS/SECONDS",
+    help="per token and endpoint window, e.g. 900/60",
+)
+parser.add_argument("--timeout", type=float, default=600)
+parser.add_argument("--child", nargs=2, metavar=("SCRIPT", "BASE_URL"))
+args = parser.parse_args()
+
+
+# Run one grabber in this process with tweepy pointed at the mock
+def child(script, base_url):
+    redirect_requests(base_url)
+    runpy.run_path(script, run_name="__main__")
+
+
+if args.child:
+    child(*args.child)
+    sys.exit()
+
+directory = tempfile.mkdtemp()
+repository = os.path.dirname(os.path.abspath(__file__))
+pipeline_path = os.path.join(directory, "pipeline.db")
+seed_ids = [8_000_000 + n * 23 for n in range(args.seed_users)]
+
+
+def database_url(path):
+    return f"sqlite:///{path}"
+
+
+# Rows the grabbers produce: tweets, edges and hydrated user profiles
+def row_count(path):
+    engine = create_engine(database_url(path))
+    with engine.connect() as connection:
+        count = sum(
+            connection.execute(text(query)).scalar()
+            for query in (
+                "SELECT COUNT(*) FROM users WHERE created_at IS NOT NULL",
+                "SELECT COUNT(*) FROM tweets",
+                "SELECT COUNT(*) FROM following",
+                "SELECT COUNT(*) FROM followers",
+            )
+        )
+    engine.dispose()
+    return count
+
+
+# Bare user ids for 2_user_grabber.py to hydrate
+engine = create_engine(database_url(pipeline_path))
+Base.metadata.create_all(engine)
+session = sessionmaker(bind=engine)()
+session.add_all(User(id=user_id) for user_id in seed_ids)
+session.commit()
+session.close()
+engine.dispose()
+
+rate_limit = None
+if args.rate_limit:
+    requests_allowed, seconds = args.rate_limit.split("/")
+    rate_limit = (int(requests_allowed), float(seconds))
+
+# Pipeline scripts first, the others each start from what they left
+scripts = args.scripts.split(",")
+scripts = [name for name in scripts if name in PIPELINE] + [
+    name for name in scripts if name not in PIPELINE
+]
+results = []
+with MockTwitterAPI(
+    suspended=seed_ids[: args.suspended],
+    latency=args.latency,
+    max_edges=args.max_edges,
+    max_tweets=args.max_tweets,
+    rate_limit=rate_limit,
+    error_rate=args.error_rate,
+) as api:
+    for script in scripts:
+        path = pipeline_path
+        if script not in PIPELINE:
+            path = os.path.join(directory, script.replace(".py", ".db"))
+            shutil.copyfile(pipeline_path, path)
+        env = dict(os.environ)
+        env.pop("ARCHIVE_DIR", None)
+        env.update(
+            DATABASE_URL=database_url(path),
+            API_BASE_URL=api.base_url,
+            BEARER_TOKEN="token0",
+            BEARER_TOKEN2="token1",
+            BEARER_TOKEN3="token2",
+            API_KEY="key",
+            API_SECRET="secret",
+        )
+        log_path = os.path.join(directory, script.replace(".py", ".log"))
+        rows_before = row_count(path)
+        before = api.stats()
+        start = time.perf_counter()
+        with open(log_path, "w") as log:
+            try:
+                returncode = subprocess.run(
+                    [sys.executable, os.path.abspath(__file__), "--child", script, api.base_url],
+                    cwd=repository,
+                    env=env,
+                    stdout=log,
+                    stderr=subprocess.STDOUT,
+                    timeout=args.timeout,
+                ).returncode
+            except subprocess.TimeoutExpired:
+                returncode = "timeout"
+        elapsed = time.perf_counter() - start
+        after = api.stats()
+        counts = {name: after[name] - before[name] for name in after}
+        rows = row_count(path) - rows_before
+        results.append((script, elapsed, counts, rows, returncode))
+        print(
+            f"{script}: {counts['requests']} requests, {rows} rows in {elapsed:.1f} s "
+            f"(exit {returncode}, log {log_path})"
+        )
+
+print(
+    f"\nseed users: {args.seed_users}, latency: {args.latency * 1000:.0f} ms, "
+    f"rate limit: {args.rate_limit or 'none'}, error rate: {args.error_rate:.1%}"
+)
+print(
+    f"{'script':>30} {'time':>7} {'requests':>9} {'req/s':>7} {'pages/min':>10} "
+    f"{'rows':>8} {'rows/s':>8} {'429':>5} {'5xx':>5} {'idle':>7} {'exit':>5}"
+)
+for script, elapsed, counts, rows, returncode in results:
+    # Pages are the requests answered with data
+    pages = counts["requests"] - counts["rate_limited"] - counts["errors"]
+    print(
+        f"{script:>30} {elapsed:>6.1f}s {counts['requests']:>9} "
+        f"{counts['requests'] / elapsed:>7.1f} {pages / elapsed * 60:>10.0f} "
+        f"{rows:>8} {rows / elapsed:>8.0f} "
+        f"{counts['rate_limited']:>5} {counts['errors']:>5} "
+        f"{counts['idle_time']:>6.1f}s {returncode:>5}"
+    )
@@ -0,0 +1,113 @@
+import argparse
+import os
+import resource
+import tempfile
+import time
+import numpy as np
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from models import Base, User, Following, Follower
+from network_graph import Graph, load_graph
+
+# Benchmark of network_graph.py on a synthetic follow graph with a heavy-tailed
+# in-degree, like a fan base around a few popular accounts. The large graph is
+# built straight from arrays; load_graph() is measured on a smaller graph in a
+# SQLite database, since writing tens of millions of rows to SQLite is the slow
+# part there.
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--nodes", type=int, default=1_000_000)
+parser.add_argument("--edges", type=int, default=9_100_000)
+parser.add_argument("--db-nodes", type=int, default=50_000)
+parser.add_argument("--db-edges", type=int, default=500_000)
+args = parser.parse_args()
+
+
+def peak_rss():
+    with open("/proc/self/status") as status:
+        for line in status:
+            if line.startswith("VmHWM:"):
+                return int(line.split()[1]) / 1024
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def synthetic_edges(nodes, edges, seed=1):
+    rng = np.random.default_rng(seed)
+    user_ids = 10_000_000 + np.arange(nodes, dtype=np.int64) * 13
+    sources = rng.integers(0, nodes, edges)
+    targets = (nodes * rng.random(edges) ** 3).astype(np.int64)
+    # A tenth of the edges are followed back, about 10M edges in total
+    back = rng.random(edges) < 0.1
+    sources, targets = (
+        np.concatenate([sources, targets[back]]),
+        np.concatenate([targets, sources[back]]),
+    )
+    return user_ids, user_ids[sources], user_ids[targets]
+
+
+def timed(name, function, results, *args):
+    start = time.perf_counter()
+    value = function(*args)
+    results.append((name, time.perf_counter() - start))
+    return value
+
+
+# Small graph through SQLite and load_graph()
+db_user_ids, db_sources, db_targets = synthetic_edges(args.db_nodes, args.db_edges)
+path = os.path.join(tempfile.mkdtemp(), "graph.db")
+engine = create_engine(f"sqlite:///{path}")
+Base.metadata.create_all(engine)
+half = len(db_sources) // 2
+with engine.begin() as connection:
+    connection.execute(
+        User.__table__.insert(), [{"id": int(user_id)} for user_id in db_user_ids]
+    )
+    connection.execute(
+        Following.__table__.insert().prefix_with("OR IGNORE"),
+        [
+            {"user_id": int(source), "following_id": int(target)}
+            for source, target in zip(db_sources[:half], db_targets[:half])
+        ],
+    )
+    connection.execute(
+        Follower.__table__.insert().prefix_with("OR IGNORE"),
+        [
+            {"user_id": int(target), "follower_id": int(source)}
+            for source, target in zip(db_sources[half:], db_targets[half:])
+        ],
+    )
+session = sessionmaker(bind=engine)()
+start = time.perf_counter()
+db_graph = load_graph(session)
+print(
+    f"load_graph() from SQLite: {db_graph.node_count} nodes, {db_graph.edge_count} edges "
+    f"in {time.perf_counter() - start:.2f}s"
+)
+session.close()
+del db_graph, db_user_ids, db_sources, db_targets
+
+# Large graph from arrays
+user_ids, source_ids, target_ids = synthetic_edges(args.nodes, args.edges)
+rss_before = peak_rss()
+results = []
+graph = timed(
+    "build CSR/CSC", Graph.from_edges, results, user_ids, source_ids, target_ids
+)
+del source_ids, target_ids
+print(
+    f"\n{graph.node_count} nodes, {graph.edge_count} edges, "
+    f"{graph.nbytes() / 2**20:.0f} MB in matrices and id map, "
+    f"peak RSS {peak_rss():.0f} MB ({rss_before:.0f} MB before building)"
+)
+
+timed("in/out degree", lambda: (graph.in_degree(), graph.out_degree()), results)
+pagerank = timed("pagerank", graph.pagerank, results)
+hubs, authorities = timed("hits", graph.hits, results)
+reciprocity = timed("reciprocity", graph.reciprocity, results)
+core = timed("core numbers", graph.core_numbers, results)
+
+print(f"\n{'step':>15} {'time':>8}")
+for name, elapsed in results:
+    print(f"{name:>15} {elapsed:>7.2f}s")
+print(f"\nreciprocity {reciprocity:.3f}, max core {core.max()}, peak RSS {peak_rss():.0f} MB")
+print("top pagerank:", graph.top(pagerank, 3))
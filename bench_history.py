@@ -0,0 +1,197 @@
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+from history import METRICS, History
+
+# The history of --crawls recrawls of --users synthetic following lists, every
+# crawl dropping --churn of each list and following as many new accounts, and
+# of the public_metrics of every user, a third of them changing per crawl.
+# Storage of history.History (edge add/remove events, metrics rows only when
+# they change) against a full copy of the lists and metrics per crawl, both
+# zstd Parquet. History.flush(), the diff of all lists with their previous
+# crawl and the write of the changes, is timed against diffing Python sets of
+# the same ids list by list, without writing anything, and the memory of the
+# latest lists as History keeps them against the sets a set diff keeps. Then
+# the lists are rebuilt as of every crawl with edges_as_of() and must equal
+# the lists crawled then, and the metrics with metrics_as_of().
+
+START = datetime(2024, 1, 1)
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--users", type=int, default=20_000)
+parser.add_argument("--follows", type=int, default=150, help="mean following list length")
+parser.add_argument("--crawls", type=int, default=12)
+parser.add_argument("--churn", type=float, default=0.03)
+parser.add_argument("--page", type=int, default=1000, help="ids per page, as --v2 asks")
+parser.add_argument("--seed", type=int, default=1)
+args = parser.parse_args()
+
+rng = np.random.default_rng(args.seed)
+accounts = args.users * 20
+
+
+def directory_size(path):
+    return sum(
+        os.path.getsize(os.path.join(parent, name))
+        for parent, _, names in os.walk(path)
+        for name in names
+    )
+
+
+# Lists of every user after one more crawl's churn, sorted
+def churn(lists):
+    changed = []
+    for targets in lists:
+        dropped = rng.random(len(targets)) < args.churn
+        new = rng.integers(0, accounts, dropped.sum() + 1)
+        changed.append(np.union1d(targets[~dropped], new))
+    return changed
+
+
+def metric_rows(values):
+    return [
+        dict(zip(["id"] + METRICS, [user_id] + row))
+        for user_id, row in enumerate(values.tolist())
+    ]
+
+
+def full_copy(path, lists, values, at):
+    users = np.repeat(np.arange(len(lists)), [len(targets) for targets in lists])
+    for name, table in (
+        (
+            "following",
+            pa.table({"user_id": users, "target_id": np.concatenate(lists)}),
+        ),
+        (
+            "metrics",
+            pa.table(
+                {"user_id": np.arange(len(values)), **dict(zip(METRICS, values.T))}
+            ),
+        ),
+    ):
+        os.makedirs(os.path.join(path, name), exist_ok=True)
+        pq.write_table(
+            table,
+            os.path.join(path, name, f"{at:%Y%m%d}.parquet"),
+            compression="zstd",
+        )
+
+
+def set_diff(previous, lists):
+    start = time.perf_counter()
+    changes = 0
+    for old, new in zip(previous, lists):
+        old = set(old.tolist())
+        new = set(new.tolist())
+        changes += len(new - old) + len(old - new)
+    return changes, time.perf_counter() - start
+
+
+directory = tempfile.mkdtemp()
+history_path = os.path.join(directory, "history")
+copies_path = os.path.join(directory, "copies")
+# One flush per crawl
+history = History(history_path, max_rows=2**62)
+lengths = np.maximum(rng.lognormal(np.log(args.follows) - 0.5, 1.0, args.users), 1)
+lists = [np.unique(rng.integers(0, accounts, int(length))) for length in lengths]
+values = np.column_stack(
+    [
+        rng.zipf(1.8, args.users),
+        rng.integers(0, 2000, args.users),
+        rng.integers(0, 5000, args.users),
+    ]
+).astype(np.int64)
+crawled = []
+rows = []
+previous = None
+for crawl in range(args.crawls):
+    at = START + timedelta(days=7 * crawl)
+    if crawl:
+        lists = churn(lists)
+        moved = rng.random(args.users) < 1 / 3
+        values[moved] += rng.integers(0, 20, (moved.sum(), len(METRICS)))
+    for user_id, targets in enumerate(lists):
+        history.start_list("following", user_id)
+        for offset in range(0, len(targets), args.page):
+            history.add_edges("following", user_id, targets[offset : offset + args.page])
+        history.end_list("following", user_id, at=at)
+    history.record_metrics(metric_rows(values), at)
+    start = time.perf_counter()
+    history.flush()
+    diff_time = time.perf_counter() - start
+    events = history.edge_events("following", start=at, end=at + timedelta(days=1)).num_rows
+    set_changes, set_time = set_diff(previous, lists) if previous else (events, None)
+    full_copy(copies_path, lists, values, at)
+    previous = lists
+    crawled.append((at, lists, values.copy()))
+    rows.append(
+        (
+            crawl,
+            sum(len(targets) for targets in lists),
+            events,
+            "ok" if events == set_changes else "DIFF",
+            diff_time,
+            set_time,
+        )
+    )
+
+# Rebuild every crawl from the events
+checks = []
+rebuild_times = []
+for at, lists, expected_values in crawled:
+    start = time.perf_counter()
+    users, targets = history.edges_as_of("following", at)
+    rebuild_times.append(time.perf_counter() - start)
+    expected_users = np.repeat(np.arange(len(lists)), [len(targets) for targets in lists])
+    metrics = history.metrics_as_of(at)
+    checks.append(
+        np.array_equal(users, expected_users)
+        and np.array_equal(targets, np.concatenate(lists))
+        and all(
+            np.array_equal(metrics.column(name).to_numpy(), expected_values[:, column])
+            for column, name in enumerate(METRICS)
+        )
+    )
+# Python ints above 256 are objects of their own
+set_bytes = sum(sys.getsizeof(set(targets.tolist())) for targets in previous)
+set_bytes += 32 * sum(len(targets) for targets in previous)
+state_bytes = sum(column.nbytes for column in history.edges_as_of("following"))
+start = time.perf_counter()
+copy = pq.read_table(os.path.join(copies_path, "following", f"{crawled[-1][0]:%Y%m%d}.parquet"))
+copy_read_time = time.perf_counter() - start
+
+print(
+    f"\n{args.users} users, {args.crawls} crawls, {args.churn:.0%} of every list "
+    f"churned per crawl"
+)
+print(
+    f"{'crawl':>6} {'edges':>10} {'events':>9} {'check':>6} "
+    f"{'flush':>9} {'sets':>9} {'vs sets':>8}"
+)
+for crawl, edges, events, check, diff_time, set_time in rows:
+    sets = f"{set_time:>8.2f}s {set_time / diff_time:>7.1f}x" if set_time else f"{'':>18}"
+    print(f"{crawl:>6} {edges:>10} {events:>9} {check:>6} {diff_time:>8.2f}s {sets}")
+for kind in ("following", "metrics"):
+    kept = directory_size(os.path.join(history_path, kind))
+    copies = directory_size(os.path.join(copies_path, kind))
+    print(
+        f"{kind:>9}: history {kept / 2**20:>7.1f} MB, full copies {copies / 2**20:>7.1f} MB "
+        f"({copies / kept:.1f}x)"
+    )
+print(
+    f"latest lists in memory: History {state_bytes / 2**20:.0f} MB, "
+    f"sets {set_bytes / 2**20:.0f} MB"
+)
+print(
+    f"rebuilt {len(checks)} crawls as of their time "
+    f"({'ok' if all(checks) else 'DIFF'}), the last in {rebuild_times[-1]:.2f}s "
+    f"(reading its full copy {copy_read_time:.2f}s)"
+)
+shutil.rmtree(directory)
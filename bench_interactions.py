@@ -0,0 +1,153 @@
+import argparse
+import os
+import tempfile
+import time
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import sessionmaker
+from models import Base, User, Tweet
+from bulk_writer import BulkWriter
+from crawler import CrawlEngine
+from endpoints import followers_endpoint
+from interactions import backfill_archive, backfill_tweets, resolve_reference_authors
+from mock_api import MockTwitterAPI, fake_tweet, fake_user
+from network_graph import load_interaction_graph
+from response_archive import ResponseArchive
+from timeline_sync import TimelineSyncEndpoint
+from user_hydration import parse_twitter_time, user_row
+
+# Interaction edges against follow edges from the local mock API, and the two
+# backfills:
+#   crawl     timelines of --users users with the archive on, against the
+#             followers of the same users; edges stored per request
+#   archive   the interaction tables rebuilt from the archive alone in a fresh
+#             database, with one parsing process and with --workers; the rows
+#             must match the crawled ones
+#   text      interactions derived from the text of --tweets stored tweets
+#             (the tweets table as it was before interactions were stored),
+#             with one parsing process and with --workers
+
+TABLES = ("mentions", "hashtags", "tweet_references")
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--users", type=int, default=200)
+parser.add_argument("--max-tweets", type=int, default=800)
+parser.add_argument("--max-edges", type=int, default=3000)
+parser.add_argument("--tweets", type=int, default=1_000_000)
+parser.add_argument("--workers", type=int, default=4)
+parser.add_argument("--latency", type=float, default=0.01)
+args = parser.parse_args()
+
+directory = tempfile.mkdtemp()
+archive_directory = os.path.join(directory, "archive")
+# Search authors of the mock with 1000 to 2000 followers, mentioned by the others
+user_ids = [3_001_000 + n * 1000 // args.users for n in range(args.users)]
+
+
+def new_session(name):
+    engine = create_engine(f"sqlite:///{os.path.join(directory, name)}")
+    Base.metadata.create_all(engine)
+    return sessionmaker(bind=engine)()
+
+
+def counts(session, tables=TABLES):
+    return {
+        table: session.execute(text(f"SELECT COUNT(*) FROM {table}")).scalar()
+        for table in tables
+    }
+
+
+# Crawl timelines with the archive on, then followers of the same users
+session = new_session("crawled.db")
+with MockTwitterAPI(
+    latency=args.latency, max_tweets=args.max_tweets, max_edges=args.max_edges
+) as api:
+    writer = BulkWriter(session)
+    archive = ResponseArchive(archive_directory)
+    crawl_engine = CrawlEngine(
+        api.base_url, ["a", "b", "c"], writer=writer, archive=archive, progress_every=10**9
+    )
+    timeline = TimelineSyncEndpoint(session, writer)
+    timeline_stats = crawl_engine.run(timeline, timeline.prepare(user_ids))
+    followers_stats = crawl_engine.run(followers_endpoint(writer, max_results=1000), user_ids)
+    crawl_engine.close()
+    archive.close()
+crawled = counts(session, TABLES + ("tweets", "followers"))
+resolved = resolve_reference_authors(session)
+graph = load_interaction_graph(session)
+session.close()
+
+# Rebuild the interaction tables from the archive
+archive_results = []
+for workers in (1, args.workers):
+    session = new_session(f"archive-{workers}.db")
+    start = time.perf_counter()
+    rows = backfill_archive(archive_directory, BulkWriter(session), workers)
+    elapsed = time.perf_counter() - start
+    archive_results.append((workers, rows, elapsed, counts(session)))
+    session.close()
+
+# Interactions from the text of stored tweets, users resolved by username
+session = new_session("text.db")
+writer = BulkWriter(session)
+writer.register(User, conflict="nothing")
+writer.register(Tweet, conflict="nothing")
+per_user = 500
+text_users = [3_000_000 + n for n in range(2000)] + [
+    5_000_000 + n for n in range(args.tweets // per_user + 1)
+]
+writer.add_many(User, (user_row(fake_user(user_id)) for user_id in text_users))
+written = 0
+for user_id in text_users[2000:]:
+    for k in range(min(per_user, args.tweets - written)):
+        tweet = fake_tweet(user_id, k, per_user)
+        writer.add(
+            Tweet,
+            {
+                "id": int(tweet["id"]),
+                "text": tweet["text"],
+                "created_at": parse_twitter_time(tweet["created_at"]),
+                "author_id": user_id,
+            },
+        )
+    written = min(written + per_user, args.tweets)
+    writer.flush_if_due()
+writer.flush()
+text_results = []
+for workers in (1, args.workers):
+    session.execute(text("DELETE FROM mentions"))
+    session.execute(text("DELETE FROM hashtags"))
+    session.execute(text("DELETE FROM tweet_references"))
+    session.commit()
+    start = time.perf_counter()
+    rows = backfill_tweets(session, BulkWriter(session), workers)
+    elapsed = time.perf_counter() - start
+    text_results.append((workers, rows, elapsed, counts(session)))
+session.close()
+
+print(f"\n{args.users} users, {os.cpu_count()} CPUs")
+interactions = sum(crawled[table] for table in TABLES)
+print(f"{'crawl':>10} {'requests':>9} {'rows':>9} {'rows/request':>13}")
+print(
+    f"{'timelines':>10} {timeline_stats.requests:>9} {crawled['tweets']:>9} "
+    f"{crawled['tweets'] / timeline_stats.requests:>13.1f} tweets"
+)
+print(
+    f"{'':>10} {'':>9} {interactions:>9} "
+    f"{interactions / timeline_stats.requests:>13.1f} interactions, no extra requests"
+)
+print(
+    f"{'followers':>10} {followers_stats.requests:>9} {crawled['followers']:>9} "
+    f"{crawled['followers'] / followers_stats.requests:>13.1f} follows"
+)
+print(
+    f"interaction graph: {graph.node_count} accounts, {graph.edge_count} weighted edges, "
+    f"{resolved} retweet/quote authors resolved from stored tweets"
+)
+
+print(f"\n{'backfill':>10} {'workers':>8} {'rows':>9} {'time':>7} {'rows/s':>9} {'check':>7}")
+for workers, rows, elapsed, tables in archive_results:
+    check = "ok" if all(tables[table] == crawled[table] for table in TABLES) else "DIFF"
+    print(f"{'archive':>10} {workers:>8} {rows:>9} {elapsed:>6.1f}s {rows / elapsed:>9.0f} {check:>7}")
+for workers, rows, elapsed, tables in text_results:
+    check = "ok" if tables == text_results[0][3] else "DIFF"
+    print(f"{'text':>10} {workers:>8} {rows:>9} {elapsed:>6.1f}s {rows / elapsed:>9.0f} {check:>7}")
@@ -0,0 +1,249 @@
+import argparse
+import os
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+import numpy as np
+import pyarrow.dataset as ds
+from sqlalchemy import create_engine, func, select, text
+from sqlalchemy.orm import sessionmaker
+from models import Base, Tweet
+from partitions import (
+    TWITTER_EPOCH_MS,
+    detach_partitions,
+    month_start,
+    next_month,
+    partition_name,
+    posted_between,
+    read_archive,
+)
+
+# Time window queries over --tweets synthetic tweets spread over --years
+# years in SQLite, stored in random time order as timeline syncs store them
+# (every user's history at once). Every window (per author tweet counts and
+# likes) runs against
+#   heap        the tweets table read in full (NOT INDEXED), the schema before
+#   index       partitions.posted_between() on ix_tweets_created_at
+#   partitions  one table per month, only those overlapping the window read
+#               in full: what PostgreSQL's partition pruning does with its
+#               monthly partitions (SQLite has no partitioning)
+# All three must agree. Then the first --archive-years years are moved to
+# Parquet with detach_partitions(), and a month of them read back with
+# read_archive(), which opens only that month's files, against a filter on
+# created_at alone over the whole archive. PostgreSQL is not measured, there
+# is no server here.
+
+START = datetime(2019, 1, 1)
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--tweets", type=int, default=4_000_000)
+parser.add_argument("--years", type=int, default=5)
+parser.add_argument("--archive-years", type=int, default=2)
+parser.add_argument("--repeat", type=int, default=3)
+parser.add_argument("--seed", type=int, default=1)
+args = parser.parse_args()
+
+END = datetime(START.year + args.years, 1, 1)
+# (name, start, length); windows start mid-month, a week crosses two months
+WINDOWS = [
+    ("day", datetime(2022, 3, 15), timedelta(days=1)),
+    ("week", datetime(2022, 3, 28), timedelta(days=7)),
+    ("month", datetime(2022, 3, 15), timedelta(days=30)),
+    ("quarter", datetime(2022, 2, 15), timedelta(days=91)),
+    ("year", datetime(2021, 7, 1), timedelta(days=365)),
+    ("all", START, END - START),
+]
+AGGREGATE = (
+    "SELECT author_id, COUNT(*), SUM(like_count) FROM {source} "
+    "WHERE created_at >= :start AND created_at < :end GROUP BY author_id"
+)
+
+
+def sqlite_time(moment):
+    return f"{moment:%Y-%m-%d %H:%M:%S}.000000"
+
+
+def generate(connection, rng, chunk=200_000):
+    span = (END - START).total_seconds()
+    epoch = START.replace(tzinfo=timezone.utc).timestamp()
+    cursor = connection.cursor()
+    cursor.executemany(
+        "INSERT INTO users (id) VALUES (?)", [(author,) for author in range(1, 200_001)]
+    )
+    # Random order, ids grown from the time as snowflakes are
+    seconds = rng.uniform(0, span, args.tweets)
+    milliseconds = ((epoch + seconds) * 1000).astype(np.int64)
+    ids = ((milliseconds - TWITTER_EPOCH_MS) << 22) + np.arange(args.tweets) % 4096
+    moments = (milliseconds // 1000).astype("datetime64[s]")
+    authors = rng.integers(1, 200_001, args.tweets)
+    likes = rng.zipf(2.0, args.tweets) - 1
+    for offset in range(0, args.tweets, chunk):
+        part = slice(offset, offset + chunk)
+        created = [
+            moment.replace("T", " ") + ".000000"
+            for moment in np.datetime_as_string(moments[part])
+        ]
+        cursor.executemany(
+            "INSERT INTO tweets (id, text, created_at, author_id, like_count) "
+            "VALUES (?, 'Dnešní #prostreno', ?, ?, ?)",
+            zip(ids[part].tolist(), created, authors[part].tolist(), likes[part].tolist()),
+        )
+        connection.commit()
+
+
+# One table per month, as PostgreSQL lays the partitions out
+def build_partitions(session):
+    months = []
+    month = START
+    while month < END:
+        name = partition_name(month)
+        session.execute(
+            text(
+                f"CREATE TABLE {name} AS SELECT * FROM tweets "
+                "WHERE created_at >= :start AND created_at < :end"
+            ),
+            {"start": sqlite_time(month), "end": sqlite_time(next_month(month))},
+        )
+        months.append(month)
+        month = next_month(month)
+    session.commit()
+    return months
+
+
+def checksum(rows):
+    rows = list(rows)
+    return len(rows), sum(row[1] for row in rows), sum(row[2] or 0 for row in rows)
+
+
+def heap(session, start, end):
+    return checksum(
+        session.execute(
+            text(AGGREGATE.format(source="tweets NOT INDEXED")),
+            {"start": sqlite_time(start), "end": sqlite_time(end)},
+        )
+    )
+
+
+def index(session, start, end):
+    return checksum(
+        session.execute(
+            select(Tweet.author_id, func.count(), func.sum(Tweet.like_count))
+            .where(*posted_between(start, end))
+            .group_by(Tweet.author_id)
+        )
+    )
+
+
+def pruned(session, start, end):
+    months = []
+    month = month_start(start)
+    while month < end:
+        months.append(partition_name(month))
+        month = next_month(month)
+    source = "(" + " UNION ALL ".join(f"SELECT * FROM {name}" for name in months) + ")"
+    return checksum(
+        session.execute(
+            text(AGGREGATE.format(source=source)),
+            {"start": sqlite_time(start), "end": sqlite_time(end)},
+        )
+    ), len(months)
+
+
+def best(function, *arguments):
+    result = None
+    elapsed = None
+    for _ in range(args.repeat):
+        start = time.perf_counter()
+        result = function(*arguments)
+        run = time.perf_counter() - start
+        elapsed = run if elapsed is None else min(elapsed, run)
+    return result, elapsed
+
+
+def archive_unpruned(directory, start, end):
+    dataset = ds.dataset(os.path.join(directory, "tweets"), format="parquet", partitioning="hive")
+    return dataset.to_table(
+        filter=(ds.field("created_at") >= start) & (ds.field("created_at") < end)
+    )
+
+
+rng = np.random.default_rng(args.seed)
+directory = tempfile.mkdtemp()
+path = os.path.join(directory, "tweets.db")
+engine = create_engine(f"sqlite:///{path}")
+Base.metadata.create_all(engine)
+connection = engine.raw_connection()
+start = time.perf_counter()
+generate(connection, rng)
+connection.close()
+generate_time = time.perf_counter() - start
+session = sessionmaker(bind=engine)()
+start = time.perf_counter()
+months = build_partitions(session)
+partition_time = time.perf_counter() - start
+
+results = []
+for name, window_start, length in WINDOWS:
+    window_end = window_start + length
+    heap_sums, heap_time = best(heap, session, window_start, window_end)
+    index_sums, index_time = best(index, session, window_start, window_end)
+    (pruned_sums, scanned), pruned_time = best(pruned, session, window_start, window_end)
+    check = "ok" if heap_sums == index_sums == pruned_sums else "DIFF"
+    results.append(
+        (name, heap_sums[1], heap_time, index_time, pruned_time, scanned, check)
+    )
+database_size = os.path.getsize(path)
+for month in months:
+    session.execute(text(f"DROP TABLE {partition_name(month)}"))
+session.commit()
+
+# Archive the oldest years, then read a month of them back
+archive = os.path.join(directory, "archive")
+before = datetime(START.year + args.archive_years, 1, 1)
+expected = session.execute(
+    select(func.count()).where(*posted_between(START, before))
+).scalar()
+session.close()
+start = time.perf_counter()
+archived = detach_partitions(engine, before, archive)
+detach_time = time.perf_counter() - start
+archive_size = sum(
+    os.path.getsize(os.path.join(parent, name))
+    for parent, _, names in os.walk(archive)
+    for name in names
+)
+archive_results = []
+for name, window_start, length in WINDOWS[:3]:
+    window_start = window_start.replace(year=START.year + 1)
+    window_end = window_start + length
+    table, read_time = best(read_archive, archive, window_start, window_end)
+    unpruned, unpruned_time = best(archive_unpruned, archive, window_start, window_end)
+    check = "ok" if table.num_rows == unpruned.num_rows else "DIFF"
+    archive_results.append((name, table.num_rows, unpruned_time, read_time, check))
+
+print(
+    f"\n{args.tweets} tweets over {args.years} years ({database_size / 2**20:.0f} MB "
+    f"database with the monthly copies, generated in {generate_time:.0f}s, "
+    f"{len(months)} monthly tables built in {partition_time:.0f}s)"
+)
+print(
+    f"{'window':>8} {'tweets':>9} {'heap':>9} {'index':>9} {'partitions':>11} "
+    f"{'scanned':>8} {'vs heap':>8} {'vs index':>9} {'check':>6}"
+)
+for name, tweets, heap_time, index_time, pruned_time, scanned, check in results:
+    print(
+        f"{name:>8} {tweets:>9} {heap_time * 1000:>7.0f}ms {index_time * 1000:>7.0f}ms "
+        f"{pruned_time * 1000:>9.0f}ms {scanned:>8} {heap_time / pruned_time:>7.1f}x "
+        f"{index_time / pruned_time:>8.1f}x {check:>6}"
+    )
+print(
+    f"\narchived {archived} tweets of {args.archive_years} years "
+    f"({'ok' if archived == expected else 'DIFF'}) in {detach_time:.1f}s, "
+    f"{archive_size / 2**20:.0f} MB of Parquet"
+)
+print(f"{'window':>8} {'tweets':>9} {'unpruned':>9} {'read_archive':>13} {'speedup':>8} {'check':>6}")
+for name, tweets, unpruned_time, read_time, check in archive_results:
+    print(
+        f"{name:>8} {tweets:>9} {unpruned_time * 1000:>7.0f}ms {read_time * 1000:>11.0f}ms "
+        f"{unpruned_time / read_time:>7.1f}x {check:>6}"
+    )
@@ -0,0 +1,111 @@
+import argparse
+import time
+import requests
+from crawler import CrawlEngine, Endpoint
+from mock_api import MockTwitterAPI
+from rate_limit import TokenPool
+
+# Benchmark rate-limit handling against the local mock API with per-token
+# windows: the old escalating sleeps versus the header-driven TokenPool, used
+# both serially (as in 1_tweet_grabber.py) and through the async crawl engine.
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--users", type=int, default=40)
+parser.add_argument("--window", type=float, default=3.0)
+args = parser.parse_args()
+
+user_ids = [str(3_000_000 + n * 13) for n in range(args.users)]
+bearer_tokens = ["token-a", "token-b", "token-c"]
+# Every token gets its own window size, like apps on different plans
+token_limits = {
+    "token-a": (15, args.window),
+    "token-b": (5, args.window),
+    "token-c": (30, args.window),
+}
+timeouts = [5, 10, 30, 60, 5 * 60, 10 * 60, 15 * 60]
+
+
+def following_pages(base_url, get_token, report):
+    edges = 0
+    for user_id in user_ids:
+        url = f"{base_url}/2/users/{user_id}/following"
+        params = {"max_results": 100}
+        while True:
+            slot = get_token()
+            headers = {"Authorization": f"Bearer {bearer_tokens[slot]}"}
+            response = requests.get(url, headers=headers, params=params)
+            if report(slot, response):
+                continue
+            data = response.json()
+            edges += len(data.get("data", []))
+            if "next_token" in data.get("meta", {}):
+                params["pagination_token"] = data["meta"]["next_token"]
+            else:
+                break
+    return edges
+
+
+# The loop the grabbers used to carry: switch token and sleep escalating timeouts on 429
+def legacy_crawl(base_url):
+    state = {"token": 0, "timeout": 0, "asleep": 0.0}
+
+    def report(slot, response):
+        if response.status_code != 429:
+            state["timeout"] = 0
+            return False
+        state["token"] = (state["token"] + 1) % len(bearer_tokens)
+        time.sleep(timeouts[state["timeout"]])
+        state["asleep"] += timeouts[state["timeout"]]
+        if state["timeout"] < len(timeouts) - 1:
+            state["timeout"] += 1
+        return True
+
+    edges = following_pages(base_url, lambda: state["token"], report)
+    return edges, state["asleep"]
+
+
+def pool_crawl(base_url):
+    pool = TokenPool(bearer_tokens)
+    endpoint = "/2/users/{key}/following"
+
+    def report(slot, response):
+        pool.update(slot, endpoint, response.status_code, response.headers)
+        return response.status_code == 429
+
+    edges = following_pages(base_url, lambda: pool.acquire(endpoint), report)
+    print(f"Quota: {pool.summary()}")
+    return edges, pool.idle_time
+
+
+def engine_crawl(base_url):
+    edges = []
+    endpoint = Endpoint(
+        "following",
+        "/2/users/{key}/following",
+        {"max_results": 100},
+        lambda key, data: edges.append(len(data.get("data", []))),
+    )
+    crawl_engine = CrawlEngine(base_url, bearer_tokens, progress_every=args.users)
+    stats = crawl_engine.run(endpoint, user_ids)
+    crawl_engine.close()
+    return sum(edges), stats.idle_time
+
+
+results = []
+for name, crawl in (
+    ("escalating sleeps", legacy_crawl),
+    ("token pool", pool_crawl),
+    ("token pool async", engine_crawl),
+):
+    with MockTwitterAPI(token_limits=token_limits) as api:
+        start = time.perf_counter()
+        edges, asleep = crawl(api.base_url)
+        elapsed = time.perf_counter() - start
+        results.append((name, api.request_count, api.rate_limited, edges, asleep, elapsed))
+
+print(f"\nusers: {args.users}, window: {args.window:.0f} s, limits: 15/5/30 per token")
+for name, request_count, rate_limited, edges, asleep, elapsed in results:
+    print(
+        f"{name:>17}: {request_count} requests, {rate_limited} x 429, {edges} edges, "
+        f"{asleep:.1f} s asleep, {elapsed:.1f} s total"
+    )
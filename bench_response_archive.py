@@ -0,0 +1,130 @@
+import argparse
+import os
+import tempfile
+import time
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import sessionmaker
+from models import Base
+from bulk_writer import BulkWriter
+from crawler import CrawlEngine
+from endpoints import following_endpoint, followers_endpoint
+from mock_api import MockTwitterAPI
+from response_archive import ResponseArchive, archive_files, replay
+from timeline_sync import TimelineSyncEndpoint
+
+# Crawl following and followers from the local mock API with the response
+# archive on, and sync every timeline twice, some users posting more than a
+# refresh fetches in between. Then stop the server and rebuild the tables in
+# fresh databases from the archive alone, with one decoding worker and with
+# several. The replayed tables must match the crawled ones row for row, the
+# timeline_sync rows and their gaps included.
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--users", type=int, default=300)
+parser.add_argument("--max-edges", type=int, default=2000)
+parser.add_argument("--latency", type=float, default=0.02)
+parser.add_argument("--workers", type=int, default=4)
+parser.add_argument("--max-bytes", type=int, default=4 * 2**20)
+parser.add_argument("--max-tweets", type=int, default=800)
+args = parser.parse_args()
+
+directory = tempfile.mkdtemp()
+archive_directory = os.path.join(directory, "archive")
+user_ids = [7_000_000 + n * 17 for n in range(args.users)]
+
+
+def new_session(name):
+    engine = create_engine(f"sqlite:///{os.path.join(directory, name)}")
+    Base.metadata.create_all(engine)
+    return sessionmaker(bind=engine)()
+
+
+def table_counts(session):
+    return tuple(
+        session.execute(text(f"SELECT COUNT(*) FROM {table}")).scalar()
+        for table in ("following", "followers", "tweets")
+    )
+
+
+def sync_rows(session):
+    return set(
+        session.execute(
+            text("SELECT user_id, newest_id, gap_since_id, gap_until_id FROM timeline_sync")
+        )
+    )
+
+
+session = new_session("crawled.db")
+writer = BulkWriter(session)
+archive = ResponseArchive(archive_directory, max_bytes=args.max_bytes)
+with MockTwitterAPI(
+    latency=args.latency, max_edges=args.max_edges, max_tweets=args.max_tweets
+) as api:
+    start = time.perf_counter()
+    crawl_engine = CrawlEngine(
+        api.base_url, ["a", "b", "c"], writer=writer, archive=archive,
+        progress_every=args.users,
+    )
+    crawl_engine.run(following_endpoint(writer), user_ids)
+    crawl_engine.run(followers_endpoint(writer), user_ids)
+    timeline = TimelineSyncEndpoint(session, writer)
+    crawl_engine.run(timeline, timeline.prepare(user_ids))
+    for user_id in user_ids[::3]:
+        api.post_tweets(user_id, 5)
+    # More than a capped refresh fetches, the rest is left as a gap
+    for user_id in user_ids[1:6]:
+        api.post_tweets(user_id, 700)
+    timeline = TimelineSyncEndpoint(session, writer)
+    crawl_engine.run(timeline, timeline.prepare(user_ids))
+    crawl_engine.close()
+    crawl_time = time.perf_counter() - start
+    api_requests = api.request_count
+archive.close()
+crawled = table_counts(session)
+crawled_syncs = sync_rows(session)
+
+archive_size = sum(
+    os.path.getsize(path) for path in archive_files(archive_directory)
+)
+results = [("crawl", crawl_time, api_requests, crawled)]
+syncs_match = True
+for workers in (1, args.workers):
+    session = new_session(f"replayed_{workers}.db")
+    writer = BulkWriter(session)
+    start = time.perf_counter()
+    replay(
+        archive_directory,
+        [
+            following_endpoint(writer),
+            followers_endpoint(writer),
+            TimelineSyncEndpoint(session, writer),
+        ],
+        writer=writer,
+        workers=workers,
+    )
+    results.append(
+        (f"replay, {workers} workers", time.perf_counter() - start, 0, table_counts(session))
+    )
+    syncs_match = syncs_match and sync_rows(session) == crawled_syncs
+
+print(
+    f"\n{archive.records} responses archived in {len(archive_files(archive_directory))} "
+    f"files, {archive_size / 2**20:.1f} MB compressed"
+)
+print(
+    f"{'run':>20} {'time':>8} {'API requests':>13} {'following':>10} {'followers':>10} "
+    f"{'tweets':>8}"
+)
+for name, elapsed, requests_made, (following, followers, tweets) in results:
+    print(
+        f"{name:>20} {elapsed:>7.2f}s {requests_made:>13} {following:>10} {followers:>10} "
+        f"{tweets:>8}"
+    )
+print(
+    f"{len(crawled_syncs)} timeline_sync rows, "
+    f"{sum(row[3] is not None for row in crawled_syncs)} with a gap"
+)
+print(
+    "replayed tables match:",
+    all(result[3] == crawled for result in results) and syncs_match,
+)
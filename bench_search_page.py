@@ -0,0 +1,106 @@
+import argparse
+import time
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import sessionmaker
+from models import Base, Tweet, User
+from bulk_writer import BulkWriter
+from mock_api import fake_search_tweet, fake_user
+from tweet_search import SearchEndpoint, search_page_rows
+from user_hydration import parse_twitter_time
+
+# Micro-benchmark of search page processing on synthetic 500-tweet pages: the
+# linear author scan 1_tweet_grabber.py used to do for every tweet, against
+# search_page_rows() which indexes includes.users once per page. Only the page
+# processing is timed, then the rows of both are written to check them.
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--pages", type=int, default=200)
+parser.add_argument("--authors", type=int, default=400, help="distinct authors per page")
+args = parser.parse_args()
+
+
+def synthetic_page(number):
+    tweets = []
+    for j in range(500):
+        tweet = fake_search_tweet(number, j, 500)
+        tweet["author_id"] = str(3_000_000 + (number * 131 + j * 17) % args.authors)
+        tweets.append(tweet)
+    authors = sorted({tweet["author_id"] for tweet in tweets})
+    return {
+        "data": tweets,
+        "includes": {"users": [fake_user(author_id) for author_id in authors]},
+    }
+
+
+# The loop 1_tweet_grabber.py used before the author map
+def linear_page(writer, data):
+    for tweet in data["data"]:
+        user = next(
+            (u for u in data["includes"]["users"] if u["id"] == tweet["author_id"]),
+            None,
+        )
+        writer.add(
+            User,
+            {"id": tweet["author_id"], "username": user["username"] if user else None},
+        )
+        writer.add(
+            Tweet,
+            {
+                "id": tweet["id"],
+                "text": tweet["text"],
+                "created_at": parse_twitter_time(tweet["created_at"]),
+                "author_id": tweet["author_id"],
+                "author_username": user["username"] if user else None,
+                "conversation_id": tweet["conversation_id"],
+                "retweet_count": tweet["public_metrics"]["retweet_count"],
+                "reply_count": tweet["public_metrics"]["reply_count"],
+                "like_count": tweet["public_metrics"]["like_count"],
+                "quote_count": tweet["public_metrics"]["quote_count"],
+            },
+        )
+
+
+def new_writer():
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine)
+    return BulkWriter(sessionmaker(bind=engine)(), max_rows=10**9)
+
+
+pages = [synthetic_page(400_000 + n) for n in range(args.pages)]
+
+linear_writer = new_writer()
+linear_writer.register(User, conflict="nothing")
+linear_writer.register(Tweet, conflict="update", update=["like_count"])
+start = time.perf_counter()
+for page in pages:
+    linear_page(linear_writer, page)
+linear_time = time.perf_counter() - start
+
+map_writer = new_writer()
+# Registers the same conflict handling the grabber uses
+SearchEndpoint(map_writer, "prostreno", [])
+start = time.perf_counter()
+for page in pages:
+    authors, tweets = search_page_rows(page)
+    map_writer.add_many(User, authors)
+    map_writer.add_many(Tweet, tweets)
+map_time = time.perf_counter() - start
+
+results = []
+for name, writer, elapsed in (
+    ("linear scan", linear_writer, linear_time),
+    ("author map", map_writer, map_time),
+):
+    writer.flush()
+    hydrated = writer.session.execute(
+        text("SELECT COUNT(*) FROM users WHERE created_at IS NOT NULL")
+    ).scalar()
+    tweets = writer.session.execute(text("SELECT COUNT(*) FROM tweets")).scalar()
+    results.append((name, elapsed, tweets, hydrated))
+
+print(f"{args.pages} pages of 500 tweets, {args.authors} distinct authors per page")
+print(f"{'mode':>12} {'per page':>10} {'tweets':>7} {'hydrated authors':>17}")
+for name, elapsed, tweets, hydrated in results:
+    print(
+        f"{name:>12} {elapsed / args.pages * 1000:>7.2f} ms {tweets:>7} {hydrated:>17}"
+    )
@@ -0,0 +1,159 @@
+import argparse
+import csv
+import os
+import tempfile
+import time
+from datetime import datetime, timedelta
+import pyarrow.csv as pa_csv
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import sessionmaker
+from models import Base, Tweet, Following
+from snapshot import IPC_CACHE, export_snapshot, open_table, read_table
+
+# Export and reload of the tweets and following tables: CSV dumps, as the
+# analysis runs used to get them, against a Parquet snapshot from snapshot.py.
+# CSV is reloaded with the csv module and with Arrow's multithreaded reader;
+# the snapshot with read_table() and with the memory-mapped Arrow IPC copy
+# from open_table(). An incremental snapshot after new tweets is timed too.
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--tweets", type=int, default=1_000_000)
+parser.add_argument("--edges", type=int, default=2_000_000)
+args = parser.parse_args()
+
+directory = tempfile.mkdtemp()
+engine = create_engine(f"sqlite:///{os.path.join(directory, 'bench.db')}")
+Base.metadata.create_all(engine)
+
+
+def tweet_rows(start, count):
+    first_day = datetime(2023, 1, 1)
+    for n in range(start, start + count):
+        yield {
+            "id": 1_640_000_000_000_000_000 + n * 4099,
+            "text": f"Dnešní Prostřeno bylo skvělé, tweet číslo {n} #prostreno",
+            "created_at": first_day + timedelta(minutes=n // 4),
+            "author_id": 3_000_000 + n % 50_000,
+            "author_username": f"user{n % 50_000}",
+            "conversation_id": 1_640_000_000_000_000_000 + (n - n % 5) * 4099,
+            "retweet_count": n % 7,
+            "reply_count": n % 3,
+            "like_count": n % 50,
+            "quote_count": n % 2,
+        }
+
+
+def insert_tweets(start, count):
+    with engine.begin() as connection:
+        for offset in range(start, start + count, 200_000):
+            connection.execute(
+                Tweet.__table__.insert(),
+                list(tweet_rows(offset, min(200_000, start + count - offset))),
+            )
+
+
+insert_tweets(0, args.tweets)
+with engine.begin() as connection:
+    for offset in range(0, args.edges, 500_000):
+        connection.execute(
+            Following.__table__.insert(),
+            [
+                {"user_id": 3_000_000 + n % 50_000, "following_id": 9_000_000 + n}
+                for n in range(offset, min(offset + 500_000, args.edges))
+            ],
+        )
+
+session = sessionmaker(bind=engine)()
+results = []
+
+
+def timed(name, function):
+    start = time.perf_counter()
+    value = function()
+    results.append((name, time.perf_counter() - start))
+    return value
+
+
+def directory_size(path, skip=None):
+    return sum(
+        os.path.getsize(os.path.join(root, name))
+        for root, _, names in os.walk(path)
+        for name in names
+        if skip is None or skip not in root
+    )
+
+
+# CSV dumps
+csv_directory = os.path.join(directory, "csv")
+os.makedirs(csv_directory)
+
+
+def export_csv():
+    for table in ("tweets", "following"):
+        result = session.execute(text(f"SELECT * FROM {table}"))
+        with open(os.path.join(csv_directory, f"{table}.csv"), "w", newline="") as output:
+            writer = csv.writer(output)
+            writer.writerow(result.keys())
+            writer.writerows(result)
+
+
+def reload_csv_module():
+    rows = 0
+    for table in ("tweets", "following"):
+        with open(os.path.join(csv_directory, f"{table}.csv"), newline="") as source:
+            reader = csv.reader(source)
+            header = next(reader)
+            columns = [[] for _ in header]
+            for row in reader:
+                for column, value in zip(columns, row):
+                    column.append(value)
+            rows += len(columns[0])
+    return rows
+
+
+def reload_csv_arrow():
+    return sum(
+        pa_csv.read_csv(os.path.join(csv_directory, f"{table}.csv")).num_rows
+        for table in ("tweets", "following")
+    )
+
+
+timed("export CSV", export_csv)
+timed("reload CSV (csv module)", reload_csv_module)
+timed("reload CSV (Arrow)", reload_csv_arrow)
+
+# Parquet snapshot
+snapshot_directory = os.path.join(directory, "snapshot")
+timed("export snapshot", lambda: export_snapshot(session, snapshot_directory))
+timed(
+    "reload snapshot (Parquet)",
+    lambda: sum(
+        read_table(snapshot_directory, table).num_rows for table in ("tweets", "following")
+    ),
+)
+timed(
+    "first open_table (writes IPC)",
+    lambda: [open_table(snapshot_directory, table) for table in ("tweets", "following")],
+)
+tables = timed(
+    "reload snapshot (IPC mmap)",
+    lambda: [open_table(snapshot_directory, table) for table in ("tweets", "following")],
+)
+reloaded = sum(table.num_rows for table in tables)
+
+# Incremental snapshot after 1% new tweets
+insert_tweets(args.tweets, args.tweets // 100)
+timed(
+    "incremental snapshot (+1%)",
+    lambda: export_snapshot(session, snapshot_directory, incremental=True),
+)
+
+print(f"\n{args.tweets} tweets, {args.edges} edges, {reloaded} rows reloaded")
+print(
+    f"CSV {directory_size(csv_directory) / 2**20:.0f} MB, "
+    f"Parquet {directory_size(snapshot_directory, skip=IPC_CACHE) / 2**20:.0f} MB, "
+    f"IPC copy {directory_size(os.path.join(snapshot_directory, IPC_CACHE)) / 2**20:.0f} MB"
+)
+print(f"{'step':>30} {'time':>8}")
+for name, elapsed in results:
+    print(f"{name:>30} {elapsed:>7.2f}s")
@@ -0,0 +1,131 @@
+import argparse
+import os
+import tempfile
+import time
+from datetime import datetime
+from sqlalchemy import create_engine, func
+from sqlalchemy.orm import sessionmaker
+from models import Base, User, Tweet, Following, Follower
+from bulk_writer import BulkWriter
+from crawler import CrawlEngine
+from endpoints import following_endpoint, followers_endpoint
+from mock_api import MockTwitterAPI
+from snowball import Snowball, page_cost, topical_counts
+from user_hydration import user_row
+
+# The same request budget spent two ways against the local mock API:
+#   uniform   what 4_user_following_grabber.py and 5_user_followers_grabber.py
+#             do, every stored user in primary key order with 100 edges per
+#             page and no cap, until the budget is used up
+#   snowball  snowball.py from the authors of topical tweets
+# The database holds topical authors, a few of them hub accounts with
+# hundreds of thousands of followers, and many users from earlier crawls that
+# have nothing to do with the show. Coverage is measured as the topical tweets
+# whose authors had their edges crawled.
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--authors", type=int, default=400)
+parser.add_argument("--other-users", type=int, default=3000)
+parser.add_argument("--hubs", type=int, default=8)
+parser.add_argument("--hub-followers", type=int, default=250_000)
+parser.add_argument("--budget", type=int, default=1500)
+parser.add_argument("--latency", type=float, default=0.01)
+args = parser.parse_args()
+
+author_ids = [3_000_000 + n * 17 for n in range(args.authors)]
+other_ids = [1_000_000 + n * 2999 for n in range(args.other_users)]
+hubs = {author_ids[n * (args.authors // args.hubs)]: args.hub_followers for n in range(args.hubs)}
+
+
+def new_session(api):
+    path = os.path.join(tempfile.mkdtemp(), "snowball.db")
+    engine = create_engine(f"sqlite:///{path}")
+    Base.metadata.create_all(engine)
+    session = sessionmaker(bind=engine)()
+    writer = BulkWriter(session)
+    writer.register(User, conflict="nothing")
+    writer.register(Tweet, conflict="nothing")
+    writer.add_many(User, (user_row(api._user(user_id)) for user_id in author_ids + other_ids))
+    # A long tail of topical tweets per author, hubs tweet about the show rarely
+    for n, author_id in enumerate(author_ids):
+        topical = 1 if author_id in hubs else 1 + 40 // (1 + n % 23)
+        writer.add_many(
+            Tweet,
+            (
+                {
+                    "id": author_id * 1000 + k,
+                    "text": f"Dnešní #prostreno {k}",
+                    "created_at": datetime(2023, 4, 1 + k % 28),
+                    "author_id": author_id,
+                }
+                for k in range(topical)
+            ),
+        )
+    writer.flush()
+    return session
+
+
+def coverage(session, expanded):
+    topical = topical_counts(session)
+    covered = sum(topical.get(user_id, 0) for user_id in expanded)
+    edges = session.query(func.count()).select_from(Following).scalar()
+    edges += session.query(func.count()).select_from(Follower).scalar()
+    return covered, sum(topical.values()), edges
+
+
+results = []
+with MockTwitterAPI(latency=args.latency, max_edges=args.hub_followers, hubs=hubs) as api:
+    tokens = ["token0", "token1", "token2"]
+
+    # Uniform: the users the old grabbers get through before the budget runs out
+    session = new_session(api)
+    keys = []
+    cost = 0
+    for user in session.query(User).order_by(User.id):
+        user_cost = page_cost(user.following_count, 100, None) + page_cost(
+            user.followers_count, 100, None
+        )
+        if cost + user_cost > args.budget:
+            break
+        keys.append(user.id)
+        cost += user_cost
+    writer = BulkWriter(session)
+    crawl_engine = CrawlEngine(api.base_url, tokens, writer=writer, progress_every=10**6)
+    start = time.perf_counter()
+    requests_used = 0
+    for endpoint in (following_endpoint(writer), followers_endpoint(writer)):
+        requests_used += crawl_engine.run(endpoint, keys).requests
+    crawl_engine.close()
+    elapsed = time.perf_counter() - start
+    results.append(("uniform", requests_used, len(keys), *coverage(session, keys), elapsed))
+
+    # Snowball from the topical authors
+    session = new_session(api)
+    snowball = Snowball(session, api.base_url, tokens, budget=args.budget)
+    snowball.crawl_engine.progress_every = 10**6
+    start = time.perf_counter()
+    snowball.run()
+    elapsed = time.perf_counter() - start
+    results.append(
+        (
+            "snowball",
+            snowball.requests,
+            len(snowball.expanded),
+            *coverage(session, snowball.expanded),
+            elapsed,
+        )
+    )
+
+print(
+    f"\n{args.authors} topical authors ({args.hubs} hubs with {args.hub_followers} followers), "
+    f"{args.other_users} other users, budget {args.budget} requests"
+)
+print(
+    f"{'crawl':>10} {'requests':>9} {'expanded':>9} {'topical covered':>16} "
+    f"{'edges':>9} {'time':>7}"
+)
+for name, requests_used, expanded, covered, total, edges, elapsed in results:
+    print(
+        f"{name:>10} {requests_used:>9} {expanded:>9} "
+        f"{covered:>7} ({covered / total:>5.1%}) {edges:>9} {elapsed:>6.1f}s"
+    )
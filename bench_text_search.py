@@ -0,0 +1,198 @@
+import argparse
+import os
+import random
+import tempfile
+import time
+from datetime import datetime, timedelta
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import sessionmaker
+from models import Base
+from text_search import TextIndex, normalize
+
+# Diacritic-insensitive text search over --tweets synthetic Czech tweets in
+# SQLite, spread over three years, a few percent of them naming the show in
+# one of its spellings. Every query runs as
+#   variants     LIKE over text with the hand-written spellings, as the search
+#                query of the crawl lists them (SQLite's LIKE folds ASCII
+#                case only, like ILIKE it misses nothing else)
+#   search_text  LIKE over the folded column, a sequential scan
+#   TextIndex    text_search.TextIndex, built once and saved
+# The folded scan and the index must find the same tweets, the variants count
+# what hand-written spellings miss. PostgreSQL's GIN index is not measured,
+# there is no server here.
+
+SHOW = [
+    "Prostřeno", "prostřeno", "PROSTŘENO", "ProstŘeno",
+    "Prostreno", "prostreno", "PROSTRENO",
+]
+WORDS = (
+    "dnes dnešní večer kuchař kuchařka jídlo polévka předkrm dezert hostitel hosté "
+    "body soutěž vítěz Ostrava Brno Praha Plzeň Olomouc žluťoučký kůň úžasný hrozný "
+    "výborný večeře chuť talíř stůl víno pivo knedlík omáčka řízek guláš svíčková "
+    "díl epizoda televize Prima pořad moderátor komentář sleduju viděl jsem to je "
+    "fakt super hrůza smích nejlepší nejhorší znovu zítra týden finále"
+).split()
+VARIANTS = [
+    "prostřeno", "prostreno", "Prostřeno", "Prostreno",
+    "#prostřeno", "#prostreno", "#Prostřeno", "#Prostreno",
+]
+START = datetime(2021, 1, 1)
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--tweets", type=int, default=3_000_000)
+parser.add_argument("--show-share", type=float, default=0.03)
+parser.add_argument("--repeat", type=int, default=3)
+parser.add_argument("--seed", type=int, default=1)
+args = parser.parse_args()
+
+random.seed(args.seed)
+# A long tail of rarer and rarer words on top of the common ones, like real
+# vocabularies
+rare = [f"slovo{n}" for n in range(200_000)]
+
+
+def fake_text():
+    words = random.choices(WORDS, k=random.randint(5, 14))
+    if random.random() < 0.3:
+        words[random.randrange(len(words))] = rare[int(len(rare) * random.random() ** 3)]
+    if random.random() < args.show_share:
+        show = random.choice(SHOW)
+        kind = random.random()
+        if kind < 0.3:
+            words.append("#" + show)
+        elif kind < 0.5:
+            words[:0] = [random.choice(["Dnešní", "dnešní", "DNESNI", "dnesni"]), show]
+        else:
+            words.insert(random.randrange(len(words) + 1), show)
+    return " ".join(words)
+
+
+def generate(session):
+    connection = session.connection().connection
+    cursor = connection.cursor()
+    seconds = 3 * 365 * 86400
+    step = seconds / args.tweets
+    batch = []
+    for n in range(args.tweets):
+        tweet_text = fake_text()
+        created_at = START + timedelta(seconds=int(n * step))
+        batch.append(
+            (
+                10**18 + n * 1000,
+                tweet_text,
+                normalize(tweet_text),
+                f"{created_at:%Y-%m-%d %H:%M:%S}.000000",
+            )
+        )
+        if len(batch) == 100_000:
+            cursor.executemany(
+                "INSERT INTO tweets (id, text, search_text, created_at) VALUES (?, ?, ?, ?)", batch
+            )
+            batch = []
+    if batch:
+        cursor.executemany(
+            "INSERT INTO tweets (id, text, search_text, created_at) VALUES (?, ?, ?, ?)", batch
+        )
+    connection.commit()
+
+
+def best(function):
+    result = None
+    elapsed = None
+    for _ in range(args.repeat):
+        start = time.perf_counter()
+        result = function()
+        run = time.perf_counter() - start
+        elapsed = run if elapsed is None else min(elapsed, run)
+    return result, elapsed
+
+
+def scan(session, condition, start=None, end=None):
+    parameters = {}
+    if start is not None:
+        condition += " AND created_at >= :start AND created_at < :end"
+        parameters = {"start": f"{start:%Y-%m-%d %H:%M:%S}", "end": f"{end:%Y-%m-%d %H:%M:%S}"}
+    return session.execute(
+        text(f"SELECT id FROM tweets WHERE {condition} ORDER BY created_at, id"), parameters
+    ).scalars().all()
+
+
+def like_any(column, patterns):
+    return "(" + " OR ".join(f"{column} LIKE '{pattern}'" for pattern in patterns) + ")"
+
+
+month = (datetime(2023, 3, 1), datetime(2023, 4, 1))
+SHOW_VARIANTS = [f"%{variant}%" for variant in VARIANTS]
+# name, index query, LIKE over search_text, LIKE over text, time range. A
+# hashtag counts as a word of a phrase, as in the index.
+WORD = like_any("search_text", ["%prostreno%"])
+WORD_VARIANTS = like_any("text", SHOW_VARIANTS[:4])
+RARE = ["% slovo1234 %", "slovo1234 %", "% slovo1234"]
+QUERIES = [
+    ("word", "prostreno", WORD, WORD_VARIANTS, None),
+    ("word, month", "prostreno", WORD, WORD_VARIANTS, month),
+    (
+        "phrase",
+        '"dnešní prostřeno"',
+        like_any("search_text", ["%dnesni prostreno%", "%dnesni #prostreno%"]),
+        like_any(
+            "text",
+            [f"%{first} {show}%" for first in ("dnešní", "Dnešní") for show in VARIANTS],
+        ),
+        None,
+    ),
+    (
+        "hashtag",
+        "#prostreno",
+        like_any("search_text", ["%#prostreno%"]),
+        like_any("text", SHOW_VARIANTS[4:]),
+        None,
+    ),
+    ("rare word", "slovo1234", like_any("search_text", RARE), like_any("text", RARE), None),
+]
+
+directory = tempfile.mkdtemp()
+engine = create_engine(f"sqlite:///{os.path.join(directory, 'search.db')}")
+Base.metadata.create_all(engine)
+session = sessionmaker(bind=engine)()
+start = time.perf_counter()
+generate(session)
+generate_time = time.perf_counter() - start
+
+start = time.perf_counter()
+index = TextIndex.from_session(session)
+build_time = time.perf_counter() - start
+path = os.path.join(directory, "text_index.npz")
+index.save(path)
+start = time.perf_counter()
+index = TextIndex.load(path)
+load_time = time.perf_counter() - start
+
+results = []
+for name, query, folded, variants, window in QUERIES:
+    window = window or (None, None)
+    expected, folded_time = best(lambda: scan(session, folded, *window))
+    found, index_time = best(lambda: index.search(query, *window))
+    matched, variants_time = best(lambda: scan(session, variants, *window))
+    check = "ok" if found == expected else "DIFF"
+    missed = len(set(expected) - set(matched))
+    results.append((name, len(expected), variants_time, missed, folded_time, index_time, check))
+session.close()
+
+database_size = os.path.getsize(os.path.join(directory, "search.db"))
+print(
+    f"\n{args.tweets} tweets ({database_size / 2**20:.0f} MB database, generated in "
+    f"{generate_time:.0f}s), index of {len(index.vocabulary)} words: "
+    f"built in {build_time:.1f}s, {os.path.getsize(path) / 2**20:.0f} MB on disk, "
+    f"loaded in {load_time:.2f}s"
+)
+print(
+    f"{'query':>12} {'tweets':>8} {'variants':>10} {'missed':>7} {'search_text':>12} "
+    f"{'TextIndex':>10} {'speedup':>8} {'check':>6}"
+)
+for name, count, variants_time, missed, folded_time, index_time, check in results:
+    print(
+        f"{name:>12} {count:>8} {variants_time * 1000:>8.0f}ms {missed:>7} "
+        f"{folded_time * 1000:>10.0f}ms {index_time * 1000:>8.1f}ms "
+        f"{folded_time / index_time:>7.0f}x {check:>6}"
+    )
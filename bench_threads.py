@@ -0,0 +1,290 @@
+import argparse
+import os
+import tempfile
+import time
+from datetime import datetime, timezone
+import numpy as np
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import sessionmaker
+from models import Base, Thread
+from bulk_writer import BulkWriter
+from thread_index import build_threads, load_thread, rebuild_threads
+
+# Thread statistics over a synthetic tweets table in SQLite, with the schema
+# before and after the conversation index:
+#   generate  --tweets tweets in conversations of heavy-tailed size, every
+#             reply linked to an earlier tweet of its conversation through
+#             tweet_references, ids growing with time. A --missing share of
+#             the replies is not stored, as the search only stores tweets
+#             matching the query; replies to them are still stored.
+#   full      statistics of every conversation with one recursive query over
+#             the whole table, against thread_index.rebuild_threads() along
+#             ix_tweets_conversation_id_id, with the stored tweets each one
+#             reaches; with --missing 0 both must agree
+#   lookup    --lookups conversations (picked by tweet, so large threads come
+#             up often): their tweets by conversation_id without the index,
+#             the reply tree with a recursive query from the root and with
+#             load_thread(), the statistics with a recursive query and from
+#             the threads table
+#   update    --new-replies replies to random stored tweets, the queued
+#             conversations rebuilt by build_threads() against a full
+#             rebuild; both must agree
+
+EPOCH = datetime(2021, 1, 1, tzinfo=timezone.utc).timestamp()
+BASE_ID = 1_350_000_000_000_000_000
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--tweets", type=int, default=10_000_000)
+parser.add_argument("--lookups", type=int, default=50)
+parser.add_argument("--new-replies", type=int, default=100_000)
+parser.add_argument("--missing", type=float, default=0.05, help="share of replies not stored")
+parser.add_argument("--seed", type=int, default=1)
+args = parser.parse_args()
+
+RECURSIVE_TREE = """
+WITH RECURSIVE tree(conversation_id, id, author_id, created_at, depth) AS (
+    SELECT conversation_id, id, author_id, created_at, 0 FROM tweets WHERE {roots}
+    UNION ALL
+    SELECT tree.conversation_id, tweets.id, tweets.author_id, tweets.created_at, tree.depth + 1
+    FROM tree
+    JOIN tweet_references ON tweet_references.referenced_id = tree.id
+        AND tweet_references.kind = 'replied_to'
+    JOIN tweets ON tweets.id = tweet_references.tweet_id
+)
+"""
+
+# Statistics per conversation from the recursive tree, in the threads columns
+RECURSIVE_STATS = """
+SELECT tree.conversation_id, COUNT(*) AS tweets, MAX(depth) AS depth,
+    COALESCE(MAX(widths.breadth), 0) AS breadth,
+    COUNT(DISTINCT author_id) AS participants
+FROM tree LEFT JOIN (
+    SELECT conversation_id, MAX(width) AS breadth FROM (
+        SELECT conversation_id, depth, COUNT(*) AS width
+        FROM tree WHERE depth > 0 GROUP BY conversation_id, depth
+    ) GROUP BY conversation_id
+) AS widths ON widths.conversation_id = tree.conversation_id
+GROUP BY tree.conversation_id
+"""
+
+CHECKSUM = (
+    "SELECT COUNT(*), SUM(tweets), SUM(depth), SUM(breadth), SUM(participants) FROM {table}"
+)
+
+
+def sqlite_times(seconds):
+    moments = (EPOCH + seconds).astype("datetime64[s]")
+    return [moment.replace("T", " ") + ".000000" for moment in np.datetime_as_string(moments)]
+
+
+# Conversations of heavy-tailed size, replies spread over the hours after the
+# root, each one replying to an earlier tweet of its conversation, mostly
+# close to the root. Returns the stored tweets as arrays in id order.
+def generate(count, missing, rng):
+    sizes = []
+    total = 0
+    while total < count:
+        chunk = np.minimum(rng.zipf(2.2, 100_000), 20_000)
+        sizes.append(chunk)
+        total += int(chunk.sum())
+    sizes = np.concatenate(sizes)
+    sizes = sizes[: np.searchsorted(np.cumsum(sizes), count) + 1]
+    sizes[-1] -= int(sizes.sum()) - count
+    conversation = np.repeat(np.arange(len(sizes)), sizes)
+    first = np.cumsum(sizes) - sizes
+    position = np.arange(count) - first[conversation]
+    gaps = rng.exponential(600.0, count)
+    gaps[position == 0] = 0
+    elapsed = np.cumsum(gaps)
+    seconds = (
+        rng.uniform(0, 2 * 365 * 86400, len(sizes))[conversation]
+        + elapsed
+        - elapsed[first[conversation]]
+    )
+    parent = first[conversation] + (position * rng.random(count) ** 3).astype(np.int64)
+    order = np.argsort(seconds, kind="stable")
+    ids = np.empty(count, dtype=np.int64)
+    ids[order] = BASE_ID + np.arange(count, dtype=np.int64) * 1000
+    authors = rng.integers(10_000_000, 10_200_000, count)
+    stored = order[((position == 0) | (rng.random(count) >= missing))[order]]
+    return {
+        "id": ids[stored],
+        "conversation_id": ids[first[conversation]][stored],
+        "author_id": authors[stored],
+        "seconds": seconds[stored],
+        "parent_id": np.where(position > 0, ids[parent], -1)[stored],
+        "parent_author_id": authors[parent][stored],
+    }
+
+
+def insert(connection, tweets, chunk=200_000):
+    cursor = connection.cursor()
+    for start in range(0, len(tweets["id"]), chunk):
+        part = {name: values[start : start + chunk] for name, values in tweets.items()}
+        ids = part["id"].tolist()
+        conversation_ids = part["conversation_id"].tolist()
+        authors = part["author_id"].tolist()
+        cursor.executemany(
+            "INSERT INTO tweets (id, created_at, author_id, conversation_id) VALUES (?, ?, ?, ?)",
+            zip(ids, sqlite_times(part["seconds"]), authors, conversation_ids),
+        )
+        replies = part["parent_id"] >= 0
+        cursor.executemany(
+            "INSERT INTO tweet_references (tweet_id, kind, referenced_id, author_id, "
+            "referenced_author_id) VALUES (?, 'replied_to', ?, ?, ?)",
+            zip(
+                part["id"][replies].tolist(),
+                part["parent_id"][replies].tolist(),
+                part["author_id"][replies].tolist(),
+                part["parent_author_id"][replies].tolist(),
+            ),
+        )
+        connection.commit()
+
+
+def timed(function, *arguments):
+    start = time.perf_counter()
+    result = function(*arguments)
+    return result, time.perf_counter() - start
+
+
+def checksum(session, table):
+    return tuple(session.execute(text(CHECKSUM.format(table=table))).one())
+
+
+def recursive_stats(session):
+    session.execute(text("DROP TABLE IF EXISTS recursive_threads"))
+    session.execute(
+        text(
+            "CREATE TEMP TABLE recursive_threads AS "
+            + RECURSIVE_TREE.format(roots="id = conversation_id")
+            + RECURSIVE_STATS
+        )
+    )
+    session.commit()
+    return checksum(session, "recursive_threads")
+
+
+def lookup_unindexed(session, conversation_id):
+    return session.execute(
+        text("SELECT id FROM tweets WHERE conversation_id = :id"), {"id": conversation_id}
+    ).all()
+
+
+def lookup_recursive(session, conversation_id):
+    return session.execute(
+        text(RECURSIVE_TREE.format(roots="id = :id") + "SELECT * FROM tree"),
+        {"id": conversation_id},
+    ).all()
+
+
+def lookup_recursive_stats(session, conversation_id):
+    return session.execute(
+        text(RECURSIVE_TREE.format(roots="id = :id") + RECURSIVE_STATS),
+        {"id": conversation_id},
+    ).all()
+
+
+def lookup_stored_stats(session, conversation_id):
+    return session.execute(
+        text("SELECT * FROM threads WHERE conversation_id = :id"), {"id": conversation_id}
+    ).all()
+
+
+def lookups(session, function, conversation_ids):
+    start = time.perf_counter()
+    for conversation_id in conversation_ids:
+        function(session, conversation_id)
+    session.commit()
+    return (time.perf_counter() - start) / len(conversation_ids)
+
+
+rng = np.random.default_rng(args.seed)
+directory = tempfile.mkdtemp()
+engine = create_engine(f"sqlite:///{os.path.join(directory, 'threads.db')}")
+Base.metadata.create_all(engine)
+session = sessionmaker(bind=engine)()
+
+# The schema before: no index on conversation_id
+session.execute(text("DROP INDEX ix_tweets_conversation_id_id"))
+session.commit()
+tweets, generate_time = timed(generate, args.tweets, args.missing, rng)
+stored = len(tweets["id"])
+connection = engine.raw_connection()
+_, insert_time = timed(insert, connection, tweets)
+sample = rng.choice(tweets["conversation_id"], args.lookups).tolist()
+
+expected, recursive_time = timed(recursive_stats, session)
+unindexed_time = lookups(session, lookup_unindexed, sample)
+recursive_lookup_time = lookups(session, lookup_recursive, sample)
+recursive_stats_time = lookups(session, lookup_recursive_stats, sample)
+
+_, index_time = timed(
+    session.execute,
+    text("CREATE INDEX ix_tweets_conversation_id_id ON tweets (conversation_id, id)"),
+)
+session.commit()
+writer = BulkWriter(session)
+_, rebuild_time = timed(rebuild_threads, session, writer)
+rebuilt = checksum(session, "threads")
+load_thread_time = lookups(session, load_thread, sample)
+stored_stats_time = lookups(session, lookup_stored_stats, sample)
+largest = session.query(Thread.tweets, Thread.depth).order_by(Thread.tweets.desc()).first()
+
+# New replies to random stored tweets, queued as the endpoints queue them
+parents = rng.integers(0, stored, args.new_replies)
+new = {
+    "id": tweets["id"][-1] + 1000 * np.arange(1, args.new_replies + 1, dtype=np.int64),
+    "conversation_id": tweets["conversation_id"][parents],
+    "author_id": rng.integers(10_000_000, 10_200_000, args.new_replies),
+    "seconds": tweets["seconds"][-1] + np.sort(rng.uniform(0, 86400, args.new_replies)),
+    "parent_id": tweets["id"][parents],
+    "parent_author_id": tweets["author_id"][parents],
+}
+insert(connection, new)
+marked_at = datetime.now(timezone.utc).replace(tzinfo=None).isoformat(" ")
+connection.cursor().executemany(
+    "INSERT INTO thread_updates (conversation_id, marked_at) VALUES (?, ?)",
+    [(conversation_id, marked_at) for conversation_id in np.unique(new["conversation_id"]).tolist()],
+)
+connection.commit()
+connection.close()
+updated, update_time = timed(build_threads, session, writer)
+incremental = checksum(session, "threads")
+left = session.execute(text("SELECT COUNT(*) FROM thread_updates")).scalar()
+_, full_update_time = timed(rebuild_threads, session, writer)
+full = checksum(session, "threads")
+session.close()
+
+print(
+    f"\n{stored} tweets stored of {args.tweets} ({args.missing:.0%} of the replies missing), "
+    f"{rebuilt[0]} conversations, largest {largest.tweets} tweets and {largest.depth} deep "
+    f"(inserted in {insert_time:.0f}s, conversation index built in {index_time:.0f}s)"
+)
+print(f"{'full':>8} {'method':>24} {'time':>8} {'threads':>9} {'tweets':>9} {'check':>12}")
+for method, elapsed, sums in (
+    ("recursive query", recursive_time, expected),
+    ("rebuild_threads", rebuild_time, rebuilt),
+):
+    if sums[1] < stored:
+        check = f"{stored - sums[1]} lost"
+    else:
+        check = "ok" if args.missing or rebuilt == expected else "DIFF"
+    print(f"{'':>8} {method:>24} {elapsed:>7.1f}s {sums[0]:>9} {sums[1]:>9} {check:>12}")
+
+print(f"\n{'lookup':>8} {'method':>24} {'per thread':>11}")
+for name, method, per_lookup in (
+    ("tweets", "no conversation index", unindexed_time),
+    ("tree", "recursive query", recursive_lookup_time),
+    ("", "load_thread", load_thread_time),
+    ("stats", "recursive query", recursive_stats_time),
+    ("", "threads row", stored_stats_time),
+):
+    print(f"{name:>8} {method:>24} {per_lookup * 1000:>9.2f}ms")
+
+print(f"\n{'update':>8} {'method':>24} {'time':>8} {'threads':>9} {'check':>6}")
+print(
+    f"{'':>8} {'build_threads (queued)':>24} {update_time:>7.1f}s {updated:>9} "
+    f"{'ok' if incremental == full and not left else 'DIFF':>6}"
+)
+print(f"{'':>8} {'rebuild_threads':>24} {full_update_time:>7.1f}s {full[0]:>9} {'':>6}")
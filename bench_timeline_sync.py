@@ -0,0 +1,67 @@
+import argparse
+import os
+import tempfile
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import sessionmaker
+from models import Base
+from bulk_writer import BulkWriter
+from crawl_state import CrawlCheckpoints
+from crawler import CrawlEngine
+from mock_api import MockTwitterAPI
+from timeline_sync import TimelineSyncEndpoint
+
+# Count the requests a timeline refresh costs against the local mock API. The
+# first run walks every timeline, then a third of the users post a few tweets
+# and a handful post a burst, and the refresh runs only ask for newer tweets.
+# A full re-walk of every timeline, as 3_user_tweets_grabber.py used to do on
+# every run, is shown for comparison.
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--users", type=int, default=300)
+parser.add_argument("--max-tweets", type=int, default=800)
+args = parser.parse_args()
+
+user_ids = [5_000_000 + n * 131 for n in range(args.users)]
+path = os.path.join(tempfile.mkdtemp(), "bench.db")
+engine = create_engine(f"sqlite:///{path}")
+Base.metadata.create_all(engine)
+
+
+def sync(api):
+    session = sessionmaker(bind=engine)()
+    writer = BulkWriter(session)
+    checkpoints = CrawlCheckpoints(session, writer, "tweets", skip_done=False)
+    timeline = TimelineSyncEndpoint(session, writer, checkpoints)
+    crawl_engine = CrawlEngine(
+        api.base_url, ["a", "b", "c"], writer=writer, progress_every=args.users
+    )
+    before = api.request_count
+    crawl_engine.run(timeline, timeline.prepare(user_ids), checkpoints=checkpoints)
+    crawl_engine.close()
+    tweets = session.execute(text("SELECT COUNT(*) FROM tweets")).scalar()
+    session.close()
+    return api.request_count - before, tweets, timeline.modes
+
+
+with MockTwitterAPI(max_tweets=args.max_tweets) as api:
+    runs = [("initial full sync", *sync(api))]
+    full_walk = runs[0][1]
+
+    active = user_ids[::3]
+    for user_id in active:
+        api.post_tweets(user_id, 5)
+    # A few accounts post more than a capped refresh can fetch
+    for user_id in user_ids[1:6]:
+        api.post_tweets(user_id, 700)
+
+    runs.append(("refresh", *sync(api)))
+    runs.append(("second refresh", *sync(api)))
+
+print(f"\nusers: {args.users}, active users: {len(active)}, timeline cap: {args.max_tweets}")
+print(f"full re-walk of every timeline: ~{full_walk} requests per run")
+for name, requests_made, tweets, modes in runs:
+    print(
+        f"{name:>18}: {requests_made} requests "
+        f"({requests_made / args.users:.2f} per user), {tweets} tweets stored, "
+        f"modes {modes}"
+    )
@@ -0,0 +1,96 @@
+import argparse
+import os
+import tempfile
+import time
+import requests
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import sessionmaker
+from models import Base
+from bulk_writer import BulkWriter
+from crawler import CrawlEngine
+from mock_api import MockTwitterAPI
+from rate_limit import TokenPool
+from tweet_search import SEARCH_PATH, SearchEndpoint, Window, plan_windows
+from user_hydration import parse_twitter_time
+
+# Full-archive search over the local mock API: the serial walk of one period
+# that 1_tweet_grabber.py used to do, with a pause between pages, against the
+# windowed search running one window per token. The API allows one request per
+# second per token; --interval scales that down so the benchmark runs quickly.
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--start", default="2023-04-01T00:00:00Z")
+parser.add_argument("--end", default="2023-05-26T00:00:00Z")
+parser.add_argument("--windows", type=int, default=12)
+parser.add_argument("--interval", type=float, default=0.1)
+parser.add_argument("--latency", type=float, default=0.05)
+parser.add_argument("--burst", type=int, default=40, help="tweets per evening hour")
+args = parser.parse_args()
+
+tokens = ["a", "b", "c"]
+query = "prostřeno OR prostreno"
+
+
+def new_session():
+    path = os.path.join(tempfile.mkdtemp(), "bench.db")
+    engine = create_engine(f"sqlite:///{path}")
+    Base.metadata.create_all(engine)
+    return sessionmaker(bind=engine)()
+
+
+def count_tweets(session):
+    return session.execute(text("SELECT COUNT(*) FROM tweets")).scalar()
+
+
+def serial(api):
+    session = new_session()
+    writer = BulkWriter(session)
+    window = Window(parse_twitter_time(args.start), parse_twitter_time(args.end))
+    search = SearchEndpoint(writer, query, [window], progress_every=10**9)
+    next_token = None
+    start = time.perf_counter()
+    while True:
+        response = requests.get(
+            api.base_url + SEARCH_PATH,
+            headers={"Authorization": "Bearer a"},
+            params=search.request_params(window.key, next_token),
+        )
+        data = response.json()
+        search.on_page(window.key, data)
+        next_token = data.get("meta", {}).get("next_token")
+        if not next_token:
+            break
+        time.sleep(args.interval)
+    writer.flush()
+    return time.perf_counter() - start, count_tweets(session)
+
+
+def windowed(api):
+    session = new_session()
+    start = time.perf_counter()
+    pool = TokenPool(tokens, max_in_flight=1, min_interval=args.interval)
+    windows = plan_windows(api.base_url, pool, query, args.start, args.end, args.windows)
+    writer = BulkWriter(session, max_rows=1)
+    search = SearchEndpoint(writer, query, windows, progress_every=10**9)
+    engine = CrawlEngine(
+        api.base_url,
+        tokens,
+        per_token_concurrency=1,
+        progress_every=len(windows),
+        pool=pool,
+        writer=writer,
+    )
+    engine.run(search, [window.key for window in windows])
+    engine.close()
+    return time.perf_counter() - start, count_tweets(session)
+
+
+results = []
+for name, run in (("serial", serial), ("windowed", windowed)):
+    with MockTwitterAPI(latency=args.latency, search_burst=args.burst) as api:
+        elapsed, tweets = run(api)
+        results.append((name, elapsed, tweets, api.request_count))
+
+print(f"\n{'mode':>9} {'time':>8} {'tweets':>7} {'requests':>9}")
+for name, elapsed, tweets, requests_made in results:
+    print(f"{name:>9} {elapsed:>7.2f}s {tweets:>7} {requests_made:>9}")
@@ -0,0 +1,63 @@
+import argparse
+import os
+import tempfile
+import time
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from models import Base, User
+from mock_api import MockTwitterAPI
+from user_hydration import MAX_IDS_PER_REQUEST, hydrate_pending_users
+
+# Benchmark user hydration against the local mock API: one id per request
+# (the old 2_user_grabber.py behaviour) versus 100 ids per request.
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--users", type=int, default=10_000)
+args = parser.parse_args()
+
+first_id = 1_000_000
+user_ids = [first_id + n for n in range(args.users)]
+# Every 50th account is suspended and every 70th deleted
+suspended = user_ids[::50]
+missing = user_ids[1::70]
+
+
+def run(batch_size):
+    path = os.path.join(tempfile.mkdtemp(), "bench.db")
+    engine = create_engine(f"sqlite:///{path}")
+    Base.metadata.create_all(engine)
+    session = sessionmaker(bind=engine)()
+    session.execute(User.__table__.insert(), [{"id": user_id} for user_id in user_ids])
+    session.commit()
+
+    with MockTwitterAPI(suspended=suspended, missing=missing) as api:
+        start = time.perf_counter()
+        stats = hydrate_pending_users(
+            session, api.base_url, ["token"], batch_size=batch_size, progress_every=1000
+        )
+        elapsed = time.perf_counter() - start
+
+    hydrated = session.query(User).filter(User.created_at.isnot(None)).count()
+    unavailable = session.query(User).filter(User.unavailable_reason.isnot(None)).count()
+    # A second run must find nothing left to do
+    leftover = hydrate_pending_users(
+        session, "http://127.0.0.1:9", ["token"], batch_size=batch_size
+    ).requests
+    session.close()
+    engine.dispose()
+    return stats.requests, elapsed, hydrated, unavailable, leftover
+
+
+results = {}
+for batch_size in (1, MAX_IDS_PER_REQUEST):
+    results[batch_size] = run(batch_size)
+
+print(f"\nusers: {args.users}")
+for batch_size, (requests_issued, elapsed, hydrated, unavailable, leftover) in results.items():
+    per_10k = requests_issued * 10_000 / args.users
+    print(
+        f"ids/request={batch_size:>3}: {requests_issued} requests "
+        f"({per_10k:.0f} per 10k users), {elapsed:.2f} s, "
+        f"{hydrated} hydrated, {unavailable} marked unavailable, "
+        f"{leftover} requests on rerun"
+    )
@@ -0,0 +1,83 @@
+import argparse
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from models import Base, User
+from user_source import iter_user_ids, iter_users
+
+# Memory benchmark for walking the users table: session.query(User).all(), as
+# the grabbers used to, against the keyset-paginated streams in user_source.py.
+# Every measurement runs in a fresh process and reports its peak RSS.
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--sizes", default="100000,300000,1000000")
+parser.add_argument("--child", nargs=2, metavar=("MODE", "DB"))
+args = parser.parse_args()
+
+
+def walk(mode, path):
+    engine = create_engine(f"sqlite:///{path}")
+    session = sessionmaker(bind=engine)()
+    if mode == "all":
+        users = session.query(User).all()
+        count = sum(1 for user in users if user.id)
+    elif mode == "stream-users":
+        count = sum(1 for user in iter_users(session) if user.id)
+    else:
+        count = sum(1 for user_id in iter_user_ids(session))
+    print(f"{count} {peak_rss():.1f}")
+
+
+# Peak RSS in MB. ru_maxrss survives exec on Linux, so the parent's peak would
+# leak into the child; VmHWM belongs to the new address space.
+def peak_rss():
+    try:
+        with open("/proc/self/status") as status:
+            for line in status:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+if args.child:
+    walk(*args.child)
+    sys.exit()
+
+directory = tempfile.mkdtemp()
+print(f"{'users':>9} {'mode':>13} {'peak RSS':>10} {'time':>7}")
+for size in [int(size) for size in args.sizes.split(",")]:
+    path = os.path.join(directory, f"users_{size}.db")
+    engine = create_engine(f"sqlite:///{path}")
+    Base.metadata.create_all(engine)
+    with engine.begin() as connection:
+        connection.execute(
+            User.__table__.insert(),
+            [
+                {
+                    "id": 10_000_000 + n,
+                    "username": f"user{n}",
+                    "description": "Fanoušek pořadu Prostřeno! " * 4,
+                    "followers_count": n % 5000,
+                }
+                for n in range(size)
+            ],
+        )
+    engine.dispose()
+
+    for mode in ("all", "stream-users", "stream-ids"):
+        start = time.perf_counter()
+        output = subprocess.run(
+            [sys.executable, __file__, "--child", mode, path],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.split()
+        elapsed = time.perf_counter() - start
+        print(f"{size:>9} {mode:>13} {float(output[1]):>7.1f} MB {elapsed:>6.1f}s")
@@ -0,0 +1,131 @@
+import argparse
+import os
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from sqlalchemy import create_engine, func
+from sqlalchemy.orm import sessionmaker
+from models import Base, User, Following, WorkItem
+from mock_api import MockTwitterAPI, fake_user
+from work_queue import LEASED, enqueue_users, print_progress, progress
+
+# Several `prostreno.py worker` processes share one following job through the work
+# queue, against the local mock API and a SQLite database. One worker is killed
+# with SIGKILL part way through; the others must pick up its users once their
+# lease expires. Afterwards every user must be done with all of its edges
+# stored (nothing lost), and every user must have been requested once, except
+# the ones the killed worker held a lease on (nothing duplicated).
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--users", type=int, default=600)
+parser.add_argument("--workers", type=int, default=3)
+parser.add_argument("--latency", type=float, default=0.02)
+parser.add_argument("--lease", type=float, default=6)
+parser.add_argument("--batch", type=int, default=20)
+parser.add_argument(
+    "--kill-after", type=float, default=1.0,
+    help="seconds after its first claim the first worker is killed",
+)
+args = parser.parse_args()
+
+directory = tempfile.mkdtemp()
+path = os.path.join(directory, "queue.db")
+url = f"sqlite:///{path}?timeout=60"
+engine = create_engine(url)
+Base.metadata.create_all(engine)
+session = sessionmaker(bind=engine)()
+user_ids = [5_000_000 + n * 29 for n in range(args.users)]
+session.add_all(User(id=user_id) for user_id in user_ids)
+session.commit()
+print(f"Queued {enqueue_users(session, 'following')} users.")
+
+# At most 100 edges per user, so every user is a single request
+max_edges = 100
+expected_edges = {
+    user_id: min(fake_user(user_id)["public_metrics"]["following_count"], max_edges)
+    for user_id in user_ids
+}
+
+with MockTwitterAPI(latency=args.latency, max_edges=max_edges) as api:
+    env = dict(os.environ)
+    env.update(
+        DATABASE_URL=url,
+        API_BASE_URL=api.base_url,
+        BEARER_TOKEN="token0",
+        BEARER_TOKEN2="token1",
+        BEARER_TOKEN3="token2",
+    )
+    start = time.perf_counter()
+    workers = [
+        subprocess.Popen(
+            [
+                sys.executable, "prostreno.py", "worker", "following",
+                "--slice", f"{n % 3}/3",
+                "--lease", str(args.lease),
+                "--batch", str(args.batch),
+            ],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            env=env,
+            stdout=open(os.path.join(directory, f"worker{n}.log"), "w"),
+            stderr=subprocess.STDOUT,
+        )
+        for n in range(args.workers)
+    ]
+
+    killed = workers[0]
+    killed_name = f"{socket.gethostname()}-{killed.pid}"
+    while not session.query(WorkItem).filter(WorkItem.worker == killed_name).count():
+        session.commit()
+        time.sleep(0.1)
+    time.sleep(args.kill_after)
+    killed.send_signal(signal.SIGKILL)
+    killed.wait()
+    orphaned = {
+        row.user_id
+        for row in session.query(WorkItem.user_id).filter(
+            WorkItem.worker == killed_name, WorkItem.status == LEASED
+        )
+    }
+    session.commit()
+    print(f"Killed {killed_name} holding {len(orphaned)} leased users.")
+
+    for worker in workers[1:]:
+        worker.wait()
+    elapsed = time.perf_counter() - start
+    requests_per_user = {
+        user_id: api.request_counts.get(f"/2/users/{user_id}/following", 0)
+        for user_id in user_ids
+    }
+
+stored_edges = dict(
+    session.query(Following.user_id, func.count()).group_by(Following.user_id).all()
+)
+counts, _ = progress(session, "following")
+print_progress(session, "following")
+lost = [
+    user_id
+    for user_id in user_ids
+    if stored_edges.get(user_id, 0) != expected_edges[user_id]
+]
+duplicated = [user_id for user_id, count in requests_per_user.items() if count > 1]
+unexplained = [user_id for user_id in duplicated if user_id not in orphaned]
+never_requested = [user_id for user_id, count in requests_per_user.items() if count == 0]
+
+print(
+    f"\n{args.workers} workers, {args.users} users, lease {args.lease:.0f} s, "
+    f"finished in {elapsed:.1f} s"
+)
+print(f"users done: {counts['done']} of {args.users}")
+print(f"users with missing edges: {len(lost)}")
+print(f"users never requested: {len(never_requested)}")
+print(
+    f"users requested twice: {len(duplicated)} "
+    f"({len(duplicated) - len(unexplained)} leased by the killed worker, "
+    f"{len(unexplained)} otherwise)"
+)
+ok = counts["done"] == args.users and not lost and not never_requested and not unexplained
+print("no work lost or duplicated:", ok)
+sys.exit(0 if ok else 1)
@@ -0,0 +1,153 @@
+import time
+from sqlalchemy import func, inspect
+from models import created_on
+from partitions import ensure_partitions
+
+# Buffered bulk write path for the grabbers. Rows are collected per table and
+# flushed with one multi-row INSERT ... ON CONFLICT per table, instead of an
+# existence query and an ORM add for every row. Flushes happen when enough rows
+# are buffered or enough time has passed since the last flush. Tables
+# partitioned by a column (info["partition_by"]) get the partitions their rows
+# need before they are written. Where a unique index covers part of the
+# primary key (tweets.id outside PostgreSQL), it is the conflict target, so a
+# tweet stored with another created_at is updated instead of failing the flush.
+
+
+# Pick the dialect specific insert() that supports ON CONFLICT
+def dialect_insert(session, table):
+    dialect = session.get_bind().dialect.name
+    if dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    elif dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        raise ValueError(f"Bulk upserts are not supported on {dialect}")
+    return insert(table)
+
+
+class TableBuffer:
+    # conflict: "nothing" to keep existing rows, "update" to overwrite `update`
+    #           columns, "merge" to overwrite them only with non-NULL values,
+    #           None for a plain INSERT (tables without a natural key)
+    def __init__(self, model, conflict, update):
+        self.table = model.__table__
+        self.conflict = conflict
+        self.update = update
+        self.key = [column.name for column in inspect(model).primary_key]
+        self.partition_by = self.table.info.get("partition_by")
+        # Rows keyed by primary key so one statement never touches a row twice
+        self.rows = {} if conflict else []
+
+    def add(self, row):
+        if self.conflict == "merge":
+            key = tuple(row[name] for name in self.key)
+            buffered = self.rows.get(key)
+            if buffered is not None:
+                row = {
+                    name: buffered[name] if value is None else value
+                    for name, value in row.items()
+                }
+            self.rows[key] = row
+        elif self.conflict:
+            self.rows[tuple(row[name] for name in self.key)] = row
+        else:
+            self.rows.append(row)
+
+    def __len__(self):
+        return len(self.rows)
+
+    def conflict_key(self, dialect):
+        for index in self.table.indexes:
+            columns = [column.name for column in index.columns]
+            if index.unique and created_on(index, dialect) and set(columns) < set(self.key):
+                return columns
+        return self.key
+
+    def statement(self, session):
+        stmt = dialect_insert(session, self.table)
+        key = self.conflict_key(session.get_bind().dialect.name)
+        if self.conflict == "nothing":
+            stmt = stmt.on_conflict_do_nothing(index_elements=key)
+        elif self.conflict == "update":
+            stmt = stmt.on_conflict_do_update(
+                index_elements=key,
+                set_={name: stmt.excluded[name] for name in self.update},
+            )
+        elif self.conflict == "merge":
+            stmt = stmt.on_conflict_do_update(
+                index_elements=key,
+                set_={
+                    name: func.coalesce(stmt.excluded[name], self.table.c[name])
+                    for name in self.update
+                },
+            )
+        return stmt
+
+    def take(self):
+        rows = list(self.rows.values()) if self.conflict else self.rows
+        self.rows = {} if self.conflict else []
+        return rows
+
+
+class BulkWriter:
+    def __init__(self, session, max_rows=5000, max_seconds=5.0):
+        self.session = session
+        self.max_rows = max_rows
+        self.max_seconds = max_seconds
+        self.rows_written = 0
+        self.flushes = 0
+        self._buffers = {}
+        self._last_flush = time.time()
+
+    # Declare how conflicts are handled for a model. Tables are flushed in the
+    # order they were registered, so register parents before children.
+    def register(self, model, conflict="nothing", update=()):
+        if model not in self._buffers:
+            self._buffers[model] = TableBuffer(model, conflict, list(update))
+        return self
+
+    # Buffer rows, callers call flush_if_due() once they reach a consistent point
+    # (for the grabbers, the end of a page)
+    def add(self, model, row):
+        self.register(model)
+        self._buffers[model].add(row)
+
+    def add_many(self, model, rows):
+        self.register(model)
+        buffer = self._buffers[model]
+        for row in rows:
+            buffer.add(row)
+
+    def pending(self):
+        return sum(len(buffer) for buffer in self._buffers.values())
+
+    def flush_if_due(self):
+        if self.pending() >= self.max_rows or (
+            self.pending() and time.time() - self._last_flush >= self.max_seconds
+        ):
+            self.flush()
+
+    # Write every buffered row and commit, together with anything else
+    # pending on the session
+    def flush(self):
+        try:
+            taken = [(buffer, buffer.take()) for buffer in self._buffers.values()]
+            # Before any write: attaching a partition waits for the tables its
+            # foreign keys reference, which this transaction would hold
+            for buffer, rows in taken:
+                if rows and buffer.partition_by:
+                    ensure_partitions(
+                        self.session,
+                        buffer.table.name,
+                        {row.get(buffer.partition_by) for row in rows},
+                    )
+            for buffer, rows in taken:
+                if rows:
+                    self.session.execute(buffer.statement(self.session), rows)
+                    self.rows_written += len(rows)
+            self.session.commit()
+        except Exception:
+            self.session.rollback()
+            raise
+        self.flushes += 1
+        self._last_flush = time.time()
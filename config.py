@@ -18,3 +18,14 @@ DB_HOST = os.getenv("DB_HOST")
 DB_USER = os.getenv("DB_USER")
 DB_PASSWORD = os.getenv("DB_PASSWORD")
 DB_NAME = os.getenv("DB_NAME")
+# SQLAlchemy URL of the database, built from the credentials above unless set
+# (e.g. sqlite:///crawl.db to run a grabber against a local file)
+DATABASE_URL = os.getenv(
+    "DATABASE_URL", f"postgresql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}/{DB_NAME}"
+)
+# Base URL of the Twitter API, can point at a local mock server for benchmarks
+API_BASE_URL = os.getenv("API_BASE_URL", "https://api.twitter.com")
+# Directory the grabbers append raw API responses to, unset to not archive
+ARCHIVE_DIR = os.getenv("ARCHIVE_DIR")
+# Directory of the history of user metrics and follow edges, unset to not keep it
+HISTORY_DIR = os.getenv("HISTORY_DIR")
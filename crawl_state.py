@@ -0,0 +1,136 @@
+from datetime import datetime, timezone
+from sqlalchemy import inspect, text
+from models import CrawlState
+from crawler import batched_keys
+
+# Persistent crawl checkpoints. The state of every (endpoint, user_id) chain is
+# buffered in the same BulkWriter as the page's rows, so a checkpoint is always
+# committed in the same transaction as the data it describes. With a WorkQueue
+# the key's queue entry is marked done or failed the same way.
+
+IN_PROGRESS = "in_progress"
+DONE = "done"
+FAILED = "failed"
+
+
+class CrawlCheckpoints:
+    # skip_done:  drop keys whose chain is done. Endpoints that are crawled again
+    #             on every run (timeline refreshes) only use checkpoints to resume.
+    # queue:      optional WorkQueue the keys were claimed from
+    # batch_size: keys whose stored state is loaded per query
+    def __init__(
+        self, session, writer, endpoint, skip_done=True, queue=None, batch_size=1000
+    ):
+        self.session = session
+        self.writer = writer
+        self.endpoint = endpoint
+        self.skip_done = skip_done
+        self.queue = queue
+        self.batch_size = batch_size
+        self.writer.register(
+            CrawlState,
+            conflict="update",
+            update=["status", "next_token", "pages", "newest_id", "started_at", "updated_at"],
+        )
+        # State of the chains that are resumed or running, finished ones are dropped
+        self._states = {}
+        self.skipped = 0
+        self.resumed = 0
+
+    # Drop keys that are already done and load the stored state of the rest.
+    # Keys are checked in batches so any iterable, including a stream or an
+    # async iterable, works.
+    def pending(self, keys, batch_size=None):
+        return batched_keys(keys, batch_size or self.batch_size, self._pending_batch)
+
+    def _pending_batch(self, keys):
+        stored = {
+            state.user_id: state
+            for state in self.session.query(CrawlState).filter(
+                CrawlState.endpoint == self.endpoint, CrawlState.user_id.in_(keys)
+            )
+        }
+        pending = []
+        for key in keys:
+            state = stored.get(key)
+            if self.skip_done and state is not None and state.status == DONE:
+                self.skipped += 1
+                if self.queue is not None:
+                    self.queue.mark_done(key)
+                continue
+            if state is not None and state.status != DONE and state.next_token:
+                self.resumed += 1
+                self._states[key] = {
+                    "endpoint": self.endpoint,
+                    "user_id": key,
+                    "status": state.status,
+                    "next_token": state.next_token,
+                    "pages": state.pages or 0,
+                    "newest_id": state.newest_id,
+                    "started_at": state.started_at,
+                    "updated_at": state.updated_at,
+                }
+            pending.append(key)
+        # The ORM objects are not needed any more
+        for state in stored.values():
+            self.session.expunge(state)
+        return pending
+
+    def summary(self):
+        return (
+            f"{self.skipped} users already done, "
+            f"{self.resumed} resumed from a stored page"
+        )
+
+    # Pagination token and page count to resume a key from
+    def resume(self, key):
+        state = self._states.get(key)
+        if state is None:
+            return None, 0
+        return state["next_token"], state["pages"]
+
+    # Newest tweet id the chain of a resumed key had stored
+    def resume_newest(self, key):
+        state = self._states.get(key)
+        return None if state is None else state["newest_id"]
+
+    def _state(self, key):
+        now = datetime.now(timezone.utc).replace(tzinfo=None)
+        return self._states.setdefault(
+            key,
+            {"endpoint": self.endpoint, "user_id": key, "newest_id": None, "started_at": now},
+        )
+
+    # Called by endpoints while a page is stored, written with its checkpoint
+    def keep_newest(self, key, newest_id):
+        self._state(key)["newest_id"] = newest_id
+
+    def _record(self, key, status, next_token, pages):
+        now = datetime.now(timezone.utc).replace(tzinfo=None)
+        state = self._state(key)
+        state.update(
+            status=status, next_token=next_token, pages=pages, updated_at=now
+        )
+        self.writer.add(CrawlState, dict(state))
+        if status != IN_PROGRESS:
+            del self._states[key]
+        if self.queue is not None and status == DONE:
+            self.queue.mark_done(key)
+        elif self.queue is not None and status == FAILED:
+            self.queue.mark_failed(key)
+
+    # Called after a page's rows have been buffered in the writer
+    def page_done(self, key, next_token, pages):
+        self._record(key, IN_PROGRESS if next_token else DONE, next_token, pages)
+
+    # The chain stopped on an error, keep the token so the next run retries it
+    def failed(self, key, next_token, pages):
+        self._record(key, FAILED, next_token, pages)
+
+
+# crawl_state tables created before newest_id existed get the column
+def migrate_crawl_state(engine):
+    columns = [column["name"] for column in inspect(engine).get_columns(CrawlState.__tablename__)]
+    if "newest_id" not in columns:
+        with engine.begin() as connection:
+            connection.execute(text("ALTER TABLE crawl_state ADD COLUMN newest_id BIGINT"))
@@ -0,0 +1,372 @@
+import asyncio
+import json
+import time
+import aiohttp
+from rate_limit import TokenPool
+
+# Shared asyncio crawl engine. The grabbers describe what to fetch with an
+# Endpoint and the engine walks many pagination chains at the same time, with a
+# fixed number of in-flight requests per bearer token so every token is used in
+# parallel. Each request goes to the token with the most rate-limit budget left.
+# The event loop and its keep-alive HTTP session live as long as the engine, so
+# consecutive run() calls reuse the open connections; close() ends both.
+
+# Seconds an idle connection is kept open between requests and runs
+KEEPALIVE_TIMEOUT = 60
+
+# 429 responses in a row after which a key is given up as failed
+MAX_RATE_LIMITED = 10
+
+
+class Endpoint:
+    # name:        label used in progress output
+    # path:        URL path, "{key}" is replaced by the crawl key (usually a user id)
+    # params:      query parameters sent with every request
+    # on_page:     callable(key, data) that stores one decoded response page
+    # key_param:   send the key as this query parameter instead of in the path
+    # paginate:    follow meta.next_token until the chain is exhausted
+    # max_pages:   optional cap on pages fetched per key
+    # on_done:     optional callable(key, truncated) run after a key's last page,
+    #              truncated is True when max_pages cut the chain short
+    # on_start:    optional callable(key, resumed) run before a key's first page,
+    #              resumed is True when the chain continues from a checkpoint
+    # on_failed:   optional callable(key) run when an error ends a key's chain
+    # Subclasses can override request_params() and page_limit() to vary the
+    # request per key.
+    def __init__(
+        self,
+        name,
+        path,
+        params,
+        on_page,
+        key_param=None,
+        paginate=True,
+        max_pages=None,
+        on_done=None,
+        on_start=None,
+        on_failed=None,
+    ):
+        self.name = name
+        self.path = path
+        self.params = params
+        self.on_page = on_page
+        self.key_param = key_param
+        self.paginate = paginate
+        self.max_pages = max_pages
+        self.on_done = on_done
+        self.on_start = on_start
+        self.on_failed = on_failed
+
+    def url(self, base_url, key):
+        return base_url + self.path.format(key=key)
+
+    def request_params(self, key, pagination_token=None):
+        params = dict(self.params)
+        if self.key_param:
+            params[self.key_param] = key
+        if pagination_token:
+            params["pagination_token"] = pagination_token
+        return params
+
+    def page_limit(self, key):
+        return self.max_pages
+
+
+# Stream the keys a batch at a time through `apply`, which returns the keys of
+# its batch to keep. Works on iterables and, streaming asynchronously, on async
+# iterables such as WorkQueue.keys().
+def batched_keys(keys, batch_size, apply):
+    if hasattr(keys, "__aiter__"):
+        return _batched_keys_async(keys, batch_size, apply)
+    return _batched_keys(keys, batch_size, apply)
+
+
+def _batched_keys(keys, batch_size, apply):
+    batch = []
+    for key in keys:
+        batch.append(key)
+        if len(batch) == batch_size:
+            yield from apply(batch)
+            batch = []
+    if batch:
+        yield from apply(batch)
+
+
+async def _batched_keys_async(keys, batch_size, apply):
+    batch = []
+    async for key in keys:
+        batch.append(key)
+        if len(batch) == batch_size:
+            for kept in apply(batch):
+                yield kept
+            batch = []
+    if batch:
+        for kept in apply(batch):
+            yield kept
+
+
+# An error ended the key's chain: keep its resume point for the next run and
+# let the endpoint drop what it tracks for the chain
+def key_failed(endpoint, checkpoints, key, pagination_token, pages):
+    if checkpoints is not None:
+        checkpoints.failed(key, pagination_token, pages)
+    if endpoint.on_failed is not None:
+        endpoint.on_failed(key)
+
+
+class CrawlStats:
+    def __init__(self):
+        self.requests = 0
+        self.pages = 0
+        self.rate_limited = 0
+        self.errors = 0
+        self.keys_done = 0
+        self.elapsed = 0.0
+        self.idle_time = 0.0
+
+    def __str__(self):
+        rate = self.requests / self.elapsed if self.elapsed else 0
+        return (
+            f"{self.keys_done} keys, {self.pages} pages, {self.requests} requests "
+            f"({rate:.1f}/s), {self.rate_limited} rate limited, {self.errors} errors "
+            f"in {self.elapsed:.1f} seconds ({self.idle_time:.1f} seconds waiting on quota)"
+        )
+
+
+class CrawlEngine:
+    # pool:    optional TokenPool shared with other crawls using the same tokens
+    # writer:  BulkWriter the endpoint buffers rows in, flushed between pages
+    # archive: optional ResponseArchive every successful response is appended to
+    def __init__(
+        self,
+        base_url,
+        bearer_tokens,
+        per_token_concurrency=4,
+        progress_every=100,
+        pool=None,
+        writer=None,
+        archive=None,
+    ):
+        self.base_url = base_url
+        self.pool = pool or TokenPool(bearer_tokens, max_in_flight=per_token_concurrency)
+        self.per_token_concurrency = per_token_concurrency
+        self.progress_every = progress_every
+        self.writer = writer
+        self.archive = archive
+        self._runner = None
+        self._http = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    # Close the HTTP session and the event loop, a later run() opens new ones
+    def close(self):
+        if self._runner is None:
+            return
+        if self._http is not None:
+            self._runner.run(self._http.close())
+            self._http = None
+        self._runner.close()
+        self._runner = None
+
+    # The engine's HTTP session, opened on first use in the running loop.
+    # Responses are requested gzip-compressed and decompressed by aiohttp.
+    def http_session(self):
+        if self._http is None:
+            connector = aiohttp.TCPConnector(
+                limit=len(self.pool.tokens) * self.per_token_concurrency,
+                keepalive_timeout=KEEPALIVE_TIMEOUT,
+            )
+            self._http = aiohttp.ClientSession(
+                connector=connector, headers={"Accept-Encoding": "gzip, deflate"}
+            )
+        return self._http
+
+    # Crawl every key with the endpoint and block until done. Keys can be a
+    # stream or an async iterable, pass `total` for a progress estimate when it
+    # has no len(). With
+    # checkpoints (a CrawlCheckpoints on the same writer) finished keys are
+    # skipped and unfinished ones resume from their last stored page.
+    def run(self, endpoint, keys, checkpoints=None, total=None):
+        if self._runner is None:
+            self._runner = asyncio.Runner()
+        try:
+            return self._runner.run(self.crawl(endpoint, keys, checkpoints, total))
+        finally:
+            # Rows and checkpoints are buffered together, so whatever is in
+            # the buffer is consistent even after Ctrl-C
+            self._flush()
+            if self.archive is not None:
+                self.archive.flush()
+
+    # A failed flush stops the run: the rows and checkpoints it took from the
+    # buffer are rolled back together, so their keys are crawled again next run
+    def _flush(self, if_due=False):
+        if self.writer is None:
+            return
+        if if_due:
+            self.writer.flush_if_due()
+        else:
+            self.writer.flush()
+
+    async def crawl(self, endpoint, keys, checkpoints=None, total=None):
+        if total is None and hasattr(keys, "__len__"):
+            total = len(keys)
+        if checkpoints is not None:
+            keys = checkpoints.pending(keys)
+
+        stats = CrawlStats()
+        start_time = time.time()
+        rate_limited = self.pool.rate_limited
+        idle_time = self.pool.idle_time
+        concurrency = len(self.pool.tokens) * self.per_token_concurrency
+        # Keys are pulled from the source only as fast as workers take them
+        queue = asyncio.Queue(maxsize=concurrency * 2)
+
+        async def produce():
+            if hasattr(keys, "__aiter__"):
+                async for key in keys:
+                    await queue.put(key)
+            else:
+                for key in keys:
+                    await queue.put(key)
+            for _ in range(concurrency):
+                await queue.put(None)
+
+        http = self.http_session()
+        workers = [
+            asyncio.create_task(
+                self._worker(http, endpoint, checkpoints, queue, stats, total, start_time)
+            )
+            for _ in range(concurrency)
+        ]
+        await asyncio.gather(produce(), *workers)
+
+        stats.elapsed = time.time() - start_time
+        stats.rate_limited = self.pool.rate_limited - rate_limited
+        stats.idle_time = self.pool.idle_time - idle_time
+        print(f"Finished {endpoint.name}: {stats}")
+        if checkpoints is not None:
+            print(f"Checkpoints for {endpoint.name}: {checkpoints.summary()}")
+        return stats
+
+    # Each worker walks one key's pagination chain at a time
+    async def _worker(
+        self, http, endpoint, checkpoints, queue, stats, total, start_time
+    ):
+        while True:
+            key = await queue.get()
+            if key is None:
+                return
+            await self._crawl_key(http, endpoint, checkpoints, key, stats)
+
+            stats.keys_done += 1
+            if stats.keys_done % self.progress_every == 0 or stats.keys_done == total:
+                if total:
+                    # Skipped keys count as done for the estimate
+                    done = stats.keys_done + (checkpoints.skipped if checkpoints else 0)
+                    elapsed_time = time.time() - start_time
+                    estimated_time_remaining = (elapsed_time / done) * max(
+                        total - done, 0
+                    )
+                    print(
+                        f"Processed {endpoint.name} {done} of {total}. "
+                        f"Estimated time remaining: {estimated_time_remaining / 60:.2f} minutes."
+                    )
+                else:
+                    print(f"Processed {endpoint.name} {stats.keys_done}.")
+                print(f"Quota: {self.pool.summary()}")
+
+    async def _crawl_key(self, http, endpoint, checkpoints, key, stats):
+        url = endpoint.url(self.base_url, key)
+        pagination_token = None
+        pages = 0
+        if checkpoints is not None:
+            pagination_token, pages = checkpoints.resume(key)
+        if endpoint.on_start is not None:
+            endpoint.on_start(key, pagination_token is not None)
+        max_pages = endpoint.page_limit(key)
+        rate_limited = 0
+        while True:
+            # Route the request to the token with the most budget left
+            slot = await self.pool.acquire_async(endpoint.path)
+            headers = {
+                "Authorization": f"Bearer {self.pool.tokens[slot]}",
+                "Content-Type": "application/json",
+            }
+            params = endpoint.request_params(key, pagination_token)
+            status = None
+            response_headers = {}
+            try:
+                async with http.get(url, headers=headers, params=params) as response:
+                    stats.requests += 1
+                    status = response.status
+                    response_headers = response.headers
+                    if status == 200:
+                        body = await response.read()
+                        data = json.loads(body)
+                    else:
+                        text = await response.text()
+            # Dropped connections, timeouts and bodies that are not JSON fail
+            # this key alone, the other chains keep going
+            except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+                stats.errors += 1
+                print(f"Error fetching {endpoint.name} for {key}: {e}")
+                key_failed(endpoint, checkpoints, key, pagination_token, pages)
+                return
+            finally:
+                self.pool.update(slot, endpoint.path, status, response_headers)
+
+            # If the status code is 429, retry once a token has budget again,
+            # up to MAX_RATE_LIMITED times in a row
+            if status == 429:
+                rate_limited += 1
+                if rate_limited < MAX_RATE_LIMITED:
+                    continue
+            else:
+                rate_limited = 0
+
+            # If the status code is not 200, print the error and give up on this key
+            if status != 200:
+                stats.errors += 1
+                print(f"Error: {status}, {text}")
+                key_failed(endpoint, checkpoints, key, pagination_token, pages)
+                return
+
+            stats.pages += 1
+            pages += 1
+
+            # If there's a next_token in the response, use it in the next request
+            next_token = data.get("meta", {}).get("next_token")
+            truncated = False
+            if not endpoint.paginate:
+                next_token = None
+            if max_pages and pages >= max_pages and next_token:
+                next_token = None
+                truncated = True
+
+            if self.archive is not None:
+                self.archive.record(
+                    endpoint.name,
+                    key,
+                    params,
+                    slot,
+                    body,
+                    last=next_token is None,
+                    truncated=truncated,
+                )
+            endpoint.on_page(key, data)
+            if next_token is None and endpoint.on_done is not None:
+                endpoint.on_done(key, truncated)
+
+            # Store the checkpoint with the page's rows, then flush both together
+            if checkpoints is not None:
+                checkpoints.page_done(key, next_token, pages)
+            self._flush(if_due=True)
+
+            if next_token is None:
+                return
+            pagination_token = next_token
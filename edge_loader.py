@@ -0,0 +1,147 @@
+from itertools import chain
+import numpy as np
+from sqlalchemy import text
+
+# Bulk reader for id columns (the edge tables, users.id) straight into int64
+# NumPy arrays. On PostgreSQL the rows are streamed with binary COPY ... TO
+# STDOUT and every chunk is viewed as a NumPy record array, so no Python object
+# is created per row. Other databases (SQLite for the benchmarks) go
+# through a server-side cursor with a large fetch size instead. Either way the
+# rows land in a preallocated buffer that grows in place, which keeps memory
+# close to 8 bytes per id (16 bytes per edge).
+
+CHUNK_ROWS = 500_000
+COPY_CHUNK_BYTES = 4 * 2**20
+
+# Binary COPY output: a header, then per row a 16-bit field count followed by
+# a 32-bit length and the big-endian value of every field, then a trailer
+COPY_SIGNATURE = b"PGCOPY\n\xff\r\n\0"
+COPY_HEADER_BYTES = len(COPY_SIGNATURE) + 8
+
+
+class IdBuffer:
+    # Rows of `columns` int64 ids, growing by `growth` when full
+    def __init__(self, columns, capacity=CHUNK_ROWS, growth=1.5):
+        self.growth = growth
+        self.rows = 0
+        self._array = np.empty((max(capacity, 1), columns), dtype=np.int64)
+
+    def extend(self, chunk):
+        needed = self.rows + len(chunk)
+        if needed > len(self._array):
+            capacity = max(needed, int(len(self._array) * self.growth))
+            # realloc, the old block is not kept alongside the new one
+            self._array.resize((capacity, self._array.shape[1]), refcheck=False)
+        self._array[self.rows : needed] = chunk
+        self.rows = needed
+
+    # The filled rows, the spare capacity is given back
+    def array(self):
+        self._array.resize((self.rows, self._array.shape[1]), refcheck=False)
+        return self._array
+
+
+# Record layout of a binary COPY row of `columns` BIGINT fields
+def copy_row_dtype(columns):
+    fields = [("count", ">i2")]
+    for column in range(columns):
+        fields += [(f"length{column}", ">i4"), (f"value{column}", ">i8")]
+    return np.dtype(fields)
+
+
+# File-like target for psycopg2's copy_expert() receiving binary COPY output.
+# Rows all have the same size, so every complete run of them is viewed as a
+# record array and copied into the buffer column by column.
+class CopySink:
+    def __init__(self, buffer, columns):
+        self.buffer = buffer
+        self.columns = columns
+        self.row_dtype = copy_row_dtype(columns)
+        self._header = None
+        self._pending = []
+        self._pending_bytes = 0
+
+    def write(self, data):
+        self._pending.append(bytes(data))
+        self._pending_bytes += len(data)
+        if self._pending_bytes >= COPY_CHUNK_BYTES:
+            self._parse()
+
+    def close(self):
+        self._parse()
+        # Only the 16-bit trailer may be left
+        if self._pending_bytes not in (0, 2):
+            raise ValueError(f"Truncated COPY data, {self._pending_bytes} bytes left")
+
+    def _parse(self):
+        data = b"".join(self._pending)
+        offset = 0
+        if self._header is None:
+            if len(data) < COPY_HEADER_BYTES:
+                self._pending = [data]
+                return
+            if not data.startswith(COPY_SIGNATURE):
+                raise ValueError("Not a binary COPY stream")
+            extension = int.from_bytes(
+                data[COPY_HEADER_BYTES - 4 : COPY_HEADER_BYTES], "big"
+            )
+            self._header = data[: COPY_HEADER_BYTES + extension]
+            offset = len(self._header)
+        rows = (len(data) - offset) // self.row_dtype.itemsize
+        records = np.frombuffer(data, dtype=self.row_dtype, count=rows, offset=offset)
+        chunk = np.empty((rows, self.columns), dtype=np.int64)
+        for column in range(self.columns):
+            chunk[:, column] = records[f"value{column}"]
+        self.buffer.extend(chunk)
+        rest = data[offset + rows * self.row_dtype.itemsize :]
+        self._pending = [rest] if rest else []
+        self._pending_bytes = len(rest)
+
+
+def estimated_rows(connection, table):
+    if connection.dialect.name != "postgresql":
+        return CHUNK_ROWS
+    estimate = connection.execute(
+        text("SELECT reltuples FROM pg_class WHERE relname = :table"),
+        {"table": table},
+    ).scalar()
+    return int(estimate * 1.05) if estimate and estimate > 0 else CHUNK_ROWS
+
+
+# Read the id `columns` of `table` as an (n, len(columns)) int64 array. Rows
+# with a NULL in any of the columns are skipped, `where` is an optional extra
+# SQL condition on the rows.
+def read_ids(session, table, columns, chunk_rows=CHUNK_ROWS, where=None):
+    connection = session.connection()
+    buffer = IdBuffer(len(columns), estimated_rows(connection, table))
+    not_null = " AND ".join(f"{column} IS NOT NULL" for column in columns)
+    if where:
+        not_null += f" AND ({where})"
+    casts = ", ".join(f"CAST({column} AS BIGINT)" for column in columns)
+    dbapi_connection = connection.connection.dbapi_connection
+    cursor = dbapi_connection.cursor()
+    try:
+        if connection.dialect.name == "postgresql":
+            sink = CopySink(buffer, len(columns))
+            cursor.copy_expert(
+                f"COPY (SELECT {casts} FROM {table} WHERE {not_null}) "
+                f"TO STDOUT (FORMAT binary)",
+                sink,
+            )
+            sink.close()
+        else:
+            cursor.arraysize = chunk_rows
+            cursor.execute(f"SELECT {casts} FROM {table} WHERE {not_null}")
+            while True:
+                rows = cursor.fetchmany(chunk_rows)
+                if not rows:
+                    break
+                chunk = np.fromiter(
+                    chain.from_iterable(rows),
+                    dtype=np.int64,
+                    count=len(rows) * len(columns),
+                )
+                buffer.extend(chunk.reshape(-1, len(columns)))
+    finally:
+        cursor.close()
+    return buffer.array()
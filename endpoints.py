@@ -0,0 +1,81 @@
+from crawler import Endpoint
+from models import User, Following, Follower
+
+# Endpoint descriptors for the edge grabbers (timelines are synced by
+# timeline_sync.py). Each one is keyed by user id and buffers every page it
+# receives in a BulkWriter, which the crawl engine flushes between pages.
+# Accounts on the other end of an edge are stored as placeholder users first,
+# so the edge's foreign key holds; users already stored are left alone. With a
+# history.History every list is also diffed with the previous crawl of it, so
+# the follows gained and lost between crawls are kept.
+
+
+# Rows for one page of edges: placeholder users and (user_id, target) edges
+def edge_rows(user_id, data, target):
+    user_id = int(user_id)
+    targets = [int(user_data["id"]) for user_data in data.get("data", [])]
+    users = [{"id": target_id, "placeholder": True} for target_id in targets]
+    edges = [{target: target_id, "user_id": user_id} for target_id in targets]
+    return users, edges
+
+
+# Record the lists an edge endpoint walks in the history as well. A page with
+# errors and no data leaves its list incomplete, so no follow is taken as lost.
+def with_history(endpoint, history):
+    table = endpoint.name
+    on_page = endpoint.on_page
+
+    def on_history_page(user_id, data):
+        on_page(user_id, data)
+        target_ids = [int(user_data["id"]) for user_data in data.get("data", [])]
+        error = bool(data.get("errors")) and not target_ids
+        history.add_edges(table, user_id, target_ids, error=error)
+
+    endpoint.on_page = on_history_page
+    endpoint.on_start = lambda user_id, resumed: history.start_list(table, user_id, resumed)
+    endpoint.on_done = lambda user_id, truncated: history.end_list(table, user_id, truncated)
+    return endpoint
+
+
+# GET /2/users/{id}/following, max_pages caps the pages walked per user
+def following_endpoint(writer, max_results=100, max_pages=None, history=None):
+    writer.register(User, conflict="nothing")
+    writer.register(Following, conflict="nothing")
+
+    def on_page(user_id, data):
+        users, edges = edge_rows(user_id, data, "following_id")
+        writer.add_many(User, users)
+        writer.add_many(Following, edges)
+
+    endpoint = Endpoint(
+        "following",
+        "/2/users/{key}/following",
+        {"max_results": max_results},
+        on_page,
+        max_pages=max_pages,
+    )
+    if history is not None:
+        with_history(endpoint, history)
+    return endpoint
+
+
+# GET /2/users/{id}/followers, max_pages caps the pages walked per user
+def followers_endpoint(writer, max_results=100, max_pages=None, history=None):
+    writer.register(User, conflict="nothing")
+    writer.register(Follower, conflict="nothing")
+
+    def on_page(user_id, data):
+        users, edges = edge_rows(user_id, data, "follower_id")
+        writer.add_many(User, users)
+        writer.add_many(Follower, edges)
+
+    endpoint = Endpoint(
+        "followers",
+        "/2/users/{key}/followers",
+        {"max_results": max_results},
+        on_page,
+        max_pages=max_pages,
+    )
+    if history is not None:
+        with_history(endpoint, history)
+    return endpoint
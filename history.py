@@ -0,0 +1,430 @@
+import os
+import time
+from datetime import datetime, timezone
+import numpy as np
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+# Append-only history of what the crawl observed, for growth analysis: the
+# users table keeps the latest public_metrics only and the edge tables never
+# lose an edge, this keeps when things changed. Under one directory:
+#   metrics/          (at, user_id, followers_count, following_count,
+#                     tweet_count), a row only when a user's counts differ
+#                     from the last ones recorded
+#   following/,       (at, user_id, target_id, added) events: an edge added or
+#   followers/        removed between two crawls of the user's list
+# Crawled lists are buffered and diffed with the lists last recorded on flush,
+# all of them at once as one sorted merge of (user, target) arrays. A list cut
+# short (max_pages, a resumed chain, an error page) can only add edges.
+# Files are zstd Parquet, sorted by user and target with the id and time
+# columns delta encoded, written aside and renamed in so readers never see a
+# partial file. Nothing is ever rewritten: the state at any moment is the
+# replay of the events up to it (edges_as_of(), graph_as_of(),
+# metrics_as_of()), no full copy is kept. seed() records the database as it
+# is, the baseline the first crawls are diffed with.
+
+MAX_ROWS = 1_000_000
+METRICS = ["followers_count", "following_count", "tweet_count"]
+# Edge direction of every table: following rows are user -> target, followers
+# rows are target (the follower) -> user
+EDGE_TABLES = {"following": False, "followers": True}
+
+METRICS_SCHEMA = pa.schema(
+    [("at", pa.timestamp("us")), ("user_id", pa.int64())]
+    + [(name, pa.int64()) for name in METRICS]
+)
+EVENTS_SCHEMA = pa.schema(
+    [
+        ("at", pa.timestamp("us")),
+        ("user_id", pa.int64()),
+        ("target_id", pa.int64()),
+        ("added", pa.bool_()),
+    ]
+)
+# Sorted ids and times differ by little from one row to the next
+ENCODINGS = {"at": "DELTA_BINARY_PACKED", "user_id": "DELTA_BINARY_PACKED"}
+EVENT_ENCODINGS = dict(ENCODINGS, target_id="DELTA_BINARY_PACKED")
+
+EMPTY = np.empty(0, dtype=np.int64)
+
+
+def now():
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def moment(at=None):
+    return np.datetime64(at or now(), "us")
+
+
+# Mask of the first row of every run of equal keys, rows sorted by the keys
+def first_of_groups(*keys):
+    first = np.ones(len(keys[0]), dtype=bool)
+    if len(first):
+        first[1:] = False
+        for key in keys:
+            first[1:] |= key[1:] != key[:-1]
+    return first
+
+
+# Mask of the last row of every run of equal keys
+def last_of_groups(*keys):
+    return np.roll(first_of_groups(*keys), -1)
+
+
+# Edges alive after replaying events, as (user ids, target ids) sorted by both
+def replay(users, targets, added, at):
+    order = np.lexsort((at, targets, users))
+    users, targets, added = users[order], targets[order], added[order]
+    alive = last_of_groups(users, targets) & added
+    return users[alive], targets[alive]
+
+
+# Mask of the entries of `ids` that are in `sorted_ids`
+def member(ids, sorted_ids):
+    if not len(sorted_ids):
+        return np.zeros(len(ids), dtype=bool)
+    position = np.minimum(np.searchsorted(sorted_ids, ids), len(sorted_ids) - 1)
+    return sorted_ids[position] == ids
+
+
+class History:
+    def __init__(self, directory, max_rows=MAX_ROWS):
+        self.directory = directory
+        self.max_rows = max_rows
+        self.files = 0
+        # Rows written since the history was opened
+        self.metrics_written = 0
+        self.events_written = 0
+        self._sequence = 0
+        # Metrics as (at, user ids, values) and crawled lists as (at, user id,
+        # target id chunks, complete), buffered until the next flush
+        self._metrics = []
+        self._crawled = {table: [] for table in EDGE_TABLES}
+        self._buffered = 0
+        # Lists being crawled: (table, user id) -> (target id chunks, complete)
+        self._lists = {}
+        # Latest written state, loaded on first use: metrics as (sorted user
+        # ids, values), edges as (user ids, target ids) sorted by both
+        self._latest_metrics = None
+        self._edges = {}
+        os.makedirs(directory, exist_ok=True)
+
+    def _dataset(self, kind, schema):
+        path = os.path.join(self.directory, kind)
+        files = sorted(os.listdir(path)) if os.path.isdir(path) else []
+        return ds.dataset(
+            [os.path.join(path, name) for name in files if name.endswith(".parquet")],
+            schema=schema,
+            format="parquet",
+        )
+
+    def _write(self, kind, columns, schema, encodings):
+        path = os.path.join(self.directory, kind)
+        os.makedirs(path, exist_ok=True)
+        # Names sort in the order the files were written
+        stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S")
+        self._sequence += 1
+        name = os.path.join(path, f"{kind}-{stamp}-{os.getpid()}-{self._sequence:04d}.parquet")
+        table = pa.Table.from_arrays(
+            [pa.array(column, field.type) for column, field in zip(columns, schema)],
+            schema=schema,
+        )
+        pq.write_table(
+            table,
+            name + ".tmp",
+            compression="zstd",
+            use_dictionary=False,
+            column_encoding=encodings,
+        )
+        os.replace(name + ".tmp", name)
+        self.files += 1
+        return table.num_rows
+
+    # Rows of a dataset, optionally of some users and in [start, end) or up
+    # to and including `until`
+    def _read(self, kind, schema, user_ids=None, start=None, end=None, until=None):
+        condition = ds.scalar(True)
+        if user_ids is not None:
+            condition &= ds.field("user_id").isin(pa.array(list(user_ids), pa.int64()))
+        if start is not None:
+            condition &= ds.field("at") >= moment(start)
+        if end is not None:
+            condition &= ds.field("at") < moment(end)
+        if until is not None:
+            condition &= ds.field("at") <= moment(until)
+        return self._dataset(kind, schema).to_table(filter=condition)
+
+    # Metrics
+
+    # Record the public_metrics of users, rows as user_hydration.user_row()
+    # makes them. Rows without metrics are left out, and on flush the rows of
+    # users whose counts did not change since they were last recorded.
+    def record_metrics(self, rows, at=None):
+        rows = [row for row in rows if all(row.get(name) is not None for name in METRICS)]
+        if not rows:
+            return
+        self._metrics.append(
+            (
+                moment(at),
+                np.array([row["id"] for row in rows], dtype=np.int64),
+                np.array([[row[name] for name in METRICS] for row in rows], dtype=np.int64),
+            )
+        )
+        self._buffered += len(rows)
+        self.flush_if_due()
+
+    def _load_metrics(self):
+        if self._latest_metrics is None:
+            table = self.metrics_as_of(flush=False)
+            self._latest_metrics = (
+                table.column("user_id").to_numpy(),
+                np.column_stack([table.column(name).to_numpy() for name in METRICS])
+                if table.num_rows
+                else np.empty((0, len(METRICS)), dtype=np.int64),
+            )
+        return self._latest_metrics
+
+    # Write the buffered rows that differ from the row before them of the
+    # same user, the stored one for the first
+    def _flush_metrics(self):
+        moments = np.concatenate([np.full(len(ids), at) for at, ids, _ in self._metrics])
+        user_ids = np.concatenate([ids for _, ids, _ in self._metrics])
+        values = np.concatenate([values for _, _, values in self._metrics])
+        order = np.lexsort((moments, user_ids))
+        moments, user_ids, values = moments[order], user_ids[order], values[order]
+        stored_ids, stored_values = self._load_metrics()
+        first = first_of_groups(user_ids)
+        stored = first & member(user_ids, stored_ids)
+        previous = np.empty_like(values)
+        previous[1:] = values[:-1]
+        previous[stored] = stored_values[np.searchsorted(stored_ids, user_ids[stored])]
+        changed = (values != previous).any(axis=1) | (first & ~stored)
+        if changed.any():
+            self.metrics_written += self._write(
+                "metrics",
+                [moments[changed], user_ids[changed]] + list(values[changed].T),
+                METRICS_SCHEMA,
+                ENCODINGS,
+            )
+        # The last row of every user is the latest state
+        last = last_of_groups(user_ids)
+        kept = ~member(stored_ids, user_ids[last])
+        user_ids = np.concatenate([stored_ids[kept], user_ids[last]])
+        values = np.concatenate([stored_values[kept], values[last]])
+        order = np.argsort(user_ids, kind="stable")
+        self._latest_metrics = (user_ids[order], values[order])
+        self._metrics = []
+
+    # The counts of every user at `at` (default now), from the last row
+    # recorded at or before it. Users first recorded later are left out.
+    def metrics_as_of(self, at=None, flush=True):
+        if flush:
+            self.flush()
+        table = self._read("metrics", METRICS_SCHEMA, until=at)
+        user_ids = table.column("user_id").to_numpy()
+        order = np.lexsort((table.column("at").to_numpy(), user_ids))
+        latest = order[last_of_groups(user_ids[order])]
+        return table.take(pa.array(latest, pa.int64())).drop_columns(["at"])
+
+    # Time series of the counts sorted by user and time, optionally of some
+    # users and in [start, end)
+    def metrics_series(self, user_ids=None, start=None, end=None):
+        self.flush()
+        table = self._read("metrics", METRICS_SCHEMA, user_ids, start, end)
+        return table.sort_by([("user_id", "ascending"), ("at", "ascending")])
+
+    # Edges
+
+    # The crawl of a user's list begins. Removals are only recorded for lists
+    # walked from the first page, so a resumed chain counts as cut short.
+    def start_list(self, table, user_id, resumed=False):
+        self._lists[(table, int(user_id))] = ([], not resumed)
+
+    # One page of a user's list; error is True when the page reported errors
+    # instead of data, then the list is not known in full
+    def add_edges(self, table, user_id, target_ids, error=False):
+        key = (table, int(user_id))
+        chunks, complete = self._lists.get(key, ([], False))
+        chunks.append(np.asarray(target_ids, dtype=np.int64))
+        self._lists[key] = (chunks, complete and not error)
+
+    # The user's list is done, truncated is True when max_pages cut it short
+    def end_list(self, table, user_id, truncated=False, at=None):
+        user_id = int(user_id)
+        chunks, complete = self._lists.pop((table, user_id), ([], False))
+        self._crawled[table].append((moment(at), user_id, chunks, complete and not truncated))
+        self._buffered += sum(len(chunk) for chunk in chunks) + 1
+        self.flush_if_due()
+
+    def _load_edges(self, table):
+        if table not in self._edges:
+            self._edges[table] = self.edges_as_of(table, flush=False)
+        return self._edges[table]
+
+    # Diff crawled lists with the stored ones and write the changes. Per list
+    # (sorted by user, one per user): user id, time and whether it is
+    # complete. Per edge: user and target id.
+    def _apply(self, table, list_users, list_moments, list_complete, users, targets):
+        stored_users, stored_targets = self._load_edges(table)
+        old = member(stored_users, list_users)
+        # Pairs of the crawled users as one int64 each, the user's position
+        # times the number of targets plus the target's position: the keys
+        # sort as the pairs do, by user then target
+        target_ids, codes = np.unique(
+            np.concatenate([stored_targets[old], targets]), return_inverse=True
+        )
+        size = len(target_ids)
+        old_keys = np.searchsorted(list_users, stored_users[old]) * size + codes[: old.sum()]
+        new_keys = np.sort(np.searchsorted(list_users, users) * size + codes[old.sum() :])
+        new_keys = new_keys[first_of_groups(new_keys)]
+        # Both key arrays are sorted, a stable sort of the two merges them in
+        # one pass. Keys on one side only were added or removed.
+        keys = np.concatenate([old_keys, new_keys])
+        order = np.argsort(keys, kind="stable")
+        keys = keys[order]
+        crawled = order >= len(old_keys)
+        single = first_of_groups(keys) & last_of_groups(keys)
+        positions = keys // size
+        complete = list_complete[positions]
+        # Lists cut short lose nothing
+        changed = single & (crawled | complete)
+        if changed.any():
+            self.events_written += self._write(
+                table,
+                [
+                    list_moments[positions[changed]],
+                    list_users[positions[changed]],
+                    target_ids[keys[changed] % size],
+                    crawled[changed],
+                ],
+                EVENTS_SCHEMA,
+                EVENT_ENCODINGS,
+            )
+        alive = keys[(crawled | ~single | ~complete) & first_of_groups(keys)]
+        users = np.concatenate([stored_users[~old], list_users[alive // size]])
+        targets = np.concatenate([stored_targets[~old], target_ids[alive % size]])
+        if not old.all():
+            # Every user's edges come from one side, ordering by user is enough
+            order = np.argsort(users, kind="stable")
+            users, targets = users[order], targets[order]
+        self._edges[table] = (users, targets)
+
+    def _flush_edges(self, table):
+        # A user crawled twice since the last flush keeps its last list
+        lists = {
+            user_id: (at, chunks, complete)
+            for at, user_id, chunks, complete in self._crawled[table]
+        }
+        list_users = np.array(sorted(lists), dtype=np.int64)
+        lists = [lists[user_id] for user_id in list_users.tolist()]
+        chunks = [
+            (user_id, chunk)
+            for user_id, (_, user_chunks, _) in zip(list_users, lists)
+            for chunk in user_chunks
+        ]
+        self._apply(
+            table,
+            list_users,
+            np.array([at for at, _, _ in lists], dtype="datetime64[us]"),
+            np.array([complete for _, _, complete in lists], dtype=bool),
+            np.repeat(
+                np.array([user_id for user_id, _ in chunks], dtype=np.int64),
+                [len(chunk) for _, chunk in chunks],
+            ),
+            np.concatenate([chunk for _, chunk in chunks]) if chunks else EMPTY,
+        )
+        self._crawled[table] = []
+
+    # The edges of `table` at `at` (default now) as (user ids, target ids),
+    # sorted by user then target
+    def edges_as_of(self, table, at=None, flush=True):
+        if flush:
+            self.flush()
+        events = self._read(table, EVENTS_SCHEMA, until=at)
+        return replay(
+            events.column("user_id").to_numpy(),
+            events.column("target_id").to_numpy(),
+            events.column("added").to_numpy(zero_copy_only=False),
+            events.column("at").to_numpy(),
+        )
+
+    # Edge events of `table` sorted by time and user, optionally of some users
+    # and in [start, end)
+    def edge_events(self, table, user_ids=None, start=None, end=None):
+        self.flush()
+        events = self._read(table, EVENTS_SCHEMA, user_ids, start, end)
+        return events.sort_by([("at", "ascending"), ("user_id", "ascending")])
+
+    # The follow graph at `at` (network_graph.Graph, edge u -> v meaning u
+    # follows v) from both edge tables
+    def graph_as_of(self, at=None):
+        from network_graph import Graph
+
+        sources = []
+        targets = []
+        for table, reversed_edges in EDGE_TABLES.items():
+            users, target_ids = self.edges_as_of(table, at)
+            sources.append(target_ids if reversed_edges else users)
+            targets.append(users if reversed_edges else target_ids)
+        return Graph.from_edges(EMPTY, np.concatenate(sources), np.concatenate(targets))
+
+    # Writing
+
+    def flush_if_due(self):
+        if self._buffered >= self.max_rows:
+            self.flush()
+
+    # Diff everything buffered with the latest state and write the changes,
+    # one file per kind
+    def flush(self):
+        if self._metrics:
+            self._flush_metrics()
+        for table in EDGE_TABLES:
+            if self._crawled[table]:
+                self._flush_edges(table)
+        self._buffered = 0
+
+    def close(self):
+        self.flush()
+
+    # Record the database as it is: the metrics of every hydrated user, and
+    # every stored edge that is not alive in the history yet as added now.
+    # The edge tables never lose rows, so nothing is removed. Returns the
+    # (metric rows, edge events) written.
+    def seed(self, session):
+        from sqlalchemy import select
+        from edge_loader import read_ids
+        from models import User
+
+        at = moment()
+        start_time = time.time()
+        metrics_written, events_written = self.metrics_written, self.events_written
+        result = session.execute(
+            select(User.id, *(getattr(User, name) for name in METRICS))
+            .where(User.followers_count.isnot(None))
+            .execution_options(yield_per=MAX_ROWS)
+        )
+        for rows in result.partitions(MAX_ROWS):
+            self.record_metrics([dict(zip(["id"] + METRICS, row)) for row in rows], at)
+        session.commit()
+        self.flush()
+        for table, reversed_edges in EDGE_TABLES.items():
+            target = "follower_id" if reversed_edges else "following_id"
+            stored = read_ids(session, table, ["user_id", target])
+            list_users = np.unique(stored[:, 0])
+            self._apply(
+                table,
+                list_users,
+                np.full(len(list_users), at),
+                np.zeros(len(list_users), dtype=bool),
+                stored[:, 0],
+                stored[:, 1],
+            )
+        metrics_written = self.metrics_written - metrics_written
+        events_written = self.events_written - events_written
+        print(
+            f"Seeded the history with {metrics_written} metric rows and {events_written} "
+            f"edges in {time.time() - start_time:.1f} seconds."
+        )
+        return metrics_written, events_written
@@ -0,0 +1,261 @@
+import os
+import re
+import time
+from collections import deque
+from multiprocessing import Pool
+from sqlalchemy import select, update
+from models import User, Tweet, Mention, Hashtag, TweetReference
+from response_archive import archive_files, iter_records
+from thread_index import mark_conversations, register_thread_updates
+from text_search import normalize
+
+# Interaction graph of the collected tweets: mentions, hashtags and the tweets
+# a tweet replies to, retweets or quotes, stored in the mentions, hashtags and
+# tweet_references tables. The search and timeline endpoints ask for
+# INTERACTION_FIELDS and store the rows with every page, so the graph costs no
+# request of its own. backfill_tweets() derives them from the text of tweets
+# stored before that (hashtags, @mentions and "RT @user:" retweets, users
+# resolved by username), backfill_archive() from the full API objects in the
+# response archive. Both parse in worker processes while the main process
+# writes, and both can run any number of times. The weighted graph is loaded
+# with network_graph.load_interaction_graph().
+
+INTERACTION_FIELDS = "entities,referenced_tweets,in_reply_to_user_id"
+BATCH_SIZE = 10_000
+
+HASHTAG = re.compile(r"#(\w+)")
+MENTION = re.compile(r"(?<![\w@])@(\w{1,15})")
+RETWEET = re.compile(r"^RT @(\w{1,15}):")
+
+# Edges of every interaction kind: table, (source, target) columns, condition
+KINDS = {
+    "mention": ("mentions", ["author_id", "user_id"], None),
+    "reply": ("tweet_references", ["author_id", "referenced_author_id"], "kind = 'replied_to'"),
+    "retweet": ("tweet_references", ["author_id", "referenced_author_id"], "kind = 'retweeted'"),
+    "quote": ("tweet_references", ["author_id", "referenced_author_id"], "kind = 'quoted'"),
+}
+
+
+# Declare the interaction tables, after Tweet so tweets are written first.
+# Text-derived retweets lack the referenced tweet, whichever source knows more
+# fills in the rest.
+def register_interactions(writer):
+    writer.register(Mention, conflict="nothing")
+    writer.register(Hashtag, conflict="nothing")
+    writer.register(
+        TweetReference, conflict="merge", update=["referenced_id", "referenced_author_id"]
+    )
+
+
+# Interaction rows of one v2 tweet object as (mentions, hashtags, references).
+# Timeline tweets do not name their author, pass it as author_id.
+def interaction_rows(tweet, author_id=None):
+    tweet_id = int(tweet["id"])
+    author_id = int(tweet.get("author_id") or author_id)
+    entities = tweet.get("entities") or {}
+    mentions = [
+        {"tweet_id": tweet_id, "user_id": int(mention["id"]), "author_id": author_id}
+        for mention in entities.get("mentions", [])
+        if mention.get("id")
+    ]
+    hashtags = [
+        {"tweet_id": tweet_id, "tag": normalize(hashtag["tag"])}
+        for hashtag in entities.get("hashtags", [])
+    ]
+    references = []
+    for reference in tweet.get("referenced_tweets") or []:
+        referenced_author_id = None
+        if reference["type"] == "replied_to" and tweet.get("in_reply_to_user_id"):
+            referenced_author_id = int(tweet["in_reply_to_user_id"])
+        references.append(
+            {
+                "tweet_id": tweet_id,
+                "kind": reference["type"],
+                "referenced_id": int(reference["id"]),
+                "author_id": author_id,
+                "referenced_author_id": referenced_author_id,
+            }
+        )
+    return mentions, hashtags, references
+
+
+# Buffer the interactions of a page of v2 tweet objects
+def add_interactions(writer, tweets, author_id=None):
+    for tweet in tweets:
+        mentions, hashtags, references = interaction_rows(tweet, author_id)
+        writer.add_many(Mention, mentions)
+        writer.add_many(Hashtag, hashtags)
+        writer.add_many(TweetReference, references)
+
+
+# Set the referenced author of retweets and quotes whose referenced tweet is
+# stored. On partitioned PostgreSQL an id is not unique on its own, one of
+# its rows is enough. Returns the number of references updated.
+def resolve_reference_authors(session):
+    referenced_author = (
+        select(Tweet.author_id)
+        .where(Tweet.id == TweetReference.referenced_id)
+        .limit(1)
+        .scalar_subquery()
+    )
+    result = session.execute(
+        update(TweetReference)
+        .where(
+            TweetReference.referenced_author_id.is_(None),
+            TweetReference.referenced_id.in_(select(Tweet.id)),
+        )
+        .values(referenced_author_id=referenced_author)
+    )
+    session.commit()
+    return result.rowcount
+
+
+# Worker: hashtag rows and the mentioned and retweeted usernames of a batch of
+# (tweet id, author id, text)
+def parse_texts(batch):
+    hashtags = []
+    mentions = []
+    retweets = []
+    for tweet_id, author_id, text in batch:
+        for tag in set(normalize(tag) for tag in HASHTAG.findall(text)):
+            hashtags.append({"tweet_id": tweet_id, "tag": tag})
+        for username in set(MENTION.findall(text)):
+            mentions.append((tweet_id, author_id, username.lower()))
+        retweet = RETWEET.match(text)
+        if retweet:
+            retweets.append((tweet_id, author_id, retweet.group(1).lower()))
+    return hashtags, mentions, retweets
+
+
+# Worker: interaction rows of every search and timeline page in one archive
+# file, and the conversations its replies belong to
+def parse_archive_file(path):
+    mentions = []
+    hashtags = []
+    references = []
+    conversations = set()
+    for record in iter_records(path):
+        if record["endpoint"] not in ("search", "tweets"):
+            continue
+        author_id = record["key"] if record["endpoint"] == "tweets" else None
+        for tweet in record["body"].get("data", []):
+            rows = interaction_rows(tweet, author_id)
+            mentions.extend(rows[0])
+            hashtags.extend(rows[1])
+            references.extend(rows[2])
+            if tweet.get("conversation_id") and any(
+                reference["kind"] == "replied_to" for reference in rows[2]
+            ):
+                conversations.add(int(tweet["conversation_id"]))
+    return mentions, hashtags, references, conversations
+
+
+# Stream (id, author id, text) of the stored tweets in id order
+def iter_tweet_batches(session, batch_size=BATCH_SIZE):
+    last_id = None
+    while True:
+        query = select(Tweet.id, Tweet.author_id, Tweet.text).where(
+            Tweet.text.isnot(None), Tweet.author_id.isnot(None)
+        )
+        if last_id is not None:
+            query = query.where(Tweet.id > last_id)
+        rows = session.execute(query.order_by(Tweet.id).limit(batch_size))
+        batch = [tuple(row) for row in rows]
+        session.commit()
+        if not batch:
+            return
+        yield batch
+        last_id = batch[-1][0]
+
+
+# Run `parse` on every job in worker processes and pass the results to
+# `apply` in order, with at most two jobs per worker parsed ahead
+def parallel_map(parse, jobs, apply, workers=None):
+    workers = workers or os.cpu_count()
+    with Pool(workers) as pool:
+        parsing = deque()
+        for job in jobs:
+            parsing.append(pool.apply_async(parse, (job,)))
+            if len(parsing) >= workers * 2:
+                apply(parsing.popleft().get())
+        while parsing:
+            apply(parsing.popleft().get())
+
+
+# Derive interactions from the text of the stored tweets. Usernames are
+# resolved against users.username, mentions of accounts never stored are
+# skipped. Returns the number of rows buffered.
+def backfill_tweets(session, writer, workers=None, batch_size=BATCH_SIZE):
+    register_interactions(writer)
+    user_ids = {
+        username.lower(): user_id
+        for user_id, username in session.execute(
+            select(User.id, User.username).where(User.username.isnot(None))
+        )
+    }
+    session.commit()
+    rows = 0
+    start_time = time.time()
+
+    def apply(result):
+        nonlocal rows
+        hashtags, mentions, retweets = result
+        writer.add_many(Hashtag, hashtags)
+        rows += len(hashtags)
+        for tweet_id, author_id, username in mentions:
+            user_id = user_ids.get(username)
+            if user_id is not None:
+                writer.add(
+                    Mention, {"tweet_id": tweet_id, "user_id": user_id, "author_id": author_id}
+                )
+                rows += 1
+        for tweet_id, author_id, username in retweets:
+            writer.add(
+                TweetReference,
+                {
+                    "tweet_id": tweet_id,
+                    "kind": "retweeted",
+                    "referenced_id": None,
+                    "author_id": author_id,
+                    "referenced_author_id": user_ids.get(username),
+                },
+            )
+            rows += 1
+        writer.flush_if_due()
+
+    parallel_map(parse_texts, iter_tweet_batches(session, batch_size), apply, workers)
+    writer.flush()
+    print(
+        f"Derived {rows} interactions from stored tweets in "
+        f"{time.time() - start_time:.1f} seconds."
+    )
+    return rows
+
+
+# Derive interactions from the search and timeline pages of a response
+# archive, and queue the conversations of the replies found for
+# thread_index.build_threads(). Returns the number of rows buffered.
+def backfill_archive(directory, writer, workers=None):
+    register_interactions(writer)
+    register_thread_updates(writer)
+    paths = archive_files(directory)
+    rows = 0
+    done = 0
+    start_time = time.time()
+
+    def apply(result):
+        nonlocal rows, done
+        for model, model_rows in zip((Mention, Hashtag, TweetReference), result):
+            writer.add_many(model, model_rows)
+            rows += len(model_rows)
+        mark_conversations(writer, result[3])
+        writer.flush()
+        done += 1
+        print(f"Derived interactions from file {done} of {len(paths)}, {rows} rows.")
+
+    parallel_map(parse_archive_file, paths, apply, workers)
+    print(
+        f"Derived {rows} interactions from {len(paths)} archive files in "
+        f"{time.time() - start_time:.1f} seconds."
+    )
+    return rows
@@ -0,0 +1,110 @@
+from sqlalchemy import inspect, text
+from models import Following, Follower
+
+# One-shot migration of the following/followers tables from the surrogate
+# autoincrement id to the (user_id, target) primary key in models.py. Duplicate
+# edges are removed in place and the space reclaimed is reported per table.
+
+EDGE_TABLES = [(Following, "following_id"), (Follower, "follower_id")]
+
+
+def table_size(connection, table):
+    if connection.dialect.name == "postgresql":
+        return connection.execute(
+            text("SELECT pg_total_relation_size(:table)"), {"table": table}
+        ).scalar()
+    # SQLite keeps everything in one file, measure the whole database
+    page_count = connection.execute(text("PRAGMA page_count")).scalar()
+    page_size = connection.execute(text("PRAGMA page_size")).scalar()
+    return page_count * page_size
+
+
+def count_rows(connection, table):
+    return connection.execute(text(f"SELECT COUNT(*) FROM {table}")).scalar()
+
+
+def migrate_postgres(connection, model, target):
+    table = model.__tablename__
+    index = f"ix_{table}_{target}_user_id"
+    # Edges without both ends cannot be part of the new key
+    connection.execute(
+        text(f"DELETE FROM {table} WHERE user_id IS NULL OR {target} IS NULL")
+    )
+    # Keep the oldest copy of every edge
+    connection.execute(
+        text(
+            f"""
+            DELETE FROM {table} WHERE id IN (
+                SELECT id FROM (
+                    SELECT id, row_number() OVER (
+                        PARTITION BY user_id, {target} ORDER BY id
+                    ) AS copy
+                    FROM {table}
+                ) AS numbered
+                WHERE copy > 1
+            )
+            """
+        )
+    )
+    # Dropping the column also drops the old primary key and its sequence
+    connection.execute(text(f"ALTER TABLE {table} DROP COLUMN id"))
+    connection.execute(text(f"ALTER TABLE {table} ADD PRIMARY KEY (user_id, {target})"))
+    connection.execute(
+        text(f"CREATE INDEX IF NOT EXISTS {index} ON {table} ({target}, user_id)")
+    )
+
+
+def migrate_sqlite(connection, model, target):
+    # SQLite cannot change a primary key in place, so rebuild the table
+    table = model.__tablename__
+    connection.execute(text(f"ALTER TABLE {table} RENAME TO {table}_old"))
+    model.__table__.create(connection)
+    connection.execute(
+        text(
+            f"""
+            INSERT OR IGNORE INTO {table} (user_id, {target})
+            SELECT user_id, {target} FROM {table}_old
+            WHERE user_id IS NOT NULL AND {target} IS NOT NULL
+            ORDER BY id
+            """
+        )
+    )
+    connection.execute(text(f"DROP TABLE {table}_old"))
+
+
+def reclaim_space(engine, table):
+    # VACUUM cannot run inside a transaction block
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+        if engine.dialect.name == "postgresql":
+            connection.execute(text(f"VACUUM FULL ANALYZE {table}"))
+        else:
+            connection.execute(text("VACUUM"))
+
+
+def migrate_edges(engine):
+    for model, target in EDGE_TABLES:
+        table = model.__tablename__
+        columns = [column["name"] for column in inspect(engine).get_columns(table)]
+        if "id" not in columns:
+            print(f"{table}: already migrated.")
+            continue
+
+        with engine.begin() as connection:
+            size_before = table_size(connection, table)
+            rows_before = count_rows(connection, table)
+            if engine.dialect.name == "postgresql":
+                migrate_postgres(connection, model, target)
+            else:
+                migrate_sqlite(connection, model, target)
+            rows_after = count_rows(connection, table)
+
+        reclaim_space(engine, table)
+        with engine.connect() as connection:
+            size_after = table_size(connection, table)
+
+        print(
+            f"{table}: {rows_before} rows -> {rows_after} rows "
+            f"({rows_before - rows_after} duplicates removed), "
+            f"{size_before / 2**20:.1f} MB -> {size_after / 2**20:.1f} MB "
+            f"({(size_before - size_after) / 2**20:.1f} MB reclaimed)"
+        )
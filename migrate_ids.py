@@ -0,0 +1,372 @@
+import time
+from sqlalchemy import BigInteger, Integer, inspect, text
+from models import User, Tweet, Following, Follower, CrawlState, TimelineSync, WorkItem
+from models import created_on
+from migrate_edges import count_rows, table_size
+
+# Migration of the Twitter id columns from VARCHAR to the BIGINT schema in
+# models.py, with foreign keys from the edge targets to users. On PostgreSQL it
+# runs online, the grabbers keep reading and writing until the final swap:
+#   1. every table gets a BIGINT shadow column per id column, which a trigger
+#      fills for rows inserted or updated from now on
+#   2. existing rows are backfilled in primary key order, one short
+#      transaction per batch
+#   3. the new primary keys and indexes are built CONCURRENTLY, and CHECK
+#      constraints validated without blocking writes prove the key columns
+#      NOT NULL, so the swap does not have to scan
+#   4. one short transaction swaps the shadow columns in, turns the unique
+#      indexes into primary keys and adds the foreign keys NOT VALID
+#   5. users that edges or tweets point to but that are not stored get
+#      placeholder rows, then the foreign keys are validated, again without
+#      blocking writes
+# Switch the grabbers to the new code before step 4: afterwards an edge is
+# only accepted once its users exist, which the new edge endpoints take care of.
+# The dropped VARCHAR values stay in the old row versions until the tables are
+# rewritten, with --vacuum-full (locks each table while it runs) or pg_repack.
+# SQLite databases (benchmarks, local copies) are rebuilt in one transaction.
+
+MODELS = [User, Tweet, Following, Follower, CrawlState, TimelineSync, WorkItem]
+
+# (table, column) pairs referencing users.id
+FOREIGN_KEYS = [
+    (model.__tablename__, column.name)
+    for model in MODELS
+    for column in model.__table__.columns
+    for foreign_key in column.foreign_keys
+    if foreign_key.column.table is User.__table__
+]
+
+
+def id_columns(model):
+    return [
+        column.name
+        for column in model.__table__.columns
+        if isinstance(column.type, BigInteger)
+    ]
+
+
+def shadow(column):
+    return f"{column}_bigint"
+
+
+# Models whose table exists with id columns that are not integers yet
+def pending_models(engine):
+    inspector = inspect(engine)
+    pending = []
+    for model in MODELS:
+        table = model.__tablename__
+        if not inspector.has_table(table):
+            continue
+        columns = {column["name"]: column["type"] for column in inspector.get_columns(table)}
+        if table in ("following", "followers") and "id" in columns:
+            raise SystemExit(f"{table} still has the surrogate id, run `prostreno.py migrate`.")
+        if any(not isinstance(columns[name], Integer) for name in id_columns(model)):
+            pending.append(model)
+    return pending
+
+
+def index_size(connection, table):
+    if connection.dialect.name == "postgresql":
+        return connection.execute(
+            text("SELECT pg_indexes_size(:table)"), {"table": table}
+        ).scalar()
+    return None
+
+
+# Step 1: shadow columns and the trigger keeping them in sync
+def add_shadow_columns(engine, model):
+    table = model.__tablename__
+    columns = id_columns(model)
+    assignments = " ".join(f"NEW.{shadow(column)} := NEW.{column}::bigint;" for column in columns)
+    with engine.begin() as connection:
+        if model is User:
+            connection.execute(text("ALTER TABLE users ADD COLUMN IF NOT EXISTS placeholder BOOLEAN"))
+        for column in columns:
+            connection.execute(
+                text(f"ALTER TABLE {table} ADD COLUMN IF NOT EXISTS {shadow(column)} BIGINT")
+            )
+        connection.execute(
+            text(
+                f"""
+                CREATE OR REPLACE FUNCTION {table}_bigint_sync() RETURNS trigger AS $$
+                BEGIN {assignments} RETURN NEW; END
+                $$ LANGUAGE plpgsql
+                """
+            )
+        )
+        connection.execute(text(f"DROP TRIGGER IF EXISTS {table}_bigint_sync ON {table}"))
+        connection.execute(
+            text(
+                f"CREATE TRIGGER {table}_bigint_sync BEFORE INSERT OR UPDATE ON {table} "
+                f"FOR EACH ROW EXECUTE FUNCTION {table}_bigint_sync()"
+            )
+        )
+
+
+# Step 2: fill the shadow columns of the existing rows, batch_size rows per
+# transaction, walking the old primary key. Returns the rows updated.
+def backfill(engine, model, batch_size):
+    table = model.__tablename__
+    key = [column.name for column in model.__table__.primary_key]
+    key_list = ", ".join(key)
+    assignments = ", ".join(
+        f"{shadow(column)} = {column}::bigint" for column in id_columns(model)
+    )
+    last = None
+    updated = 0
+    while True:
+        params = {"skip": batch_size - 1}
+        after = "TRUE"
+        if last is not None:
+            after = f"({key_list}) > ({', '.join(f':last{n}' for n in range(len(key)))})"
+            params.update({f"last{n}": value for n, value in enumerate(last)})
+        with engine.begin() as connection:
+            upper = connection.execute(
+                text(
+                    f"SELECT {key_list} FROM {table} WHERE {after} "
+                    f"ORDER BY {key_list} OFFSET :skip LIMIT 1"
+                ),
+                params,
+            ).first()
+            bounds = after
+            if upper is not None:
+                bounds += f" AND ({key_list}) <= ({', '.join(f':upper{n}' for n in range(len(key)))})"
+                params.update({f"upper{n}": value for n, value in enumerate(upper)})
+            updated += connection.execute(
+                text(f"UPDATE {table} SET {assignments} WHERE {bounds}"), params
+            ).rowcount
+        if upper is None:
+            return updated
+        last = tuple(upper)
+
+
+# (name, columns, unique) of the primary key and every index in models.py that
+# PostgreSQL gets, SQLite-only ones such as ux_tweets_id are left out
+def model_indexes(model):
+    table = model.__table__
+    indexes = [(f"{table.name}_pkey", [column.name for column in table.primary_key], True)]
+    for index in table.indexes:
+        if not created_on(index, "postgresql"):
+            continue
+        indexes.append((index.name, [column.name for column in index.columns], index.unique))
+    return indexes
+
+
+# Step 3: indexes on the shadow columns and NOT NULL checks for the key
+def build_indexes(engine, model):
+    table = model.__tablename__
+    columns = id_columns(model)
+    key = [column.name for column in model.__table__.primary_key]
+    # CONCURRENTLY cannot run inside a transaction block
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+        for name, index_columns, unique in model_indexes(model):
+            indexed = ", ".join(
+                shadow(column) if column in columns else column for column in index_columns
+            )
+            # An interrupted build leaves an invalid index behind, start over
+            connection.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {name}_bigint"))
+            connection.execute(
+                text(
+                    f"CREATE {'UNIQUE ' if unique else ''}INDEX CONCURRENTLY {name}_bigint "
+                    f"ON {table} ({indexed})"
+                )
+            )
+        for column in columns:
+            if column not in key:
+                continue
+            check = f"{table}_{shadow(column)}_not_null"
+            connection.execute(text(f"ALTER TABLE {table} DROP CONSTRAINT IF EXISTS {check}"))
+            connection.execute(
+                text(
+                    f"ALTER TABLE {table} ADD CONSTRAINT {check} "
+                    f"CHECK ({shadow(column)} IS NOT NULL) NOT VALID"
+                )
+            )
+            connection.execute(text(f"ALTER TABLE {table} VALIDATE CONSTRAINT {check}"))
+
+
+# Step 4: swap every table over in one transaction
+def swap(engine, models, lock_timeout):
+    inspector = inspect(engine)
+    foreign_keys = [
+        (model.__tablename__, foreign_key["name"])
+        for model in MODELS
+        if inspector.has_table(model.__tablename__)
+        for foreign_key in inspector.get_foreign_keys(model.__tablename__)
+    ]
+    with engine.begin() as connection:
+        # Give up rather than queue every other query behind the swap's locks
+        connection.execute(text(f"SET LOCAL lock_timeout = '{lock_timeout}s'"))
+        for table, name in foreign_keys:
+            connection.execute(text(f"ALTER TABLE {table} DROP CONSTRAINT {name}"))
+        for model in models:
+            table = model.__tablename__
+            key = [column.name for column in model.__table__.primary_key]
+            connection.execute(text(f"DROP TRIGGER {table}_bigint_sync ON {table}"))
+            connection.execute(text(f"DROP FUNCTION {table}_bigint_sync()"))
+            # Dropping the old columns drops the old primary key and indexes
+            for column in id_columns(model):
+                connection.execute(text(f"ALTER TABLE {table} DROP COLUMN {column}"))
+                connection.execute(
+                    text(f"ALTER TABLE {table} RENAME COLUMN {shadow(column)} TO {column}")
+                )
+            for name, _, _ in model_indexes(model):
+                if name == f"{table}_pkey":
+                    connection.execute(
+                        text(
+                            f"ALTER TABLE {table} ADD CONSTRAINT {name} "
+                            f"PRIMARY KEY USING INDEX {name}_bigint"
+                        )
+                    )
+                else:
+                    connection.execute(text(f"ALTER INDEX {name}_bigint RENAME TO {name}"))
+            for column in id_columns(model):
+                if column in key:
+                    connection.execute(
+                        text(
+                            f"ALTER TABLE {table} DROP CONSTRAINT "
+                            f"{table}_{shadow(column)}_not_null"
+                        )
+                    )
+        for table, column in FOREIGN_KEYS:
+            if inspector.has_table(table):
+                connection.execute(
+                    text(
+                        f"ALTER TABLE {table} ADD CONSTRAINT {table}_{column}_fkey "
+                        f"FOREIGN KEY ({column}) REFERENCES users (id) NOT VALID"
+                    )
+                )
+
+
+# Step 5: placeholder users for dangling references. Returns the rows added.
+def add_placeholders(connection, inspector):
+    added = 0
+    for table, column in FOREIGN_KEYS:
+        if not inspector.has_table(table):
+            continue
+        added += connection.execute(
+            text(
+                f"""
+                INSERT INTO users (id, placeholder)
+                SELECT DISTINCT {column}, TRUE FROM {table} AS referencing
+                WHERE {column} IS NOT NULL AND NOT EXISTS (
+                    SELECT 1 FROM users WHERE users.id = referencing.{column}
+                )
+                ON CONFLICT (id) DO NOTHING
+                """
+            )
+        ).rowcount
+    return added
+
+
+def validate_foreign_keys(engine):
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+        for table, column in FOREIGN_KEYS:
+            if inspect(engine).has_table(table):
+                connection.execute(
+                    text(f"ALTER TABLE {table} VALIDATE CONSTRAINT {table}_{column}_fkey")
+                )
+                connection.execute(text(f"ANALYZE {table}"))
+
+
+def migrate_postgres(engine, models, batch_size, lock_timeout):
+    for model in models:
+        add_shadow_columns(engine, model)
+    for model in models:
+        start = time.time()
+        rows = backfill(engine, model, batch_size)
+        print(f"{model.__tablename__}: backfilled {rows} rows in {time.time() - start:.0f}s.")
+    for model in models:
+        build_indexes(engine, model)
+    swap(engine, models, lock_timeout)
+    with engine.begin() as connection:
+        added = add_placeholders(connection, inspect(engine))
+    print(f"Added {added} placeholder users.")
+    validate_foreign_keys(engine)
+
+
+# SQLite cannot change column types in place, so rebuild the tables
+def migrate_sqlite(engine, models):
+    inspector = inspect(engine)
+    old_columns = {
+        model: {column["name"] for column in inspector.get_columns(model.__tablename__)}
+        for model in models
+    }
+    with engine.begin() as connection:
+        for model in models:
+            table = model.__tablename__
+            columns = id_columns(model)
+            # The old indexes keep their names until the old table is gone
+            for index in model.__table__.indexes:
+                connection.execute(text(f"DROP INDEX IF EXISTS {index.name}"))
+            connection.execute(text(f"ALTER TABLE {table} RENAME TO {table}_old"))
+            model.__table__.create(connection)
+            names = [
+                column.name
+                for column in model.__table__.columns
+                if column.name in old_columns[model]
+            ]
+            values = [
+                f"CAST({name} AS INTEGER)" if name in columns else name for name in names
+            ]
+            connection.execute(
+                text(
+                    f"INSERT INTO {table} ({', '.join(names)}) "
+                    f"SELECT {', '.join(values)} FROM {table}_old"
+                )
+            )
+            connection.execute(text(f"DROP TABLE {table}_old"))
+        added = add_placeholders(connection, inspect(connection))
+    print(f"Added {added} placeholder users.")
+
+
+def vacuum(engine, tables, full=False):
+    # VACUUM cannot run inside a transaction block
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+        if engine.dialect.name == "postgresql":
+            for table in tables:
+                connection.execute(text(f"VACUUM {'FULL ' if full else ''}ANALYZE {table}"))
+        else:
+            connection.execute(text("VACUUM"))
+
+
+def migrate_ids(engine, batch_size=10_000, lock_timeout=10, vacuum_full=False):
+    models = pending_models(engine)
+    if not models:
+        print("Ids are already stored as BIGINT.")
+        return
+    postgres = engine.dialect.name == "postgresql"
+    before = {}
+    with engine.connect() as connection:
+        for model in models:
+            table = model.__tablename__
+            before[table] = (
+                count_rows(connection, table),
+                table_size(connection, table),
+                index_size(connection, table),
+            )
+
+    if postgres:
+        migrate_postgres(engine, models, batch_size, lock_timeout)
+    else:
+        migrate_sqlite(engine, models)
+
+    vacuum(engine, [model.__tablename__ for model in models], vacuum_full)
+    with engine.connect() as connection:
+        for model in models:
+            table = model.__tablename__
+            rows_before, size_before, indexes_before = before[table]
+            line = f"{table}: {rows_before} rows -> {count_rows(connection, table)} rows"
+            if postgres:
+                size = table_size(connection, table)
+                indexes = index_size(connection, table)
+                line += (
+                    f", {size_before / 2**20:.1f} MB -> {size / 2**20:.1f} MB, "
+                    f"indexes {indexes_before / 2**20:.1f} MB -> {indexes / 2**20:.1f} MB"
+                )
+            print(line)
+        # SQLite keeps everything in one file
+        if not postgres:
+            size_before = before[models[0].__tablename__][1]
+            size = table_size(connection, models[0].__tablename__)
+            print(f"database: {size_before / 2**20:.1f} MB -> {size / 2**20:.1f} MB")
@@ -0,0 +1,573 @@
+import gzip
+import json
+import math
+import random
+import re
+import threading
+import time
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+import requests
+
+# Local stand-in for the Twitter API v2, used by the benchmark scripts so the
+# grabbers can be exercised without live credentials. It also answers the
+# v1.1 timeline and app-only token endpoints tweepy.API needs, and
+# redirect_requests() points tweepy at it.
+
+
+# Build a deterministic fake user object for an id
+def fake_user(user_id):
+    number = int(user_id)
+    return {
+        "id": str(user_id),
+        "name": f"User {user_id}",
+        "username": f"user{user_id}",
+        "description": f"Description of user {user_id}",
+        "location": "Praha",
+        "created_at": f"20{10 + number % 13:02d}-0{1 + number % 9}-1{number % 10}T12:00:00.000Z",
+        "public_metrics": {
+            "followers_count": number % 5000,
+            "following_count": number % 700,
+            "tweet_count": number % 20000,
+            "listed_count": 0,
+        },
+    }
+
+
+# Deterministic list of ids connected to a user, positions start to count - 1
+def fake_edge_ids(user_id, count, salt, start=0):
+    number = int(user_id)
+    return [
+        str(1_000_000 + (number * 7919 + k * 104_729 + salt) % 9_000_000)
+        for k in range(start, count)
+    ]
+
+
+# Add mentions of one or two of the search authors, the hashtag and, for some
+# tweets, a reply, retweet or quote of a mentioned author's first tweet, to the
+# text, entities and referenced_tweets of a fake tweet
+def add_interactions(tweet, number, k):
+    mentioned = [3_000_000 + (number * 31 + k * 7 + n * 613) % 2000 for n in range(1 + k % 2)]
+    first = mentioned[0]
+    text = tweet["text"] + "".join(f" @user{user_id}" for user_id in mentioned)
+    referenced = None
+    if k % 4 == 1:
+        referenced = "replied_to"
+        text = f"@user{first} {text}"
+        tweet["in_reply_to_user_id"] = str(first)
+        tweet["conversation_id"] = str(first * 100_000 + 1)
+    elif k % 5 == 2:
+        referenced = "retweeted"
+        text = f"RT @user{first}: {text}"
+    elif k % 7 == 3:
+        referenced = "quoted"
+    if referenced:
+        tweet["referenced_tweets"] = [{"type": referenced, "id": str(first * 100_000 + 1)}]
+    tweet["text"] = text
+    tweet["entities"] = {
+        "hashtags": [{"tag": "prostreno"}],
+        "mentions": [
+            {"id": str(user_id), "username": f"user{user_id}"} for user_id in mentioned
+        ],
+    }
+    return tweet
+
+
+# Deterministic fake tweet for position `k` of a user's timeline (0 is the newest)
+def fake_tweet(user_id, k, total):
+    number = int(user_id)
+    tweet_id = number * 100_000 + (total - k)
+    day = 1 + (total - k) % 28
+    tweet = {
+        "id": str(tweet_id),
+        "text": f"Tweet {total - k} by user {user_id} #prostreno",
+        "created_at": f"2023-04-{day:02d}T{(number + k) % 24:02d}:00:00.000Z",
+        "author_id": str(user_id),
+        "conversation_id": str(tweet_id),
+        "public_metrics": {
+            "retweet_count": k % 3,
+            "reply_count": k % 2,
+            "like_count": k % 11,
+            "quote_count": 0,
+        },
+    }
+    return add_interactions(tweet, number, k)
+
+
+# Tweets matching the search query posted during hour `hour` (hours since the
+# epoch). A few a day, and a burst every evening while the show is on air.
+def search_volume(hour, burst):
+    volume = (hour * 37) % 3
+    if 17 <= hour % 24 <= 19:
+        volume += burst
+    return volume
+
+
+# Deterministic fake search result, number `j` of `count` posted during `hour`.
+# Ids grow with time, like snowflake ids do.
+def fake_search_tweet(hour, j, count):
+    timestamp = hour * 3600 + j * 3600 // count
+    tweet_id = hour * 10_000 + j
+    author_id = str(3_000_000 + (hour * 131 + j * 17) % 2000)
+    tweet = {
+        "id": str(tweet_id),
+        "text": f"Dnešní Prostřeno, tweet {j} #prostreno",
+        "created_at": format_time(timestamp),
+        "author_id": author_id,
+        "conversation_id": str(tweet_id),
+        "public_metrics": {
+            "retweet_count": j % 3,
+            "reply_count": j % 2,
+            "like_count": j % 11,
+            "quote_count": 0,
+        },
+    }
+    return add_interactions(tweet, int(author_id), j)
+
+
+# The same tweet as a v1.1 status object
+def fake_status(user_id, k, total):
+    tweet = fake_tweet(user_id, k, total)
+    created_at = datetime.fromisoformat(tweet["created_at"].replace("Z", "+00:00"))
+    metrics = tweet["public_metrics"]
+    return {
+        "id": int(tweet["id"]),
+        "id_str": tweet["id"],
+        "text": tweet["text"],
+        "created_at": created_at.strftime("%a %b %d %H:%M:%S +0000 %Y"),
+        "user": {
+            "id": int(user_id),
+            "id_str": str(user_id),
+            "name": f"User {user_id}",
+            "screen_name": f"user{user_id}",
+        },
+        "in_reply_to_status_id": None,
+        "in_reply_to_status_id_str": None,
+        "retweet_count": metrics["retweet_count"],
+        "favorite_count": metrics["like_count"],
+    }
+
+
+def parse_time(value):
+    return datetime.fromisoformat(value.replace("Z", "+00:00")).timestamp()
+
+
+def format_time(timestamp):
+    moment = datetime.fromtimestamp(timestamp, timezone.utc)
+    return moment.strftime("%Y-%m-%dT%H:%M:%S.000Z")
+
+
+# Send every request made through the requests library (which tweepy uses) to
+# https://api.twitter.com to `base_url` instead, for the rest of the process
+def redirect_requests(base_url, host="https://api.twitter.com"):
+    request = requests.Session.request
+
+    def redirected(session, method, url, *args, **kwargs):
+        if url.startswith(host):
+            url = base_url + url[len(host) :]
+        return request(session, method, url, *args, **kwargs)
+
+    requests.Session.request = redirected
+
+
+class QuietHTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    # Clients that hang up mid-request (e.g. an interrupted crawl) are expected
+    def handle_error(self, request, client_address):
+        pass
+
+
+class MockTwitterAPI:
+    # suspended, missing: user ids reported in the errors array of /2/users
+    # latency:            seconds every request takes to answer
+    # max_edges:          cap on following/followers per user
+    # max_tweets:         cap on timeline length per user
+    # rate_limit:         (requests, window seconds) per token and endpoint, None for no limit
+    # token_limits:       per bearer token overrides of rate_limit
+    # search_burst:       tweets per evening hour in the full-archive search
+    # hubs:               {user id: followers_count} for accounts much larger
+    #                     than fake_user() makes them
+    # error_rate:         share of requests answered with one of error_statuses
+    #                     instead, drawn from a generator seeded with `seed`
+    # compress:           gzip response bodies for clients that accept it
+    # connect_latency:    seconds every new connection takes to set up, like
+    #                     the TCP and TLS handshakes with the real API
+    def __init__(
+        self,
+        suspended=(),
+        missing=(),
+        latency=0.0,
+        max_edges=1000,
+        max_tweets=200,
+        rate_limit=None,
+        token_limits=None,
+        search_burst=40,
+        hubs=None,
+        error_rate=0.0,
+        error_statuses=(500, 503),
+        seed=0,
+        compress=False,
+        connect_latency=0.0,
+    ):
+        self.suspended = set(str(user_id) for user_id in suspended)
+        self.missing = set(str(user_id) for user_id in missing)
+        self.latency = latency
+        self.max_edges = max_edges
+        self.max_tweets = max_tweets
+        self.rate_limit = rate_limit
+        self.token_limits = token_limits or {}
+        self.search_burst = search_burst
+        self.hubs = {str(user_id): count for user_id, count in (hubs or {}).items()}
+        self.error_rate = error_rate
+        self.error_statuses = error_statuses
+        self._random = random.Random(seed)
+        self.compress = compress
+        self.connect_latency = connect_latency
+        self.connections = 0
+        self.bytes_sent = 0
+        self.request_count = 0
+        self.request_counts = {}
+        self.rate_limited = 0
+        self.errors = 0
+        # Seconds the server sat with no request in flight since it started
+        self._idle_time = 0.0
+        self._in_flight = 0
+        self._idle_since = None
+        self._windows = {}
+        # Tweets posted per user since the server started, see post_tweets()
+        self._new_tweets = {}
+        self._lock = threading.Lock()
+        self._routes = [
+            (re.compile(r"^/2/users$"), self._users_lookup),
+            (re.compile(r"^/2/users/(\d+)/following$"), self._following),
+            (re.compile(r"^/2/users/(\d+)/followers$"), self._followers),
+            (re.compile(r"^/2/users/(\d+)/tweets$"), self._user_tweets),
+            (re.compile(r"^/2/tweets/search/all$"), self._search_all),
+            (re.compile(r"^/2/tweets/counts/all$"), self._counts_all),
+            (re.compile(r"^/1.1/statuses/user_timeline.json$"), self._statuses_timeline),
+            (re.compile(r"^/oauth2/token$"), self._oauth2_token),
+        ]
+        self._server = None
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        api = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # Headers and body go out in separate writes, without this the
+            # client's delayed ACK stalls every keep-alive response
+            disable_nagle_algorithm = True
+
+            def setup(self):
+                super().setup()
+                with api._lock:
+                    api.connections += 1
+                if api.connect_latency:
+                    time.sleep(api.connect_latency)
+
+            def do_GET(self):
+                api._handle(self)
+
+            def do_POST(self):
+                api._handle(self)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = QuietHTTPServer(("127.0.0.1", 0), Handler)
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._idle_since = time.time()
+        self._thread.start()
+        return self.base_url
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    @property
+    def idle_time(self):
+        with self._lock:
+            if self._in_flight == 0 and self._idle_since is not None:
+                return self._idle_time + time.time() - self._idle_since
+            return self._idle_time
+
+    # Counters to diff before and after a run
+    def stats(self):
+        with self._lock:
+            counts = {
+                "requests": self.request_count,
+                "rate_limited": self.rate_limited,
+                "errors": self.errors,
+                "connections": self.connections,
+                "bytes_sent": self.bytes_sent,
+            }
+        counts["idle_time"] = self.idle_time
+        return counts
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def _handle(self, handler):
+        parsed = urlparse(handler.path)
+        params = {key: values[-1] for key, values in parse_qs(parsed.query).items()}
+        # Read a POST body so the connection can be reused
+        length = int(handler.headers.get("Content-Length") or 0)
+        if length:
+            handler.rfile.read(length)
+
+        token = handler.headers.get("Authorization", "").replace("Bearer ", "", 1)
+        headers = {}
+
+        for pattern, route in self._routes:
+            match = pattern.match(parsed.path)
+            if match:
+                with self._lock:
+                    self.request_count += 1
+                    self.request_counts[parsed.path] = (
+                        self.request_counts.get(parsed.path, 0) + 1
+                    )
+                    if self._in_flight == 0:
+                        self._idle_time += time.time() - self._idle_since
+                    self._in_flight += 1
+                    allowed = self._take_quota(token, pattern.pattern, headers)
+                    failed = allowed and self._random.random() < self.error_rate
+                    if failed:
+                        self.errors += 1
+                try:
+                    if self.latency:
+                        time.sleep(self.latency)
+                    if not allowed:
+                        status, body = 429, {"title": "Too Many Requests"}
+                    elif failed:
+                        status = self._random.choice(self.error_statuses)
+                        body = {"title": "Service Unavailable", "status": status}
+                    else:
+                        status, body = route(params, *match.groups())
+                finally:
+                    with self._lock:
+                        self._in_flight -= 1
+                        if self._in_flight == 0:
+                            self._idle_since = time.time()
+                break
+        else:
+            status, body = 404, {"title": "Not Found Error"}
+
+        payload = json.dumps(body).encode()
+        if self.compress and "gzip" in handler.headers.get("Accept-Encoding", ""):
+            payload = gzip.compress(payload, compresslevel=6)
+            headers["Content-Encoding"] = "gzip"
+        with self._lock:
+            self.bytes_sent += len(payload)
+        handler.send_response(status)
+        for name, value in headers.items():
+            handler.send_header(name, value)
+        handler.send_header("Content-Type", "application/json")
+        handler.send_header("Content-Length", str(len(payload)))
+        handler.end_headers()
+        handler.wfile.write(payload)
+
+    # Count a request against the token's window for the endpoint and fill in
+    # the x-rate-limit-* headers. Returns False once the window is used up.
+    def _take_quota(self, token, endpoint, headers):
+        rate_limit = self.token_limits.get(token, self.rate_limit)
+        if rate_limit is None:
+            return True
+        limit, window_seconds = rate_limit
+        now = time.time()
+        reset, used = self._windows.get((token, endpoint), (0, 0))
+        if now >= reset:
+            reset, used = now + window_seconds, 0
+        allowed = used < limit
+        if allowed:
+            used += 1
+        else:
+            self.rate_limited += 1
+        self._windows[(token, endpoint)] = (reset, used)
+        headers["x-rate-limit-limit"] = str(limit)
+        headers["x-rate-limit-remaining"] = str(limit - used)
+        headers["x-rate-limit-reset"] = str(math.ceil(reset))
+        return allowed
+
+    # GET /2/users?ids=1,2,3
+    def _users_lookup(self, params):
+        ids = [user_id for user_id in params.get("ids", "").split(",") if user_id]
+        if not ids or len(ids) > 100:
+            return 400, {"title": "Invalid Request", "detail": "ids must hold 1-100 ids"}
+
+        data = []
+        errors = []
+        for user_id in ids:
+            if user_id in self.suspended:
+                errors.append(
+                    {
+                        "value": user_id,
+                        "detail": f"User has been suspended: [{user_id}].",
+                        "title": "Forbidden",
+                        "resource_type": "user",
+                        "parameter": "ids",
+                        "resource_id": user_id,
+                        "type": "https://api.twitter.com/2/problems/resource-not-found",
+                    }
+                )
+            elif user_id in self.missing:
+                errors.append(
+                    {
+                        "value": user_id,
+                        "detail": f"Could not find user with ids: [{user_id}].",
+                        "title": "Not Found Error",
+                        "resource_type": "user",
+                        "parameter": "ids",
+                        "resource_id": user_id,
+                        "type": "https://api.twitter.com/2/problems/resource-not-found",
+                    }
+                )
+            else:
+                data.append(self._user(user_id))
+
+        body = {}
+        if data:
+            body["data"] = data
+        if errors:
+            body["errors"] = errors
+        return 200, body
+
+    def _user(self, user_id):
+        user = fake_user(user_id)
+        if user_id in self.hubs:
+            user["public_metrics"]["followers_count"] = self.hubs[user_id]
+        return user
+
+    # Slice `items` into one page using an offset as the pagination token
+    def _page(self, items, params, default_size, max_size):
+        size = min(int(params.get("max_results", default_size)), max_size)
+        offset = int(params.get("pagination_token", 0))
+        page = items[offset : offset + size]
+        meta = {"result_count": len(page)}
+        if offset + size < len(items):
+            meta["next_token"] = str(offset + size)
+        body = {"meta": meta}
+        if page:
+            body["data"] = page
+        return body
+
+    def _edges(self, params, user_id, count_field, salt):
+        count = min(self._user(user_id)["public_metrics"][count_field], self.max_edges)
+        # Only the requested page is generated, hubs have hundreds of pages
+        size = min(int(params.get("max_results", 100)), 1000)
+        offset = int(params.get("pagination_token", 0))
+        users = [
+            {"id": edge_id, "name": f"User {edge_id}", "username": f"user{edge_id}"}
+            for edge_id in fake_edge_ids(user_id, min(offset + size, count), salt, offset)
+        ]
+        body = {"meta": {"result_count": len(users)}}
+        if offset + size < count:
+            body["meta"]["next_token"] = str(offset + size)
+        if users:
+            body["data"] = users
+        return 200, body
+
+    # GET /2/users/{id}/following
+    def _following(self, params, user_id):
+        return self._edges(params, user_id, "following_count", 1)
+
+    # GET /2/users/{id}/followers
+    def _followers(self, params, user_id):
+        return self._edges(params, user_id, "followers_count", 2)
+
+    # Simulate `count` new tweets on a user's timeline
+    def post_tweets(self, user_id, count):
+        with self._lock:
+            self._new_tweets[str(user_id)] = self._new_tweets.get(str(user_id), 0) + count
+
+    # GET /2/users/{id}/tweets, newest first, the most recent max_tweets only
+    def _user_tweets(self, params, user_id):
+        base = min(fake_user(user_id)["public_metrics"]["tweet_count"], self.max_tweets)
+        total = base + self._new_tweets.get(user_id, 0)
+        tweets = [fake_tweet(user_id, k, total) for k in range(min(total, self.max_tweets))]
+        if "since_id" in params:
+            tweets = [tweet for tweet in tweets if int(tweet["id"]) > int(params["since_id"])]
+        if "until_id" in params:
+            tweets = [tweet for tweet in tweets if int(tweet["id"]) < int(params["until_id"])]
+        body = self._page(tweets, params, 10, 100)
+        if "data" in body:
+            body["meta"]["newest_id"] = body["data"][0]["id"]
+            body["meta"]["oldest_id"] = body["data"][-1]["id"]
+        return 200, body
+
+    # GET /1.1/statuses/user_timeline.json?user_id=1&count=200, one page only
+    def _statuses_timeline(self, params):
+        user_id = params.get("user_id", "")
+        if not user_id.isdigit():
+            return 400, {"errors": [{"code": 44, "message": "user_id parameter is invalid."}]}
+        total = min(fake_user(user_id)["public_metrics"]["tweet_count"], self.max_tweets)
+        total += self._new_tweets.get(user_id, 0)
+        count = min(int(params.get("count", 20)), 200, total)
+        return 200, [fake_status(user_id, k, total) for k in range(count)]
+
+    # POST /oauth2/token, the app-only bearer token tweepy.AppAuthHandler asks for
+    def _oauth2_token(self, params):
+        return 200, {"token_type": "bearer", "access_token": "mock-app-token"}
+
+    # Matching tweets posted in [start_time, end_time), newest first
+    def _search_results(self, params):
+        start = parse_time(params["start_time"])
+        end = parse_time(params["end_time"])
+        tweets = []
+        for hour in range(int(end // 3600), int(start // 3600) - 1, -1):
+            count = search_volume(hour, self.search_burst)
+            for j in range(count - 1, -1, -1):
+                tweet = fake_search_tweet(hour, j, count)
+                if start <= parse_time(tweet["created_at"]) < end:
+                    tweets.append(tweet)
+        return tweets
+
+    # GET /2/tweets/search/all
+    def _search_all(self, params):
+        if "start_time" not in params or "end_time" not in params:
+            return 400, {"title": "Invalid Request", "detail": "start_time and end_time are required"}
+        body = self._page(self._search_results(params), params, 10, 500)
+        if "data" in body:
+            body["meta"]["newest_id"] = body["data"][0]["id"]
+            body["meta"]["oldest_id"] = body["data"][-1]["id"]
+            if "author_id" in params.get("expansions", ""):
+                authors = {tweet["author_id"] for tweet in body["data"]}
+                body["includes"] = {
+                    "users": [fake_user(author_id) for author_id in sorted(authors)]
+                }
+        return 200, body
+
+    # GET /2/tweets/counts/all, buckets aligned to the granularity
+    def _counts_all(self, params):
+        if "start_time" not in params or "end_time" not in params:
+            return 400, {"title": "Invalid Request", "detail": "start_time and end_time are required"}
+        size = {"minute": 60, "hour": 3600, "day": 86400}[params.get("granularity", "hour")]
+        start = parse_time(params["start_time"])
+        end = parse_time(params["end_time"])
+        counts = {}
+        for tweet in self._search_results(params):
+            bucket = parse_time(tweet["created_at"]) // size * size
+            counts[bucket] = counts.get(bucket, 0) + 1
+        data = []
+        bucket = start // size * size
+        while bucket < end:
+            data.append(
+                {
+                    "start": format_time(max(bucket, start)),
+                    "end": format_time(min(bucket + size, end)),
+                    "tweet_count": counts.get(bucket, 0),
+                }
+            )
+            bucket += size
+        return 200, {"data": data, "meta": {"total_tweet_count": sum(counts.values())}}
@@ -1,14 +1,17 @@
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey
+from sqlalchemy import Column, BigInteger, Boolean, Integer, String, DateTime, ForeignKey, Index
 from sqlalchemy.orm import relationship
 from sqlalchemy.ext.declarative import declarative_base
 
 Base = declarative_base()
 
+# Twitter ids are 64-bit snowflakes and are stored as BIGINT. The API sends
+# them as strings, the row builders convert them on the way in.
+
 
 class User(Base):
     __tablename__ = "users"
 
-    id = Column(String, primary_key=True)
+    id = Column(BigInteger, primary_key=True, autoincrement=False)
     username = Column(String)
     description = Column(String)
     location = Column(String)
@@ -16,21 +19,42 @@ class User(Base):
     following_count = Column(Integer)
     tweet_count = Column(Integer)
     created_at = Column(DateTime)
+    # Set when the API reports the account as suspended or deleted, so it is not retried
+    unavailable_reason = Column(String)
+    # True on rows that only exist so edges can reference the account. The
+    # grabbers skip them until the account is found by a search or a snowball.
+    placeholder = Column(Boolean)
 
     tweets = relationship("Tweet", back_populates="user")
-    following = relationship("Following", back_populates="user")
-    followers = relationship("Follower", back_populates="user")
+    following = relationship("Following", back_populates="user", foreign_keys="Following.user_id")
+    followers = relationship("Follower", back_populates="user", foreign_keys="Follower.user_id")
 
 
+# Tweets of one conversation are read together by thread_index.py, in id order.
+# Partitioned by the month of created_at on PostgreSQL (see partitions.py),
+# which needs created_at in the primary key. The indexes exist on every
+# partition. Elsewhere ux_tweets_id keeps the id unique on its own, which
+# resolve_reference_authors() and the find command rely on; PostgreSQL
+# cannot have it on a table partitioned by another column. info["partition_by"]
+# tells BulkWriter to create missing partitions before it writes.
 class Tweet(Base):
     __tablename__ = "tweets"
-
-    id = Column(String, primary_key=True)
+    __table_args__ = (
+        Index("ix_tweets_conversation_id_id", "conversation_id", "id"),
+        Index("ix_tweets_created_at", "created_at"),
+        Index("ux_tweets_id", "id", unique=True).ddl_if(dialect="sqlite"),
+        {"postgresql_partition_by": "RANGE (created_at)", "info": {"partition_by": "created_at"}},
+    )
+
+    id = Column(BigInteger, primary_key=True, autoincrement=False)
     text = Column(String)
-    created_at = Column(DateTime)
-    author_id = Column(String, ForeignKey("users.id"))
+    # text in lower case without diacritics, what text_search.py searches. Its
+    # GIN index on PostgreSQL is created by text_search.migrate_search().
+    search_text = Column(String)
+    created_at = Column(DateTime, primary_key=True)
+    author_id = Column(BigInteger, ForeignKey("users.id"))
     author_username = Column(String)
-    conversation_id = Column(String)
+    conversation_id = Column(BigInteger)
     retweet_count = Column(Integer)
     reply_count = Column(Integer)
     like_count = Column(Integer)
@@ -39,21 +63,164 @@ class Tweet(Base):
     user = relationship("User", back_populates="tweets")
 
 
+# Edge tables are keyed by the edge itself, so an edge is stored once no matter
+# how often it is crawled. The primary key index covers lookups from user_id,
+# the second index covers the reverse direction. Both ends reference users.
 class Following(Base):
     __tablename__ = "following"
+    __table_args__ = (
+        Index("ix_following_following_id_user_id", "following_id", "user_id"),
+    )
 
-    id = Column(Integer, primary_key=True, autoincrement=True)
-    following_id = Column(String)
-    user_id = Column(String, ForeignKey("users.id"))
+    user_id = Column(BigInteger, ForeignKey("users.id"), primary_key=True)
+    following_id = Column(BigInteger, ForeignKey("users.id"), primary_key=True)
 
-    user = relationship("User", back_populates="following")
+    user = relationship("User", back_populates="following", foreign_keys=[user_id])
 
 
 class Follower(Base):
     __tablename__ = "followers"
-
-    id = Column(Integer, primary_key=True, autoincrement=True)
-    follower_id = Column(String)
-    user_id = Column(String, ForeignKey("users.id"))
-
-    user = relationship("User", back_populates="followers")
+    __table_args__ = (
+        Index("ix_followers_follower_id_user_id", "follower_id", "user_id"),
+    )
+
+    user_id = Column(BigInteger, ForeignKey("users.id"), primary_key=True)
+    follower_id = Column(BigInteger, ForeignKey("users.id"), primary_key=True)
+
+    user = relationship("User", back_populates="followers", foreign_keys=[user_id])
+
+
+# Interactions found in tweets (interactions.py), keyed by the tweet they come
+# from so deriving them again stores nothing twice. They can be derived from
+# the response archive before the tweet is stored, and their targets are often
+# accounts never collected, so neither end references another table. Mentions
+# and references carry the tweet's author, so the interaction graph is read
+# from one table without a join.
+class Mention(Base):
+    __tablename__ = "mentions"
+    __table_args__ = (Index("ix_mentions_user_id_author_id", "user_id", "author_id"),)
+
+    tweet_id = Column(BigInteger, primary_key=True)
+    user_id = Column(BigInteger, primary_key=True)
+    author_id = Column(BigInteger)
+
+
+# Hashtags in lower case without diacritics (text_search.normalize), without the #
+class Hashtag(Base):
+    __tablename__ = "hashtags"
+    __table_args__ = (Index("ix_hashtags_tag_tweet_id", "tag", "tweet_id"),)
+
+    tweet_id = Column(BigInteger, primary_key=True)
+    tag = Column(String, primary_key=True)
+
+
+# kind is the API's referenced_tweets type: replied_to, retweeted or quoted.
+# The referenced author of a reply comes with the tweet, for retweets and
+# quotes it is looked up from the stored referenced tweet.
+class TweetReference(Base):
+    __tablename__ = "tweet_references"
+    __table_args__ = (
+        Index("ix_tweet_references_referenced_id", "referenced_id"),
+    )
+
+    tweet_id = Column(BigInteger, primary_key=True)
+    kind = Column(String, primary_key=True)
+    referenced_id = Column(BigInteger)
+    author_id = Column(BigInteger)
+    referenced_author_id = Column(BigInteger)
+
+
+# Reply tree statistics of one conversation (thread_index.py). started_at and
+# root_author_id are NULL while the conversation's first tweet is not stored.
+class Thread(Base):
+    __tablename__ = "threads"
+    __table_args__ = (Index("ix_threads_started_at", "started_at"),)
+
+    conversation_id = Column(BigInteger, primary_key=True, autoincrement=False)
+    root_author_id = Column(BigInteger)
+    tweets = Column(Integer)
+    depth = Column(Integer)
+    breadth = Column(Integer)
+    direct_replies = Column(Integer)
+    participants = Column(Integer)
+    started_at = Column(DateTime)
+    first_reply_at = Column(DateTime)
+    last_reply_at = Column(DateTime)
+    updated_at = Column(DateTime)
+
+
+# Conversations with tweets stored since their thread was last built. Storing
+# another tweet moves marked_at, so a conversation that changes while it is
+# being built stays queued.
+class ThreadUpdate(Base):
+    __tablename__ = "thread_updates"
+
+    conversation_id = Column(BigInteger, primary_key=True, autoincrement=False)
+    marked_at = Column(DateTime)
+
+
+# Progress of a paginated crawl per (endpoint, user), so an interrupted run can
+# resume from the last stored page instead of starting over
+class CrawlState(Base):
+    __tablename__ = "crawl_state"
+
+    endpoint = Column(String, primary_key=True)
+    user_id = Column(BigInteger, primary_key=True)
+    status = Column(String)
+    next_token = Column(String)
+    pages = Column(Integer)
+    # Newest tweet id a timeline chain has stored so far, restored on resume
+    newest_id = Column(BigInteger)
+    started_at = Column(DateTime)
+    updated_at = Column(DateTime)
+
+
+# Newest tweet id stored per user, so timeline refreshes only ask for newer
+# tweets. A refresh that hit its page cap leaves a gap between gap_since_id and
+# gap_until_id that later runs backfill.
+class TimelineSync(Base):
+    __tablename__ = "timeline_sync"
+
+    user_id = Column(BigInteger, primary_key=True, autoincrement=False)
+    newest_id = Column(BigInteger)
+    gap_since_id = Column(BigInteger)
+    gap_until_id = Column(BigInteger)
+    synced_at = Column(DateTime)
+
+
+# Shared frontier of the distributed crawl workers (work_queue.py): one row per
+# (job, user). A worker leases a batch of pending rows and keeps the lease alive
+# with heartbeats; rows whose lease expired are handed out again.
+class WorkItem(Base):
+    __tablename__ = "work_queue"
+    __table_args__ = (
+        Index("ix_work_queue_job_status_user_id", "job", "status", "user_id"),
+    )
+
+    job = Column(String, primary_key=True)
+    user_id = Column(BigInteger, primary_key=True)
+    status = Column(String)
+    worker = Column(String)
+    lease_expires_at = Column(DateTime)
+    attempts = Column(Integer)
+    updated_at = Column(DateTime)
+
+
+# Last heartbeat and counters of every crawl worker, for central progress
+class QueueWorker(Base):
+    __tablename__ = "queue_workers"
+
+    worker = Column(String, primary_key=True)
+    job = Column(String)
+    tokens = Column(Integer)
+    claimed = Column(Integer)
+    done = Column(Integer)
+    failed = Column(Integer)
+    started_at = Column(DateTime)
+    heartbeat_at = Column(DateTime)
+
+
+# Whether an index is created on a database of `dialect`, see Index.ddl_if()
+def created_on(index, dialect):
+    condition = index._ddl_if
+    return condition is None or condition.dialect in (None, dialect)
@@ -0,0 +1,196 @@
+import numpy as np
+from scipy import sparse
+from models import User, Following, Follower
+from edge_loader import read_ids
+from interactions import KINDS
+
+# Sparse-matrix view of the follow graph for network analysis. Both edge tables
+# are read into one directed adjacency matrix, edge u -> v meaning u follows v,
+# stored as CSR (out-edges by row) and CSC (in-edges by column) with int32
+# indices. Node i is the i-th id in numeric order of users.id together with
+# the edge ends that are not in the users table. Graphs built with weights
+# (the interaction graph of interactions.py) keep the summed weight of every
+# edge instead of 1.
+
+
+class Graph:
+    # node_ids: sorted int64 user ids, sources/targets: int32 node indices,
+    # weights: optional weight of every edge, None for 1
+    def __init__(self, node_ids, sources, targets, weights=None):
+        self.node_ids = node_ids
+        size = len(node_ids)
+        # Self-follows say nothing about the network
+        loops = sources == targets
+        if loops.any():
+            sources = sources[~loops]
+            targets = targets[~loops]
+            if weights is not None:
+                weights = weights[~loops]
+        if weights is None:
+            data = np.ones(len(sources), dtype=np.float32)
+        else:
+            data = np.asarray(weights, dtype=np.float32)
+        adjacency = sparse.csr_matrix((data, (sources, targets)), shape=(size, size))
+        # The same edge can come from both tables, keep it once
+        adjacency.sum_duplicates()
+        if weights is None:
+            adjacency.data[:] = 1
+        adjacency.indices = adjacency.indices.astype(np.int32, copy=False)
+        adjacency.indptr = adjacency.indptr.astype(np.int32, copy=False)
+        self.csr = adjacency
+        self.csc = adjacency.tocsc()
+
+    # Build from arrays of user ids, one entry per edge. A single sort gives
+    # both the node ordering and every edge end's index.
+    @classmethod
+    def from_edges(cls, user_ids, source_ids, target_ids, weights=None):
+        edge_count = len(source_ids)
+        node_ids, inverse = np.unique(
+            np.concatenate([source_ids, target_ids, user_ids]), return_inverse=True
+        )
+        sources = inverse[:edge_count].astype(np.int32)
+        targets = inverse[edge_count : 2 * edge_count].astype(np.int32)
+        return cls(node_ids, sources, targets, weights)
+
+    @property
+    def node_count(self):
+        return self.csr.shape[0]
+
+    @property
+    def edge_count(self):
+        return self.csr.nnz
+
+    # Bytes held by the matrices and the id mapping
+    def nbytes(self):
+        return self.node_ids.nbytes + sum(
+            matrix.data.nbytes + matrix.indices.nbytes + matrix.indptr.nbytes
+            for matrix in (self.csr, self.csc)
+        )
+
+    def index_of(self, user_id):
+        index = np.searchsorted(self.node_ids, int(user_id))
+        if index == len(self.node_ids) or self.node_ids[index] != int(user_id):
+            raise KeyError(user_id)
+        return int(index)
+
+    # Accounts each user follows
+    def out_degree(self):
+        return np.diff(self.csr.indptr)
+
+    # Followers of each user
+    def in_degree(self):
+        return np.diff(self.csc.indptr)
+
+    # Power iteration until the L1 change of the ranks drops below tol. Rank
+    # is spread along the out-edges in proportion to their weight, users that
+    # follow nobody spread their rank evenly.
+    def pagerank(self, alpha=0.85, tol=1e-6, max_iter=100):
+        size = self.node_count
+        out_weight = np.asarray(self.csr.sum(axis=1), dtype=np.float32).ravel()
+        dangling = out_weight == 0
+        inverse_weight = np.divide(
+            1, out_weight, out=np.zeros_like(out_weight), where=~dangling
+        )
+        rank = np.full(size, 1 / size, dtype=np.float32)
+        for _ in range(max_iter):
+            spread = self.csr.T @ (rank * inverse_weight)
+            teleport = (alpha * rank[dangling].sum() + 1 - alpha) / size
+            new_rank = alpha * spread + teleport
+            error = np.abs(new_rank - rank).sum()
+            rank = new_rank
+            if error < tol:
+                break
+        return rank / rank.sum()
+
+    # Hub and authority scores, each normalized to sum to 1, iterated until the
+    # L1 change of the hub scores drops below tol
+    def hits(self, tol=1e-6, max_iter=100):
+        size = self.node_count
+        hubs = np.full(size, 1 / size, dtype=np.float32)
+        for _ in range(max_iter):
+            authorities = self.csr.T @ hubs
+            new_hubs = self.csr @ authorities
+            new_hubs /= new_hubs.sum() or 1
+            error = np.abs(new_hubs - hubs).sum()
+            hubs = new_hubs
+            if error < tol:
+                break
+        authorities = self.csr.T @ hubs
+        authorities /= authorities.sum() or 1
+        return hubs, authorities
+
+    # Edges that are followed back by each user
+    def mutual_degree(self):
+        mutual = self.csr.multiply(self.csc.T)
+        return np.diff(mutual.tocsr().indptr)
+
+    # Share of edges that are followed back
+    def reciprocity(self):
+        if not self.edge_count:
+            return 0.0
+        return float(self.mutual_degree().sum() / self.edge_count)
+
+    # Core number of every user in the undirected graph (mutual follows count
+    # once), found by peeling all users at or below the current degree in
+    # rounds instead of one at a time
+    def core_numbers(self):
+        undirected = (self.csr + self.csr.T).tocsr()
+        undirected.data[:] = 1
+        degree = np.diff(undirected.indptr).astype(np.int64)
+        core = np.zeros(self.node_count, dtype=np.int32)
+        alive = np.ones(self.node_count, dtype=bool)
+        level = 0
+        while alive.any():
+            level = max(level, int(degree[alive].min()))
+            while True:
+                peeled = np.flatnonzero(alive & (degree <= level))
+                if not len(peeled):
+                    break
+                core[peeled] = level
+                alive[peeled] = False
+                # Every neighbour of a peeled user loses one degree
+                neighbours = undirected[peeled].indices
+                degree -= np.bincount(neighbours, minlength=self.node_count)
+        return core
+
+    # Indices of the users in the k-core
+    def k_core(self, k, core=None):
+        if core is None:
+            core = self.core_numbers()
+        return np.flatnonzero(core >= k)
+
+    # The `count` users with the highest score as (user id, score) pairs
+    def top(self, scores, count=10):
+        count = min(count, len(scores))
+        indices = np.argpartition(-scores, count - 1)[:count] if count else []
+        indices = sorted(indices, key=lambda index: -scores[index])
+        return [(int(self.node_ids[index]), float(scores[index])) for index in indices]
+
+
+def load_graph(session):
+    user_ids = read_ids(session, User.__tablename__, ["id"])[:, 0]
+    # Users follow the accounts in `following`, followers follow the user
+    following = read_ids(session, Following.__tablename__, ["user_id", "following_id"])
+    followers = read_ids(session, Follower.__tablename__, ["follower_id", "user_id"])
+    return Graph.from_edges(
+        user_ids,
+        np.concatenate([following[:, 0], followers[:, 0]]),
+        np.concatenate([following[:, 1], followers[:, 1]]),
+    )
+
+
+# Weighted interaction graph of the given kinds (see interactions.py): edge
+# u -> v weighs the number of times u mentioned, replied to, retweeted or
+# quoted v. Only accounts that took part in an interaction are nodes.
+def load_interaction_graph(session, kinds=tuple(KINDS)):
+    edges = [
+        read_ids(session, KINDS[kind][0], KINDS[kind][1], where=KINDS[kind][2])
+        for kind in kinds
+    ]
+    edges = np.concatenate(edges) if edges else np.empty((0, 2), dtype=np.int64)
+    return Graph.from_edges(
+        np.empty(0, dtype=np.int64),
+        edges[:, 0],
+        edges[:, 1],
+        np.ones(len(edges), dtype=np.float32),
+    )
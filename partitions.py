@@ -0,0 +1,594 @@
+import os
+import re
+import shutil
+import time
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import MetaData, delete, func, inspect, select, text
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.orm import Session
+from models import Tweet
+
+# Monthly range partitions of the tweets table by created_at. On PostgreSQL
+# tweets is declared PARTITION BY RANGE (created_at), one partition per month
+# named tweets_yYYYYmMM:
+#   - BulkWriter calls ensure_partitions() before it writes tweets, which
+#     creates the partitions of months not seen before. A partition is created
+#     as a plain table and attached, which does not block writes to the others.
+#   - The indexes declared on Tweet exist on every partition, so a query
+#     narrowed to a few months reads their partitions and indexes only.
+#   - posted_between() turns a time window into plain comparisons on
+#     created_at, which the planner prunes partitions with.
+#   - detach_partitions() moves old months out of the database into Parquet
+#     files laid out like the tweets of a snapshot, read_archive() reads them.
+# migrate_partitions() converts an existing unpartitioned table online, like
+# migrate_ids.py: a trigger mirrors every write into the new partitioned
+# table while the rows are copied over, then one short transaction swaps
+# them. SQLite has no partitions; there the same helpers use the created_at
+# index, and detaching deletes the archived rows.
+
+BATCH_SIZE = 10_000
+TABLE = "tweets"
+COLUMN = "created_at"
+# The partitioned table while migrate_partitions() fills it
+NEW_TABLE = f"{TABLE}_partitioned"
+PARTITION_NAME = re.compile(rf"^{TABLE}_y(\d{{4}})m(\d{{2}})$")
+# Twitter ids carry their creation time in milliseconds since this moment
+TWITTER_EPOCH_MS = 1288834974657
+
+# Months known to have a partition, per (engine, table)
+_known_months = {}
+
+
+# A moment as a naive UTC datetime, which is how created_at is stored. Takes
+# datetimes (aware ones are converted), dates and ISO strings.
+def utc(moment):
+    if moment is None:
+        return None
+    if isinstance(moment, str):
+        moment = datetime.fromisoformat(moment)
+    elif not isinstance(moment, datetime):
+        moment = datetime(moment.year, moment.month, moment.day)
+    if moment.tzinfo is not None:
+        moment = moment.astimezone(timezone.utc).replace(tzinfo=None)
+    return moment
+
+
+def month_start(moment):
+    return datetime(moment.year, moment.month, 1)
+
+
+def next_month(month):
+    return datetime(month.year + month.month // 12, month.month % 12 + 1, 1)
+
+
+def partition_name(month, table=TABLE):
+    return f"{table}_y{month.year}m{month.month:02d}"
+
+
+def partition_month(name):
+    match = PARTITION_NAME.match(name)
+    return datetime(int(match.group(1)), int(match.group(2)), 1) if match else None
+
+
+# Creation time of a tweet from its id, in whole seconds like the created_at
+# the API sends, so a tweet filled from its id and crawled again later keeps
+# one key. Ids from before November 2010 are not snowflakes and all come out
+# at that date.
+def snowflake_time(tweet_id):
+    milliseconds = max(int(tweet_id) >> 22, 0) + TWITTER_EPOCH_MS
+    return datetime(1970, 1, 1) + timedelta(seconds=milliseconds // 1000)
+
+
+# Conditions on Tweet for tweets posted in [start, end). Both bounds end up
+# as literals compared with the partition key itself, never wrapped in a
+# function or cast, so PostgreSQL scans only the partitions of the window,
+# and SQLite uses ix_tweets_created_at.
+def posted_between(start=None, end=None):
+    conditions = []
+    if start is not None:
+        conditions.append(Tweet.created_at >= utc(start))
+    if end is not None:
+        conditions.append(Tweet.created_at < utc(end))
+    return conditions
+
+
+def is_partitioned(connection, table):
+    return bool(
+        connection.execute(
+            text("SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass(:table)"),
+            {"table": table},
+        ).scalar()
+    )
+
+
+# (name, month, detach pending) of the partitions attached to `table`
+def attached_partitions(connection, table=TABLE):
+    rows = connection.execute(
+        text(
+            "SELECT child.relname, inherits.inhdetachpending FROM pg_inherits AS inherits "
+            "JOIN pg_class AS child ON child.oid = inherits.inhrelid "
+            "WHERE inherits.inhparent = to_regclass(:table) ORDER BY child.relname"
+        ),
+        {"table": table},
+    ).all()
+    return [(name, partition_month(name), pending) for name, pending in rows]
+
+
+def is_attached(connection, name):
+    return bool(
+        connection.execute(
+            text("SELECT 1 FROM pg_inherits WHERE inhrelid = to_regclass(:name)"),
+            {"name": name},
+        ).scalar()
+    )
+
+
+# Create and attach the partition of `month`. ATTACH PARTITION takes a lock
+# that lets writes to the other partitions go on, where CREATE TABLE ...
+# PARTITION OF would block the whole table; the CHECK constraint proves the
+# bounds so attaching does not scan the new table. Safe to race: whoever
+# loses finds the partition attached.
+def create_partition(connection, parent, month, table=TABLE):
+    name = partition_name(month, table)
+    if is_attached(connection, name):
+        return False
+    lower = f"'{month:%Y-%m-%d}'"
+    upper = f"'{next_month(month):%Y-%m-%d}'"
+    try:
+        connection.execute(
+            text(f"CREATE TABLE IF NOT EXISTS {name} (LIKE {parent} INCLUDING DEFAULTS)")
+        )
+        connection.execute(text(f"ALTER TABLE {name} DROP CONSTRAINT IF EXISTS {name}_bounds"))
+        connection.execute(
+            text(
+                f"ALTER TABLE {name} ADD CONSTRAINT {name}_bounds CHECK ({COLUMN} IS NOT NULL "
+                f"AND {COLUMN} >= {lower} AND {COLUMN} < {upper})"
+            )
+        )
+        connection.execute(
+            text(
+                f"ALTER TABLE {parent} ATTACH PARTITION {name} "
+                f"FOR VALUES FROM ({lower}) TO ({upper})"
+            )
+        )
+        connection.execute(text(f"ALTER TABLE {name} DROP CONSTRAINT {name}_bounds"))
+    except DBAPIError:
+        if not is_attached(connection, name):
+            raise
+        return False
+    print(f"Created partition {name}.")
+    return True
+
+
+# Make sure every month of `moments` has a partition in `table` (and in the
+# table migrate_partitions() is filling, while it runs) before rows are
+# written to it. Months already seen cost a set lookup, nothing is done on
+# databases without partitions.
+def ensure_partitions(session, table, moments):
+    engine = session.get_bind().engine
+    if engine.dialect.name != "postgresql":
+        return
+    known = _known_months.setdefault((engine, table), set())
+    missing = {month_start(moment) for moment in moments if moment is not None} - known
+    if not missing:
+        return
+    # Its own connection: the partition is committed even if the write fails
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+        for parent in (table, f"{table}_partitioned"):
+            if is_partitioned(connection, parent):
+                for month in sorted(missing):
+                    create_partition(connection, parent, month, table)
+    known |= missing
+
+
+# Build an index without blocking writes. CONCURRENTLY does not work on a
+# partitioned table: there the index is created on the parent alone, built
+# CONCURRENTLY on every partition and attached, and becomes valid once every
+# partition has it. `definition` is what follows the table name, e.g.
+# "(conversation_id, id)" or "USING gin (...)". Runs on an AUTOCOMMIT
+# connection; an interrupted run is picked up where it stopped.
+def create_index_concurrently(connection, name, table, definition):
+    if not is_partitioned(connection, table):
+        # An interrupted build leaves an invalid index behind, start over
+        connection.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {name}"))
+        connection.execute(text(f"CREATE INDEX CONCURRENTLY {name} ON {table} {definition}"))
+        return
+    connection.execute(text(f"CREATE INDEX IF NOT EXISTS {name} ON ONLY {table} {definition}"))
+    for partition, month, _ in attached_partitions(connection, table):
+        attached = connection.execute(
+            text(
+                "SELECT 1 FROM pg_inherits AS inherits "
+                "JOIN pg_index AS child ON child.indexrelid = inherits.inhrelid "
+                "WHERE inherits.inhparent = to_regclass(:index) "
+                "AND child.indrelid = to_regclass(:partition)"
+            ),
+            {"index": name, "partition": partition},
+        ).scalar()
+        if attached:
+            continue
+        child = f"{name}_{partition[len(table) + 1:]}"
+        connection.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {child}"))
+        connection.execute(text(f"CREATE INDEX CONCURRENTLY {child} ON {partition} {definition}"))
+        connection.execute(text(f"ALTER INDEX {name} ATTACH PARTITION {child}"))
+
+
+# Tweets stored without created_at get the time their id carries, the
+# partition key cannot be NULL. Runs before migrate_ids.py, so the id may
+# still be a VARCHAR. Returns the rows updated.
+def fill_created_at(engine):
+    inspector = inspect(engine)
+    if not inspector.has_table(TABLE):
+        return 0
+    with engine.begin() as connection:
+        if connection.dialect.name == "postgresql":
+            updated = connection.execute(
+                text(
+                    f"UPDATE {TABLE} SET {COLUMN} = to_timestamp("
+                    f"((CAST(id AS BIGINT) >> 22) + {TWITTER_EPOCH_MS}) / 1000) "
+                    f"AT TIME ZONE 'UTC' WHERE {COLUMN} IS NULL"
+                )
+            ).rowcount
+        else:
+            ids = connection.execute(
+                text(f"SELECT id FROM {TABLE} WHERE {COLUMN} IS NULL")
+            ).scalars().all()
+            for tweet_id in ids:
+                connection.execute(
+                    text(f"UPDATE {TABLE} SET {COLUMN} = :created_at WHERE id = :id"),
+                    {"created_at": snowflake_time(tweet_id), "id": tweet_id},
+                )
+            updated = len(ids)
+    if updated:
+        print(f"Filled created_at of {updated} tweets from their ids.")
+    return updated
+
+
+# Step 1: the partitioned table with the key, foreign keys and indexes of
+# tweets, partitions for every month stored so far, and the trigger that
+# mirrors writes to tweets into it. The columns are those of the live table,
+# columns of models.py are only added by later migrations (search_text).
+def create_partitioned_table(engine):
+    columns = [column["name"] for column in inspect(engine).get_columns(TABLE)]
+    key = [column.name for column in Tweet.__table__.primary_key]
+    with engine.begin() as connection:
+        connection.execute(
+            text(
+                f"CREATE TABLE IF NOT EXISTS {NEW_TABLE} (LIKE {TABLE} INCLUDING DEFAULTS) "
+                f"PARTITION BY RANGE ({COLUMN})"
+            )
+        )
+        constraints = set(
+            connection.execute(
+                text("SELECT conname FROM pg_constraint WHERE conrelid = to_regclass(:table)"),
+                {"table": NEW_TABLE},
+            ).scalars()
+        )
+        if f"{NEW_TABLE}_pkey" not in constraints:
+            connection.execute(
+                text(
+                    f"ALTER TABLE {NEW_TABLE} ADD CONSTRAINT {NEW_TABLE}_pkey "
+                    f"PRIMARY KEY ({', '.join(key)})"
+                )
+            )
+        for foreign_key in Tweet.__table__.foreign_keys:
+            name = f"{TABLE}_{foreign_key.parent.name}_fkey"
+            if name not in constraints:
+                connection.execute(
+                    text(
+                        f"ALTER TABLE {NEW_TABLE} ADD CONSTRAINT {name} "
+                        f"FOREIGN KEY ({foreign_key.parent.name}) REFERENCES "
+                        f"{foreign_key.column.table.name} ({foreign_key.column.name})"
+                    )
+                )
+        # The indexes of tweets under a temporary name, the primary key aside
+        for name, definition in copied_indexes(connection):
+            connection.execute(
+                text(f"CREATE INDEX IF NOT EXISTS {name}_partitioned ON {NEW_TABLE} {definition}")
+            )
+        months = connection.execute(
+            text(
+                f"SELECT DISTINCT date_trunc('month', {COLUMN}) FROM {TABLE} "
+                f"WHERE {COLUMN} IS NOT NULL"
+            )
+        ).scalars().all()
+        assignments = ", ".join(
+            f"{column} = EXCLUDED.{column}" for column in columns if column not in key
+        )
+        matches = " AND ".join(f"{column} = OLD.{column}" for column in key)
+        changed = " OR ".join(f"OLD.{column} IS DISTINCT FROM NEW.{column}" for column in key)
+        connection.execute(
+            text(
+                f"""
+                CREATE OR REPLACE FUNCTION {TABLE}_partition_sync() RETURNS trigger AS $$
+                BEGIN
+                    IF TG_OP = 'DELETE' OR (TG_OP = 'UPDATE' AND ({changed})) THEN
+                        DELETE FROM {NEW_TABLE} WHERE {matches};
+                    END IF;
+                    IF TG_OP <> 'DELETE' THEN
+                        INSERT INTO {NEW_TABLE} SELECT NEW.*
+                        ON CONFLICT ({', '.join(key)}) DO UPDATE SET {assignments};
+                    END IF;
+                    RETURN NULL;
+                END
+                $$ LANGUAGE plpgsql
+                """
+            )
+        )
+    # Partitions before the trigger, so mirrored writes find theirs
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+    months = {month_start(month) for month in months} | {month_start(now)}
+    months.add(next_month(month_start(now)))
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+        for month in sorted(months):
+            create_partition(connection, NEW_TABLE, month)
+    with engine.begin() as connection:
+        connection.execute(text(f"DROP TRIGGER IF EXISTS {TABLE}_partition_sync ON {TABLE}"))
+        connection.execute(
+            text(
+                f"CREATE TRIGGER {TABLE}_partition_sync AFTER INSERT OR UPDATE OR DELETE "
+                f"ON {TABLE} FOR EACH ROW EXECUTE FUNCTION {TABLE}_partition_sync()"
+            )
+        )
+
+
+# (name, definition after the table name) of the non-unique indexes of tweets
+def copied_indexes(connection):
+    indexes = []
+    for name, definition in connection.execute(
+        text("SELECT indexname, indexdef FROM pg_indexes WHERE tablename = :table"),
+        {"table": TABLE},
+    ):
+        match = re.match(rf"CREATE INDEX \S+ ON (?:ONLY )?(?:\S+\.)?{TABLE} (.*)$", definition)
+        if match:
+            indexes.append((name, match.group(1)))
+    return indexes
+
+
+# Step 2: copy the existing rows, batch_size rows per transaction in id
+# order. Rows the trigger already mirrored are newer and are kept. Returns
+# the rows copied.
+def copy_rows(engine, batch_size):
+    last = None
+    copied = 0
+    batches = 0
+    start_time = time.time()
+    while True:
+        params = {"skip": batch_size - 1}
+        after = "TRUE"
+        if last is not None:
+            after = "id > :last"
+            params["last"] = last
+        with engine.begin() as connection:
+            upper = connection.execute(
+                text(f"SELECT id FROM {TABLE} WHERE {after} ORDER BY id OFFSET :skip LIMIT 1"),
+                params,
+            ).scalar()
+            bounds = after
+            if upper is not None:
+                bounds += " AND id <= :upper"
+                params["upper"] = upper
+            key = ", ".join(column.name for column in Tweet.__table__.primary_key)
+            copied += connection.execute(
+                text(
+                    f"INSERT INTO {NEW_TABLE} SELECT * FROM {TABLE} WHERE {bounds} "
+                    f"ON CONFLICT ({key}) DO NOTHING"
+                ),
+                params,
+            ).rowcount
+        if upper is None:
+            break
+        last = upper
+        batches += 1
+        if batches % 100 == 0:
+            print(f"Copied {copied} tweets, {copied / (time.time() - start_time):.0f} rows/s.")
+    print(f"Copied {copied} tweets in {time.time() - start_time:.0f}s.")
+    return copied
+
+
+# Step 3: swap the partitioned table in and drop the old one, in one
+# transaction that gives up after lock_timeout seconds
+def swap(engine, lock_timeout):
+    with engine.begin() as connection:
+        indexes = [name for name, _ in copied_indexes(connection)]
+        connection.execute(text(f"SET LOCAL lock_timeout = '{lock_timeout}s'"))
+        connection.execute(text(f"LOCK TABLE {TABLE} IN ACCESS EXCLUSIVE MODE"))
+        connection.execute(text(f"DROP TRIGGER {TABLE}_partition_sync ON {TABLE}"))
+        connection.execute(text(f"DROP FUNCTION {TABLE}_partition_sync()"))
+        connection.execute(text(f"DROP TABLE {TABLE}"))
+        connection.execute(text(f"ALTER TABLE {NEW_TABLE} RENAME TO {TABLE}"))
+        connection.execute(text(f"ALTER INDEX {NEW_TABLE}_pkey RENAME TO {TABLE}_pkey"))
+        for name in indexes:
+            connection.execute(text(f"ALTER INDEX {name}_partitioned RENAME TO {name}"))
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+        connection.execute(text(f"ANALYZE {TABLE}"))
+
+
+# Rebuild the SQLite table with the (id, created_at) primary key, which the
+# bulk writer's ON CONFLICT names. SQLite cannot change a primary key in place.
+def migrate_sqlite_key(engine):
+    inspector = inspect(engine)
+    key = [column.name for column in Tweet.__table__.primary_key]
+    if inspector.get_pk_constraint(TABLE)["constrained_columns"] == key:
+        return
+    old_columns = {column["name"] for column in inspector.get_columns(TABLE)}
+    names = ", ".join(
+        column.name for column in Tweet.__table__.columns if column.name in old_columns
+    )
+    with engine.begin() as connection:
+        for index in inspector.get_indexes(TABLE):
+            connection.execute(text(f"DROP INDEX IF EXISTS {index['name']}"))
+        connection.execute(text(f"ALTER TABLE {TABLE} RENAME TO {TABLE}_old"))
+        Tweet.__table__.create(connection)
+        connection.execute(
+            text(f"INSERT INTO {TABLE} ({names}) SELECT {names} FROM {TABLE}_old")
+        )
+        connection.execute(text(f"DROP TABLE {TABLE}_old"))
+    print(f"Rebuilt {TABLE} with the primary key ({', '.join(key)}).")
+
+
+# Tables rebuilt before ux_tweets_id existed may hold an id under two
+# created_at values. The row written last stays, then the index is created.
+def dedupe_sqlite_ids(engine):
+    if "ux_tweets_id" in {index["name"] for index in inspect(engine).get_indexes(TABLE)}:
+        return
+    with engine.begin() as connection:
+        deleted = connection.execute(
+            text(
+                f"DELETE FROM {TABLE} WHERE rowid NOT IN "
+                f"(SELECT max(rowid) FROM {TABLE} GROUP BY id)"
+            )
+        ).rowcount
+        connection.execute(text(f"CREATE UNIQUE INDEX ux_tweets_id ON {TABLE} (id)"))
+    if deleted:
+        print(f"Deleted {deleted} duplicate tweets stored under another created_at.")
+
+
+# Bring the tweets table to the partitioned schema. Run fill_created_at() first.
+def migrate_partitions(engine, batch_size=BATCH_SIZE, lock_timeout=10):
+    if engine.dialect.name != "postgresql":
+        migrate_sqlite_key(engine)
+        dedupe_sqlite_ids(engine)
+        return
+    with engine.connect() as connection:
+        if is_partitioned(connection, TABLE):
+            print("Tweets are already partitioned by month.")
+            return
+    start_time = time.time()
+    create_partitioned_table(engine)
+    copy_rows(engine, batch_size)
+    swap(engine, lock_timeout)
+    print(f"Partitioned {TABLE} by month in {time.time() - start_time:.0f}s.")
+
+
+# (month, rows, bytes) of every month stored. PostgreSQL reports the
+# planner's row estimate of each partition, SQLite counts and has no sizes.
+def list_partitions(engine):
+    with engine.connect() as connection:
+        if connection.dialect.name != "postgresql":
+            month = func.strftime("%Y-%m", Tweet.created_at)
+            return [
+                (datetime.strptime(value, "%Y-%m"), rows, None)
+                for value, rows in connection.execute(
+                    select(month, func.count()).group_by(month).order_by(month)
+                )
+                if value is not None
+            ]
+        partitions = []
+        for name, month, _ in attached_partitions(connection):
+            rows, size = connection.execute(
+                text(
+                    "SELECT reltuples::bigint, pg_total_relation_size(oid) FROM pg_class "
+                    "WHERE oid = to_regclass(:name)"
+                ),
+                {"name": name},
+            ).one()
+            partitions.append((month, max(rows, 0), size))
+        return partitions
+
+
+def next_run(path):
+    runs = [
+        int(file_name[5:10])
+        for _, _, file_names in os.walk(path)
+        for file_name in file_names
+        if re.match(r"part-\d{5}\.parquet$", file_name)
+    ]
+    return max(runs, default=0) + 1
+
+
+# Write the tweets `filters` select from `table` to the archive in
+# `directory`, one Parquet file per month. The files are written aside and
+# moved in when complete, an interrupted export leaves nothing half written
+# in the archive.
+def archive_rows(session, table, filters, directory):
+    from snapshot import arrow_schema, record_batches, write_batches
+
+    path = os.path.join(directory, TABLE)
+    staging = os.path.join(directory, ".detaching")
+    run = next_run(path)
+    shutil.rmtree(staging, ignore_errors=True)
+    rows = write_batches(
+        record_batches(session, Tweet, filters, table=table),
+        staging,
+        arrow_schema(Tweet),
+        "month",
+        run,
+    )
+    session.commit()
+    if not rows:
+        shutil.rmtree(staging)
+        return 0
+    for parent, _, file_names in os.walk(staging):
+        for file_name in file_names:
+            target = os.path.join(path, os.path.relpath(parent, staging))
+            os.makedirs(target, exist_ok=True)
+            os.replace(os.path.join(parent, file_name), os.path.join(target, file_name))
+    shutil.rmtree(staging)
+    return rows
+
+
+# Move the months before `before` out of the database into Parquet under
+# `directory` (tweets/month=YYYY-MM, as in a snapshot). PostgreSQL detaches
+# the partitions CONCURRENTLY, exports and drops them; detached partitions
+# left by an interrupted run are exported first. SQLite exports and deletes
+# the rows. Returns the rows archived.
+def detach_partitions(engine, before, directory):
+    before = month_start(utc(before))
+    session = Session(bind=engine)
+    archived = 0
+    try:
+        if engine.dialect.name != "postgresql":
+            condition = Tweet.created_at < before
+            archived = archive_rows(session, None, [condition], directory)
+            session.execute(delete(Tweet).where(condition))
+            session.commit()
+            print(f"Archived {archived} tweets posted before {before:%Y-%m}.")
+            return archived
+        # DETACH ... CONCURRENTLY cannot run inside a transaction block
+        with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+            for name, month, pending in attached_partitions(connection):
+                if month is None or month >= before:
+                    continue
+                mode = "FINALIZE" if pending else "CONCURRENTLY"
+                connection.execute(text(f"ALTER TABLE {TABLE} DETACH PARTITION {name} {mode}"))
+            detached = connection.execute(
+                text(
+                    "SELECT relname FROM pg_class WHERE relkind = 'r' AND relname ~ :pattern "
+                    "AND oid NOT IN (SELECT inhrelid FROM pg_inherits) ORDER BY relname"
+                ),
+                {"pattern": PARTITION_NAME.pattern},
+            ).scalars().all()
+        for name in detached:
+            table = Tweet.__table__.to_metadata(MetaData(), name=name)
+            rows = archive_rows(session, table, [], directory)
+            session.execute(text(f"DROP TABLE {name}"))
+            session.commit()
+            archived += rows
+            print(f"Archived partition {name}, {rows} tweets.")
+        _known_months.pop((engine, TABLE), None)
+    finally:
+        session.close()
+    return archived
+
+
+# Archived tweets posted in [start, end) as an Arrow table. The window is
+# also given as a condition on the month directories, so only their files
+# are opened.
+def read_archive(directory, start=None, end=None, columns=None):
+    import pyarrow.dataset as ds
+    import pyarrow.fs as fs
+
+    dataset = ds.dataset(
+        os.path.join(directory, TABLE),
+        format="parquet",
+        partitioning="hive",
+        filesystem=fs.LocalFileSystem(use_mmap=True),
+    )
+    condition = ds.scalar(True)
+    if start is not None:
+        start = utc(start)
+        condition &= (ds.field("month") >= f"{start:%Y-%m}") & (ds.field(COLUMN) >= start)
+    if end is not None:
+        end = utc(end)
+        condition &= (ds.field("month") <= f"{end:%Y-%m}") & (ds.field(COLUMN) < end)
+    return dataset.to_table(columns=columns, filter=condition)
@@ -0,0 +1,813 @@
+import argparse
+from config import (
+    BEARER_TOKEN,
+    BEARER_TOKEN2,
+    BEARER_TOKEN3,
+    API_BASE_URL,
+    ARCHIVE_DIR,
+    DATABASE_URL,
+    HISTORY_DIR,
+)
+
+# Single entry point of the crawl pipeline:
+#   prostreno.py migrate      create the tables, bring old schemas up to date
+#   prostreno.py search       full-archive search for the show (1_tweet_grabber.py)
+#   prostreno.py hydrate      profiles of stored users (2_user_grabber.py)
+#   prostreno.py tweets       user timelines (3_user_tweets_grabber*.py)
+#   prostreno.py following    following lists (4_user_following_grabber*.py)
+#   prostreno.py followers    follower lists (5_user_followers_grabber*.py)
+#   prostreno.py interactions derive mentions, hashtags, replies, retweets
+#                             and quotes from stored tweets and the archive
+#   prostreno.py threads      reply trees and statistics per conversation
+#   prostreno.py find         diacritic-insensitive search of stored tweets
+#   prostreno.py analyze      summary of the follow or interaction graph
+#   prostreno.py history      the follow graph and user metrics at a past time
+#   prostreno.py snowball     crawl the network around the authors of the show
+#   prostreno.py queue        fill the queue of a distributed job, show progress
+#   prostreno.py worker       one crawl worker of a distributed job
+#   prostreno.py replay       rebuild the database from the response archive
+#   prostreno.py snapshot     export the database as Parquet
+# Every subcommand imports what it needs only when it runs, so --help and the
+# light commands start without loading SQLAlchemy, aiohttp, tweepy or SciPy.
+# A command opens one pooled engine and one keep-alive HTTP session and shares
+# them between all of its requests. Schema changes only happen in `migrate`,
+# the crawl commands refuse to run against a database it has not set up.
+
+# work_queue.JOBS, spelled out so --help does not load SQLAlchemy
+JOBS = ("tweets", "following", "followers")
+QUERY = "prostřeno OR prostreno OR Prostřeno OR Prostreno OR #prostřeno OR #prostreno OR #Prostřeno OR #Prostreno"
+
+# Connections kept open to PostgreSQL, and extra ones allowed under load
+POOL_SIZE = 5
+MAX_OVERFLOW = 10
+# Seconds before a pooled connection is replaced, under typical server timeouts
+POOL_RECYCLE = 1800
+
+_engines = {}
+
+
+# The pooled engine for a database URL, created once per process
+def database(url):
+    if url not in _engines:
+        from sqlalchemy import create_engine
+        from sqlalchemy.engine import make_url
+
+        options = {"pool_pre_ping": True}
+        # SQLite pools its single file connection itself
+        if make_url(url).get_backend_name() != "sqlite":
+            options.update(
+                pool_size=POOL_SIZE, max_overflow=MAX_OVERFLOW, pool_recycle=POOL_RECYCLE
+            )
+        _engines[url] = create_engine(url, **options)
+    return _engines[url]
+
+
+def dispose_engines():
+    for engine in _engines.values():
+        engine.dispose()
+    _engines.clear()
+
+
+# Stop with a hint when tables of models.py are missing
+def require_schema(engine):
+    from sqlalchemy import inspect
+    from models import Base
+
+    missing = set(Base.metadata.tables) - set(inspect(engine).get_table_names())
+    if missing:
+        raise SystemExit(
+            f"Missing tables {', '.join(sorted(missing))}, run `prostreno.py migrate` first."
+        )
+
+
+def open_session(args):
+    from sqlalchemy.orm import sessionmaker
+
+    engine = database(args.url)
+    require_schema(engine)
+    return sessionmaker(bind=engine)()
+
+
+# Keep-alive session for the synchronous requests, asking for gzip bodies
+def http_session():
+    import requests
+
+    http = requests.Session()
+    http.headers["Accept-Encoding"] = "gzip, deflate"
+    return http
+
+
+def bearer_tokens():
+    return [BEARER_TOKEN, BEARER_TOKEN2, BEARER_TOKEN3]
+
+
+# Append every raw response to the archive when a directory is given, so the
+# data can be re-derived later with response_archive.py without the API
+def open_archive(args):
+    if not args.archive:
+        return None
+    from response_archive import ResponseArchive
+
+    return ResponseArchive(args.archive)
+
+
+# Keep the history of user metrics and follow edges when a directory is given
+def open_history(args):
+    if not args.history:
+        return None
+    from history import History
+
+    return History(args.history)
+
+
+# Indexes of models.py missing on tables created before they were added. On
+# PostgreSQL they are built CONCURRENTLY, so the crawl keeps writing meanwhile.
+def add_missing_indexes(engine):
+    from sqlalchemy import inspect, text
+    from models import Base, created_on
+    from partitions import create_index_concurrently
+
+    inspector = inspect(engine)
+    postgres = engine.dialect.name == "postgresql"
+    # CONCURRENTLY cannot run inside a transaction block
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+        for table in Base.metadata.sorted_tables:
+            existing = {index["name"] for index in inspector.get_indexes(table.name)}
+            for index in table.indexes:
+                if index.name in existing or not created_on(index, engine.dialect.name):
+                    continue
+                columns = ", ".join(column.name for column in index.columns)
+                print(f"Creating index {index.name} on {table.name} ({columns}).")
+                if postgres:
+                    create_index_concurrently(connection, index.name, table.name, f"({columns})")
+                else:
+                    unique = "UNIQUE " if index.unique else ""
+                    connection.execute(
+                        text(f"CREATE {unique}INDEX {index.name} ON {table.name} ({columns})")
+                    )
+
+
+def migrate(args):
+    from models import Base
+    from crawl_state import migrate_crawl_state
+    from migrate_edges import migrate_edges
+    from migrate_ids import migrate_ids
+    from partitions import fill_created_at, migrate_partitions
+    from text_search import migrate_search
+
+    engine = database(args.url)
+    Base.metadata.create_all(engine)
+    migrate_crawl_state(engine)
+    migrate_edges(engine)
+    # created_at joins the primary key, fill it before any key is rebuilt
+    fill_created_at(engine)
+    migrate_ids(engine, args.batch, args.lock_timeout, args.vacuum_full)
+    migrate_partitions(engine, args.batch, args.lock_timeout)
+    add_missing_indexes(engine)
+    migrate_search(engine, args.batch)
+
+
+# Full-archive search allows one request per second on each token. The range is
+# split into windows of similar volume that are walked concurrently, one per
+# token at a time, and every page is committed as soon as it has been stored.
+def search(args):
+    from rate_limit import TokenPool
+    from bulk_writer import BulkWriter
+    from crawler import CrawlEngine
+    from tweet_search import SearchEndpoint, plan_windows
+
+    session = open_session(args)
+    archive = open_archive(args)
+    tokens = bearer_tokens()
+    token_pool = TokenPool(tokens, max_in_flight=1, min_interval=1)
+    http = http_session()
+    try:
+        windows = plan_windows(
+            API_BASE_URL, token_pool, args.query, args.start, args.end, args.windows, http
+        )
+        writer = BulkWriter(session, max_rows=1)
+        with CrawlEngine(
+            API_BASE_URL,
+            tokens,
+            per_token_concurrency=1,
+            progress_every=len(windows) or 1,
+            pool=token_pool,
+            writer=writer,
+            archive=archive,
+        ) as crawl_engine:
+            crawl_engine.run(
+                SearchEndpoint(writer, args.query, windows),
+                [window.key for window in windows],
+            )
+    finally:
+        http.close()
+        session.close()
+        if archive is not None:
+            archive.close()
+
+
+# Hydrate every user with NULL created_at, 100 ids per request. Suspended or
+# deleted accounts are marked with unavailable_reason and skipped on later runs.
+# --recrawl fetches every available user again, to refresh their metrics.
+def hydrate(args):
+    from user_hydration import hydrate_pending_users
+    from user_source import available
+
+    session = open_session(args)
+    archive = open_archive(args)
+    history = open_history(args)
+    try:
+        hydrate_pending_users(
+            session,
+            API_BASE_URL,
+            bearer_tokens(),
+            history=history,
+            filters=available() if args.recrawl else None,
+            archive=archive,
+        )
+    finally:
+        session.close()
+        if archive is not None:
+            archive.close()
+        if history is not None:
+            history.close()
+
+
+# Run an endpoint over users with the asyncio engine, or with one tweepy
+# client per token for --v2
+def crawl(args, endpoint, user_ids, checkpoints, total, writer, archive):
+    if args.v2:
+        from tweepy_crawler import TweepyCrawler
+
+        crawler = TweepyCrawler(bearer_tokens(), writer=writer, archive=archive)
+        return crawler.run(endpoint, user_ids, checkpoints=checkpoints, total=total)
+
+    from crawler import CrawlEngine
+
+    with CrawlEngine(
+        API_BASE_URL, bearer_tokens(), writer=writer, archive=archive
+    ) as crawl_engine:
+        return crawl_engine.run(endpoint, user_ids, checkpoints=checkpoints, total=total)
+
+
+# Sync the timeline of every collected user. Users synced before only get
+# tweets newer than the newest one stored (since_id), checkpoints are only used
+# to resume interrupted timelines. --v2 walks every page of the v2 timeline
+# with tweepy instead of the aiohttp client.
+def tweets(args):
+    from bulk_writer import BulkWriter
+    from crawl_state import CrawlCheckpoints
+    from user_source import collected, count_users, iter_user_ids
+    from timeline_sync import TimelineSyncEndpoint
+
+    session = open_session(args)
+    archive = open_archive(args)
+    try:
+        writer = BulkWriter(session)
+        checkpoints = CrawlCheckpoints(session, writer, "tweets", skip_done=False)
+        timeline = TimelineSyncEndpoint(session, writer, checkpoints)
+        user_ids = iter_user_ids(session, collected())
+        total = count_users(session, collected())
+        crawl(
+            args, timeline, timeline.prepare(user_ids), checkpoints, total, writer, archive
+        )
+        print(f"Timelines synced: {timeline.modes}")
+    finally:
+        session.close()
+        if archive is not None:
+            archive.close()
+
+
+# Crawl the following or followers of every user whose crawl is not finished.
+# Users that are done are skipped and unfinished ones resume from their last
+# stored page. --recrawl walks the lists of every collected user again, so the
+# history sees the follows gained and lost since. --v2 asks for 1000 users per
+# page through tweepy.
+def edges(args):
+    from bulk_writer import BulkWriter
+    from crawl_state import CrawlCheckpoints
+    from user_source import collected, count_users, iter_user_ids, not_crawled
+    from endpoints import following_endpoint, followers_endpoint
+
+    make_endpoint = {"following": following_endpoint, "followers": followers_endpoint}
+    session = open_session(args)
+    archive = open_archive(args)
+    history = open_history(args)
+    try:
+        writer = BulkWriter(session)
+        checkpoints = CrawlCheckpoints(
+            session, writer, args.command, skip_done=not args.recrawl
+        )
+        max_results = 1000 if args.v2 else 100
+        endpoint = make_endpoint[args.command](writer, max_results=max_results, history=history)
+        filters = collected() if args.recrawl else not_crawled(args.command)
+        user_ids = iter_user_ids(session, filters)
+        total = count_users(session, filters)
+        crawl(args, endpoint, user_ids, checkpoints, total, writer, archive)
+    finally:
+        session.close()
+        if archive is not None:
+            archive.close()
+        if history is not None:
+            history.close()
+
+
+# Backfill the interaction tables from the text of stored tweets and from
+# the search and timeline pages of the response archive, then look up the
+# authors of retweeted and quoted tweets that are stored
+def interactions(args):
+    from bulk_writer import BulkWriter
+    from interactions import backfill_archive, backfill_tweets, resolve_reference_authors
+
+    session = open_session(args)
+    try:
+        writer = BulkWriter(session)
+        if args.source in ("tweets", "all"):
+            backfill_tweets(session, writer, args.workers)
+        if args.source in ("archive", "all"):
+            if not args.archive:
+                raise SystemExit("No archive directory, pass --archive or set ARCHIVE_DIR.")
+            backfill_archive(args.archive, writer, args.workers)
+        print(f"Resolved the authors of {resolve_reference_authors(session)} referenced tweets.")
+    finally:
+        session.close()
+
+
+# Rebuild the threads of the conversations with new tweets, or of every
+# conversation with --rebuild, then list the largest threads
+def threads(args):
+    from bulk_writer import BulkWriter
+    from models import Thread
+    from thread_index import build_threads, rebuild_threads
+
+    session = open_session(args)
+    try:
+        writer = BulkWriter(session)
+        if args.rebuild:
+            rebuild_threads(session, writer)
+        build_threads(session, writer)
+        largest = (
+            session.query(Thread)
+            .order_by(Thread.tweets.desc(), Thread.conversation_id)
+            .limit(args.top)
+        )
+        print(
+            f"\n{'conversation':>20} {'tweets':>7} {'depth':>6} {'breadth':>8} "
+            f"{'participants':>13} {'first reply':>12}"
+        )
+        for thread in largest:
+            first_reply = ""
+            if thread.started_at is not None and thread.first_reply_at is not None:
+                minutes = (thread.first_reply_at - thread.started_at).total_seconds() / 60
+                first_reply = f"{minutes:.0f} min"
+            print(
+                f"{thread.conversation_id:>20} {thread.tweets:>7} {thread.depth:>6} "
+                f"{thread.breadth:>8} {thread.participants:>13} {first_reply:>12}"
+            )
+    finally:
+        session.close()
+
+
+# Stored tweets matching words, prefix*, "phrases" and #hashtags, in any case
+# and with or without diacritics
+def find(args):
+    from datetime import datetime
+    from models import Tweet
+    from partitions import posted_between
+    from text_search import search_tweets
+
+    session = open_session(args)
+    try:
+        start = datetime.fromisoformat(args.start) if args.start else None
+        end = datetime.fromisoformat(args.end) if args.end else None
+        tweet_ids = search_tweets(session, args.query, start, end, args.limit, args.index)
+        # The window again, so only its partitions are probed for the ids
+        tweets = {
+            tweet.id: tweet
+            for tweet in session.query(Tweet.id, Tweet.created_at, Tweet.text).filter(
+                Tweet.id.in_(tweet_ids), *posted_between(start, end)
+            )
+        }
+        for tweet_id in tweet_ids:
+            tweet = tweets[tweet_id]
+            posted = f"{tweet.created_at:%Y-%m-%d %H:%M}" if tweet.created_at else ""
+            text = " ".join((tweet.text or "").split())
+            print(f"{tweet_id:>20} {posted:>16} {text[:80]}")
+        print(f"{len(tweet_ids)} tweets.")
+    finally:
+        session.close()
+
+
+# Tweets stored per month, and moving the months before --detach-before out
+# of the database into Parquet under --directory
+def partitions(args):
+    from partitions import detach_partitions, list_partitions
+
+    engine = database(args.url)
+    require_schema(engine)
+    if args.detach_before:
+        detach_partitions(engine, args.detach_before, args.directory)
+    months = list_partitions(engine)
+    for month, rows, size in months:
+        line = f"{month:%Y-%m} {rows:>12}"
+        if size is not None:
+            line += f" {size / 2**20:>10.1f} MB"
+        print(line)
+    print(f"{len(months)} months, {sum(rows for _, rows, _ in months)} tweets.")
+
+
+# Size, reciprocity and the most central accounts of the follow graph, or of
+# the weighted interaction graph
+def analyze(args):
+    from models import User
+    from network_graph import load_graph, load_interaction_graph
+
+    session = open_session(args)
+    try:
+        if args.graph == "interactions":
+            graph = load_interaction_graph(session)
+            edges = "interacting pairs"
+            ranking = ("accounts interacting", graph.in_degree())
+        else:
+            graph = load_graph(session)
+            edges = "follows"
+            ranking = ("followers", graph.in_degree())
+        if not graph.node_count:
+            print("No users stored yet.")
+            return
+        print(
+            f"{graph.node_count} users, {graph.edge_count} {edges} "
+            f"({graph.nbytes() / 2**20:.1f} MB in memory), "
+            f"reciprocity {graph.reciprocity():.3f}"
+        )
+        rankings = (ranking, ("pagerank", graph.pagerank()))
+        for name, scores in rankings:
+            top = graph.top(scores, args.top)
+            usernames = dict(
+                session.query(User.id, User.username).filter(
+                    User.id.in_([user_id for user_id, _ in top])
+                )
+            )
+            print(f"\nTop {len(top)} by {name}:")
+            for user_id, score in top:
+                print(f"{user_id:>20} {usernames.get(user_id) or '':>20} {score:>12.6g}")
+    finally:
+        session.close()
+
+
+# The follow graph and the metrics of users at --as-of (default now) from the
+# history, after recording the database in it with --seed
+def history(args):
+    from datetime import datetime
+    from history import History
+
+    if not args.directory:
+        raise SystemExit("No history directory, pass --directory or set HISTORY_DIR.")
+    history = History(args.directory)
+    if args.seed:
+        session = open_session(args)
+        try:
+            history.seed(session)
+        finally:
+            session.close()
+    at = datetime.fromisoformat(args.as_of) if args.as_of else None
+    graph = history.graph_as_of(at)
+    metrics = history.metrics_as_of(at)
+    moment = f"{at:%Y-%m-%d %H:%M}" if at else "now"
+    print(
+        f"As of {moment}: {graph.node_count} users, {graph.edge_count} follows, "
+        f"metrics of {metrics.num_rows} users."
+    )
+    if not graph.node_count:
+        return
+    top = graph.top(graph.in_degree(), args.top)
+    print(f"\nTop {len(top)} by followers:")
+    for user_id, score in top:
+        print(f"{user_id:>20} {score:>12.6g}")
+
+
+# Expand the users around the authors of topical tweets, most promising first,
+# until --hops or the request --budget is reached
+def snowball(args):
+    from snowball import Snowball
+
+    session = open_session(args)
+    try:
+        Snowball(
+            session,
+            API_BASE_URL,
+            bearer_tokens(),
+            directions=args.directions.split(","),
+            max_hops=args.hops,
+            budget=args.budget,
+            round_size=args.round_size,
+            hub_max_pages=args.hub_pages,
+        ).run()
+    finally:
+        session.close()
+
+
+# Add the users a job has not finished to its queue with --fill, put failed
+# users back with --requeue-failed, and show the progress of its workers
+def queue(args):
+    from user_source import collected, not_crawled
+    from work_queue import DONE, enqueue_users, print_progress, requeue
+
+    session = open_session(args)
+    try:
+        if args.fill:
+            # Timelines are synced again on every run, edges only once
+            filters = collected()
+            if args.job == "tweets":
+                print(f"Requeued {requeue(session, args.job, DONE)} synced users.")
+            else:
+                filters = not_crawled(args.job)
+            print(f"Added {enqueue_users(session, args.job, filters)} users to {args.job}.")
+        if args.requeue_failed:
+            print(f"Requeued {requeue(session, args.job)} failed users.")
+        print_progress(session, args.job)
+    finally:
+        session.close()
+
+
+# One crawl worker of a distributed job. Fill the queue once with
+# `prostreno.py queue following --fill`, then start any number of workers,
+# e.g. three machines sharing the three tokens of config.py:
+#   prostreno.py worker following --slice 0/3
+#   prostreno.py worker following --slice 1/3
+#   prostreno.py worker following --slice 2/3
+# Each worker claims users from the queue until none are left, and picks up
+# the users of workers that stopped heartbeating.
+def worker(args):
+    from bulk_writer import BulkWriter
+    from crawl_state import CrawlCheckpoints
+    from crawler import CrawlEngine
+    from endpoints import following_endpoint, followers_endpoint
+    from timeline_sync import TimelineSyncEndpoint
+    from work_queue import WorkQueue, print_progress
+
+    session = open_session(args)
+    # This worker's share of the bearer tokens
+    index, count = (int(part) for part in args.slice.split("/"))
+    tokens = bearer_tokens()[index::count]
+    writer = BulkWriter(session)
+    work_queue = WorkQueue(
+        session,
+        writer,
+        args.job,
+        lease_seconds=args.lease,
+        batch_size=args.batch,
+        tokens=len(tokens),
+    )
+    # Timelines are synced again on every run, edges are crawled once
+    checkpoints = CrawlCheckpoints(
+        session,
+        writer,
+        args.job,
+        skip_done=args.job != "tweets",
+        queue=work_queue,
+        batch_size=args.batch,
+    )
+    if args.job == "tweets":
+        endpoint = TimelineSyncEndpoint(session, writer, checkpoints)
+    elif args.job == "following":
+        endpoint = following_endpoint(writer)
+    else:
+        endpoint = followers_endpoint(writer)
+    crawl_engine = CrawlEngine(
+        API_BASE_URL, tokens, per_token_concurrency=args.concurrency, writer=writer
+    )
+    work_queue.start()
+    try:
+        while True:
+            keys = work_queue.keys()
+            if args.job == "tweets":
+                keys = endpoint.prepare(keys, batch_size=args.batch)
+            crawl_engine.run(endpoint, keys, checkpoints=checkpoints)
+            work_queue.heartbeat()
+            print_progress(session, args.job)
+            # Other workers may still hold leases that expire if they crashed
+            if not work_queue.wait_for_work(poll_seconds=min(5, args.lease / 3)):
+                break
+    finally:
+        work_queue.stop()
+        crawl_engine.close()
+        session.close()
+
+
+# Feed the pages of the response archive through the endpoints again, to
+# rebuild the database or re-derive it with new parsing code without the API
+def replay(args):
+    from bulk_writer import BulkWriter
+    from endpoints import following_endpoint, followers_endpoint
+    from response_archive import replay as replay_archive
+    from timeline_sync import TimelineSyncEndpoint
+    from tweet_search import SearchEndpoint
+    from user_hydration import users_endpoint
+
+    if not args.archive:
+        raise SystemExit("No archive directory, pass --archive or set ARCHIVE_DIR.")
+    session = open_session(args)
+    try:
+        writer = BulkWriter(session)
+        # Built in this order whatever the order asked for, so authors are
+        # registered with the writer before tweets
+        available = {
+            "search": lambda: SearchEndpoint(writer, None, []),
+            "users": lambda: users_endpoint(session),
+            "tweets": lambda: TimelineSyncEndpoint(session, writer),
+            "following": lambda: following_endpoint(writer),
+            "followers": lambda: followers_endpoint(writer),
+        }
+        wanted = args.endpoints.split(",")
+        endpoints = [build() for name, build in available.items() if name in wanted]
+        replay_archive(args.archive, endpoints, writer=writer, workers=args.workers)
+    finally:
+        session.close()
+
+
+# Parquet snapshot of every table, only what is new since the last one with
+# --incremental
+def snapshot(args):
+    from snapshot import export_snapshot
+
+    session = open_session(args)
+    try:
+        export_snapshot(session, args.directory, incremental=args.incremental)
+    finally:
+        session.close()
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="prostreno.py")
+    parser.add_argument("--url", default=DATABASE_URL, help="SQLAlchemy database URL")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    command = subparsers.add_parser("migrate", help="create and upgrade the tables")
+    command.add_argument("--batch", type=int, default=10_000, help="rows backfilled per transaction")
+    command.add_argument(
+        "--lock-timeout", type=int, default=10, help="seconds to wait for locks when swapping ids"
+    )
+    command.add_argument("--vacuum-full", action="store_true")
+    command.set_defaults(handler=migrate)
+
+    # Commands that call the API can archive the raw responses
+    def crawl_command(name, handler, help):
+        command = subparsers.add_parser(name, help=help)
+        command.add_argument(
+            "--archive", default=ARCHIVE_DIR, help="directory to archive raw responses in"
+        )
+        command.set_defaults(handler=handler)
+        return command
+
+    command = crawl_command("search", search, "full-archive search for the show")
+    command.add_argument("--query", default=QUERY)
+    command.add_argument("--start", default="2023-04-01T00:00:00Z")
+    command.add_argument("--end", default="2023-05-26T00:00:00Z")
+    command.add_argument("--windows", type=int, default=12, help="time windows crawled concurrently")
+
+    # Commands whose results can be kept in the history as well
+    def history_command(name, handler, help):
+        command = crawl_command(name, handler, help)
+        command.add_argument(
+            "--history", default=HISTORY_DIR, help="directory of the metrics and edge history"
+        )
+        command.add_argument(
+            "--recrawl", action="store_true", help="fetch users that are done again"
+        )
+        return command
+
+    history_command("hydrate", hydrate, "fetch the profiles of stored users")
+
+    command = crawl_command("tweets", tweets, "sync the timelines of stored users")
+    command.add_argument("--v2", action="store_true", help="crawl with tweepy")
+
+    for name in ("following", "followers"):
+        command = history_command(name, edges, f"crawl the {name} of stored users")
+        command.add_argument("--v2", action="store_true", help="crawl with tweepy")
+
+    command = subparsers.add_parser(
+        "interactions", help="derive interaction edges from stored tweets and the archive"
+    )
+    command.add_argument("--source", choices=["tweets", "archive", "all"], default="all")
+    command.add_argument(
+        "--archive", default=ARCHIVE_DIR, help="directory of the response archive"
+    )
+    command.add_argument("--workers", type=int, default=None, help="parsing processes")
+    command.set_defaults(handler=interactions)
+
+    command = subparsers.add_parser("threads", help="build reply trees and thread statistics")
+    command.add_argument(
+        "--rebuild", action="store_true", help="rebuild every thread, not only the queued ones"
+    )
+    command.add_argument("--top", type=int, default=10)
+    command.set_defaults(handler=threads)
+
+    command = subparsers.add_parser("find", help="search the text of stored tweets")
+    command.add_argument("query", help='words, prefix*, "phrases" and #hashtags, all required')
+    command.add_argument("--start", help="posted at or after, ISO date")
+    command.add_argument("--end", help="posted before, ISO date")
+    command.add_argument("--limit", type=int, default=20)
+    command.add_argument(
+        "--index", default="text_index.npz", help="text index file of SQLite databases"
+    )
+    command.set_defaults(handler=find)
+
+    command = subparsers.add_parser(
+        "partitions", help="list the months of stored tweets, archive old ones"
+    )
+    command.add_argument(
+        "--detach-before", help="archive the tweets of the months before this ISO date"
+    )
+    command.add_argument(
+        "--directory", default="tweet_archive", help="directory of the Parquet archive"
+    )
+    command.set_defaults(handler=partitions)
+
+    command = subparsers.add_parser("analyze", help="summarize the follow or interaction graph")
+    command.add_argument("--graph", choices=["follow", "interactions"], default="follow")
+    command.add_argument("--top", type=int, default=10)
+    command.set_defaults(handler=analyze)
+
+    command = subparsers.add_parser(
+        "history", help="the follow graph and user metrics at a past time"
+    )
+    command.add_argument(
+        "--directory", default=HISTORY_DIR, help="directory of the metrics and edge history"
+    )
+    command.add_argument(
+        "--seed", action="store_true", help="record the stored users and edges first"
+    )
+    command.add_argument("--as-of", help="ISO time, default now")
+    command.add_argument("--top", type=int, default=10)
+    command.set_defaults(handler=history)
+
+    command = subparsers.add_parser(
+        "snowball", help="crawl the network around the authors of the show"
+    )
+    command.add_argument("--hops", type=int, default=2)
+    command.add_argument("--budget", type=int, default=None, help="maximum API requests")
+    command.add_argument("--round-size", type=int, default=100)
+    command.add_argument(
+        "--hub-pages", type=int, default=5, help="max pages per direction of a hub account"
+    )
+    command.add_argument("--directions", default="following,followers")
+    command.set_defaults(handler=snowball)
+
+    command = subparsers.add_parser(
+        "queue", help="fill the queue of a distributed job and show its progress"
+    )
+    command.add_argument("job", choices=JOBS)
+    command.add_argument(
+        "--fill", action="store_true", help="add the users the job has not finished"
+    )
+    command.add_argument("--requeue-failed", action="store_true", help="retry users that failed")
+    command.set_defaults(handler=queue)
+
+    command = subparsers.add_parser("worker", help="run one crawl worker of a distributed job")
+    command.add_argument("job", choices=JOBS)
+    command.add_argument(
+        "--slice",
+        default="0/1",
+        metavar="INDEX/COUNT",
+        help="use every COUNT-th bearer token starting at INDEX",
+    )
+    command.add_argument("--lease", type=float, default=300, help="lease length in seconds")
+    command.add_argument("--batch", type=int, default=100, help="users claimed at a time")
+    command.add_argument(
+        "--concurrency", type=int, default=4, help="requests in flight per token"
+    )
+    command.set_defaults(handler=worker)
+
+    command = subparsers.add_parser("replay", help="rebuild the database from the archive")
+    command.add_argument(
+        "--archive", default=ARCHIVE_DIR, help="directory of the response archive"
+    )
+    command.add_argument(
+        "--endpoints",
+        default="search,users,tweets,following,followers",
+        help="comma-separated endpoint names to replay",
+    )
+    command.add_argument("--workers", type=int, default=None, help="decoding processes")
+    command.set_defaults(handler=replay)
+
+    command = subparsers.add_parser("snapshot", help="export the database as Parquet")
+    command.add_argument("--directory", default="snapshot")
+    command.add_argument(
+        "--incremental", action="store_true", help="only what is new since the last snapshot"
+    )
+    command.set_defaults(handler=snapshot)
+
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    try:
+        args.handler(args)
+    finally:
+        dispose_engines()
+
+
+if __name__ == "__main__":
+    main()
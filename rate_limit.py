@@ -0,0 +1,208 @@
+import asyncio
+import threading
+import time
+
+# Token pool scheduler driven by the x-rate-limit-* headers the API returns on
+# every response. Quota is tracked per (token, endpoint), every request is
+# routed to the token with the most budget left, and callers only sleep until
+# the earliest reset when every token is exhausted.
+
+# How long to back off after a 429 that carried no x-rate-limit-reset header
+DEFAULT_BACKOFF = 60
+
+
+class Window:
+    def __init__(self):
+        self.limit = None
+        self.remaining = None
+        self.reset = 0.0
+        # Requests sent since the window expired, before a response told us the new one
+        self.pending = 0
+
+    def exhausted(self, now):
+        return self.remaining is not None and self.remaining <= 0 and self.reset > now
+
+
+class TokenPool:
+    # max_in_flight: concurrent requests allowed per token, None for no cap
+    # min_interval:  seconds between two requests on one token (full-archive
+    #                search allows one request per second)
+    def __init__(
+        self, bearer_tokens, max_in_flight=None, min_interval=0, clock=time.time
+    ):
+        self.tokens = list(bearer_tokens)
+        self.max_in_flight = max_in_flight
+        self.min_interval = min_interval
+        self.clock = clock
+        self._last_request = [0.0] * len(self.tokens)
+        self.in_flight = [0] * len(self.tokens)
+        self.requests = [0] * len(self.tokens)
+        self.rate_limited = 0
+        # Wall-clock seconds during which no token had budget left
+        self.idle_time = 0.0
+        self._idle_since = None
+        self._windows = {}
+        self._lock = threading.Lock()
+
+    def _window(self, slot, endpoint):
+        key = (slot, endpoint)
+        if key not in self._windows:
+            self._windows[key] = Window()
+        return self._windows[key]
+
+    # Pick a token for the endpoint and reserve one request of its budget.
+    # Returns (slot, None) on success or (None, seconds to wait).
+    def try_acquire(self, endpoint):
+        with self._lock:
+            now = self.clock()
+            best = None
+            best_remaining = None
+            earliest_reset = None
+            earliest_interval = None
+            # A token with budget has its max_in_flight requests out
+            busy = False
+            for slot in range(len(self.tokens)):
+                window = self._window(slot, endpoint)
+                if window.exhausted(now):
+                    if earliest_reset is None or window.reset < earliest_reset:
+                        earliest_reset = window.reset
+                    continue
+                if self.max_in_flight and self.in_flight[slot] >= self.max_in_flight:
+                    busy = True
+                    continue
+                next_allowed = self._last_request[slot] + self.min_interval
+                if next_allowed > now:
+                    if earliest_interval is None or next_allowed < earliest_interval:
+                        earliest_interval = next_allowed
+                    continue
+                # A window that has reset or was never seen counts as full budget
+                # until the first response, ties go to the token with fewer
+                # requests in flight
+                if window.remaining is None or window.reset <= now:
+                    if window.limit and window.pending >= window.limit:
+                        continue
+                    budget = (window.limit or float("inf")) - window.pending
+                else:
+                    budget = window.remaining
+                remaining = (budget, -self.in_flight[slot])
+                if best is None or remaining > best_remaining:
+                    best = slot
+                    best_remaining = remaining
+
+            if best is None:
+                # In-flight requests are in the way, poll again shortly rather
+                # than sleep until the reset of another, exhausted token
+                if busy or earliest_reset is None and earliest_interval is None:
+                    return None, 0.01
+                # Tokens are only pacing themselves, wait for the first one
+                if earliest_interval is not None:
+                    return None, earliest_interval - now
+                if self._idle_since is None:
+                    self._idle_since = now
+                return None, max(earliest_reset - now, 0.0) + 0.01
+
+            if self._idle_since is not None:
+                self.idle_time += now - self._idle_since
+                self._idle_since = None
+
+            window = self._window(best, endpoint)
+            if window.remaining is not None and window.reset > now:
+                window.remaining -= 1
+            else:
+                window.pending += 1
+            self.in_flight[best] += 1
+            self.requests[best] += 1
+            self._last_request[best] = now
+            return best, None
+
+    # Block until a token has budget for the endpoint and return its slot. With
+    # a threading.Event as `stop`, setting it ends the wait and returns None.
+    def acquire(self, endpoint, stop=None):
+        while True:
+            slot, wait = self.try_acquire(endpoint)
+            if slot is not None:
+                return slot
+            self._sleeping(endpoint, wait)
+            if stop is None:
+                time.sleep(wait)
+            elif stop.wait(wait):
+                return None
+
+    async def acquire_async(self, endpoint):
+        while True:
+            slot, wait = self.try_acquire(endpoint)
+            if slot is not None:
+                return slot
+            self._sleeping(endpoint, wait)
+            await asyncio.sleep(wait)
+
+    def _sleeping(self, endpoint, wait):
+        if wait >= 1:
+            print(
+                f"All tokens exhausted for {endpoint}. "
+                f"Sleeping {wait:.0f} seconds until the earliest reset."
+            )
+
+    # Record the outcome of a request made with `slot`, reading the rate-limit headers
+    def update(self, slot, endpoint, status, headers):
+        with self._lock:
+            self.in_flight[slot] -= 1
+            window = self._window(slot, endpoint)
+            limit = headers.get("x-rate-limit-limit")
+            remaining = headers.get("x-rate-limit-remaining")
+            reset = headers.get("x-rate-limit-reset")
+
+            if reset is not None:
+                reset = float(reset)
+                if reset > window.reset:
+                    # A new window. Requests sent into it that are still in
+                    # flight will use budget the header does not show yet.
+                    in_flight = max(window.pending - 1, 0)
+                    window.reset = reset
+                    window.remaining = None
+                    window.pending = 0
+                    if remaining is not None:
+                        remaining = int(remaining) - in_flight
+                elif reset < window.reset:
+                    # A late response from a previous window tells us nothing
+                    remaining = None
+            if limit is not None:
+                window.limit = int(limit)
+            if remaining is not None:
+                remaining = int(remaining)
+                # Responses can arrive out of order, never hand budget back
+                if window.remaining is None or remaining < window.remaining:
+                    window.remaining = remaining
+
+            if status == 429:
+                self.rate_limited += 1
+                window.remaining = 0
+                # Without a usable reset header fall back to a fixed backoff
+                now = self.clock()
+                if window.reset <= now:
+                    window.reset = now + (DEFAULT_BACKOFF if reset is None else 1)
+
+    # Live quota state, one entry per token and endpoint seen so far
+    def state(self):
+        with self._lock:
+            now = self.clock()
+            return [
+                {
+                    "token": slot + 1,
+                    "endpoint": endpoint,
+                    "limit": window.limit,
+                    "remaining": window.remaining,
+                    "resets_in": max(window.reset - now, 0.0),
+                    "in_flight": self.in_flight[slot],
+                    "requests": self.requests[slot],
+                }
+                for (slot, endpoint), window in sorted(self._windows.items())
+            ]
+
+    def summary(self):
+        return ", ".join(
+            f"token {entry['token']} {entry['endpoint']}: "
+            f"{entry['remaining'] if entry['remaining'] is not None else '?'}"
+            f"/{entry['limit'] or '?'} left, reset in {entry['resets_in']:.0f}s"
+            for entry in self.state()
+        )
@@ -0,0 +1,190 @@
+import glob
+import json
+import os
+import threading
+import time
+from collections import deque
+from datetime import datetime, timezone
+from multiprocessing import Pool
+import zstandard
+
+# Archive of raw API responses. Every successful response is appended as one
+# JSON line holding the endpoint, crawl key, request params, token slot and the
+# response body exactly as received, into zstd-compressed files that rotate
+# once they hold `max_bytes` of JSON. Each record also says whether the page
+# ended its key's chain and whether the page cap cut the chain short. replay()
+# feeds the archived pages back through the endpoints' on_start, on_page and
+# on_done callbacks, so the database can be rebuilt or re-derived with new
+# parsing code without a single API call. Files are decoded in parallel worker
+# processes and applied in the order written.
+
+MAX_BYTES = 16 * 2**20
+FILE_PATTERN = "responses-*.jsonl.zst"
+
+
+class ResponseArchive:
+    def __init__(self, directory, max_bytes=MAX_BYTES, level=3):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.compressor = zstandard.ZstdCompressor(level=level)
+        self.records = 0
+        self._file = None
+        self._stream = None
+        self._bytes = 0
+        self._sequence = 0
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def _open(self):
+        # Names sort in the order the files were written
+        stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S")
+        self._sequence += 1
+        path = os.path.join(
+            self.directory,
+            f"responses-{stamp}-{os.getpid()}-{self._sequence:04d}.jsonl.zst",
+        )
+        self._file = open(path, "wb")
+        self._stream = self.compressor.stream_writer(self._file)
+        self._bytes = 0
+
+    # Append one response. `body` is the raw response body (bytes or str),
+    # `last` is True for the last page of the key's chain and `truncated` when
+    # the endpoint's page cap ended the chain there.
+    def record(self, endpoint, key, params, slot, body, last=True, truncated=False):
+        if isinstance(body, str):
+            body = body.encode()
+        meta = json.dumps(
+            {
+                "endpoint": endpoint,
+                "key": key,
+                "params": params,
+                "slot": slot,
+                "last": last,
+                "truncated": truncated,
+                "received_at": time.time(),
+            },
+            ensure_ascii=False,
+        ).encode()
+        # The body is already JSON, embed it without parsing it again
+        line = meta[:-1] + b', "body": ' + body.strip() + b"}\n"
+        with self._lock:
+            if self._stream is None or self._bytes >= self.max_bytes:
+                self._close()
+                self._open()
+            self._stream.write(line)
+            self._bytes += len(line)
+            self.records += 1
+
+    # End the current zstd frame so everything recorded so far can be read,
+    # even if the process is killed before close()
+    def flush(self):
+        with self._lock:
+            if self._stream is not None:
+                self._stream.flush(zstandard.FLUSH_FRAME)
+                self._file.flush()
+
+    def _close(self):
+        if self._stream is not None:
+            self._stream.close()
+            self._stream = None
+            self._file = None
+
+    def close(self):
+        with self._lock:
+            self._close()
+
+
+# Yield the archived records of one file. A file cut short by a killed
+# process is read up to its last complete line.
+def iter_records(path, chunk_size=2**20):
+    with open(path, "rb") as source:
+        reader = zstandard.ZstdDecompressor().stream_reader(
+            source, read_across_frames=True
+        )
+        pending = b""
+        while True:
+            try:
+                chunk = reader.read(chunk_size)
+            except zstandard.ZstdError:
+                chunk = b""
+            if not chunk:
+                return
+            lines = (pending + chunk).split(b"\n")
+            pending = lines.pop()
+            for line in lines:
+                yield json.loads(line)
+
+
+# Worker: decode a whole file, keeping (endpoint, key, body, last, truncated)
+# of the wanted endpoints. Records written before `last` was archived end
+# their chain on the page without a next token.
+def decode_file(job):
+    path, endpoints = job
+    return [
+        (
+            record["endpoint"],
+            record["key"],
+            record["body"],
+            record.get("last", "next_token" not in record["body"].get("meta", {})),
+            record.get("truncated", False),
+        )
+        for record in iter_records(path)
+        if endpoints is None or record["endpoint"] in endpoints
+    ]
+
+
+def archive_files(directory):
+    return sorted(glob.glob(os.path.join(directory, FILE_PATTERN)))
+
+
+# Feed every archived page of the given endpoints to its on_page callback, in
+# the order the files were written. The first page of a chain is preceded by
+# on_start(key, False) and its last page followed by on_done(key, truncated),
+# as in a crawl. A chain resumed in a later run continues in later files, so
+# it is only started once. At most two files per worker are decoded ahead, so
+# memory stays bounded however large the archive is. Returns the number of
+# pages replayed.
+def replay(directory, endpoints, writer=None, workers=None):
+    by_name = {endpoint.name: endpoint for endpoint in endpoints}
+    paths = archive_files(directory)
+    workers = workers or os.cpu_count()
+    pages = 0
+    done = 0
+    # (endpoint, key) of the chains started and not yet done
+    running = set()
+    start_time = time.time()
+
+    def apply(records):
+        nonlocal pages, done
+        for name, key, data, last, truncated in records:
+            endpoint = by_name[name]
+            if (name, key) not in running:
+                running.add((name, key))
+                if endpoint.on_start is not None:
+                    endpoint.on_start(key, False)
+            endpoint.on_page(key, data)
+            if last:
+                running.discard((name, key))
+                if endpoint.on_done is not None:
+                    endpoint.on_done(key, truncated)
+            pages += 1
+            if writer is not None:
+                writer.flush_if_due()
+        if writer is not None:
+            writer.flush()
+        done += 1
+        elapsed_time = time.time() - start_time
+        print(
+            f"Replayed file {done} of {len(paths)}, {pages} pages "
+            f"({pages / elapsed_time:.0f} pages/s)."
+        )
+
+    with Pool(workers) as pool:
+        decoding = deque()
+        for path in paths:
+            decoding.append(pool.apply_async(decode_file, ((path, set(by_name)),)))
+            if len(decoding) >= workers * 2:
+                apply(decoding.popleft().get())
+        while decoding:
+            apply(decoding.popleft().get())
+    return pages
@@ -0,0 +1,255 @@
+import json
+import os
+import shutil
+from datetime import datetime, timezone
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.fs as fs
+import pyarrow.parquet as pq
+from sqlalchemy import BigInteger, DateTime, Integer, cast, func, select
+from models import (
+    User,
+    Tweet,
+    Following,
+    Follower,
+    Mention,
+    Hashtag,
+    TweetReference,
+    Thread,
+    CrawlState,
+    TimelineSync,
+)
+
+# Columnar snapshots of the crawl database. Every table is written as
+# zstd-compressed Parquet through Arrow record batches, tweets partitioned by
+# the month they were posted in (hive-style month=YYYY-MM directories).
+# Incremental snapshots only append what is new since the previous one:
+#   key        rows whose numeric primary key is above the stored maximum
+#              (tweet ids grow with time)
+#   timestamp  rows whose timestamp column is newer than the stored maximum;
+#              an updated row is appended again and the newest copy wins on read
+# Tables without either are rewritten in full. snapshot.json records the
+# watermarks. Reads memory-map the Parquet files, and open_table() keeps an
+# uncompressed Arrow IPC copy that later runs memory-map without copying.
+
+BATCH_SIZE = 100_000
+MANIFEST = "snapshot.json"
+IPC_CACHE = ".arrow"
+
+# (model, partition, incremental)
+SNAPSHOT_TABLES = [
+    (User, None, None),
+    (Tweet, "month", ("key", "id")),
+    (Following, None, None),
+    (Follower, None, None),
+    (Mention, None, None),
+    (Hashtag, None, None),
+    (TweetReference, None, None),
+    (Thread, None, ("timestamp", "updated_at")),
+    (CrawlState, None, ("timestamp", "updated_at")),
+    (TimelineSync, None, ("timestamp", "synced_at")),
+]
+
+
+def arrow_type(column):
+    if isinstance(column.type, (Integer, BigInteger)):
+        return pa.int64()
+    if isinstance(column.type, DateTime):
+        return pa.timestamp("us")
+    return pa.string()
+
+
+def arrow_schema(model):
+    return pa.schema(
+        [(column.name, arrow_type(column)) for column in model.__table__.columns]
+    )
+
+
+def read_manifest(directory):
+    path = os.path.join(directory, MANIFEST)
+    if not os.path.exists(path):
+        return {"snapshots": 0, "tables": {}}
+    with open(path) as manifest:
+        return json.load(manifest)
+
+
+def write_manifest(directory, manifest):
+    path = os.path.join(directory, MANIFEST)
+    with open(path + ".tmp", "w") as output:
+        json.dump(manifest, output, indent=2)
+    os.replace(path + ".tmp", path)
+
+
+# Stream the rows matching `filters` as Arrow record batches, from `table`
+# if given (a table with the columns of the model), else the model's own
+def record_batches(session, model, filters=(), batch_size=BATCH_SIZE, table=None):
+    schema = arrow_schema(model)
+    result = session.execute(
+        select(model.__table__ if table is None else table)
+        .where(*filters)
+        .execution_options(yield_per=batch_size)
+    )
+    for rows in result.partitions(batch_size):
+        columns = list(zip(*rows))
+        yield pa.RecordBatch.from_arrays(
+            [
+                pa.array(values, type=field.type)
+                for values, field in zip(columns, schema)
+            ],
+            schema=schema,
+        )
+
+
+# Split a batch into (partition directory, rows) by the month of created_at
+def split_by_month(batch):
+    month = pc.strftime(batch.column("created_at"), format="%Y-%m")
+    for value in pc.unique(month).to_pylist():
+        if value is None:
+            yield "month=__HIVE_DEFAULT_PARTITION__", batch.filter(pc.is_null(month))
+        else:
+            yield f"month={value}", batch.filter(pc.equal(month, value))
+
+
+# Write the batches as one Parquet file per partition. Writing happens on the
+# calling thread, which is also the one reading from the session.
+def write_batches(batches, path, schema, partition, run):
+    writers = {}
+    rows = 0
+    try:
+        for batch in batches:
+            rows += batch.num_rows
+            parts = split_by_month(batch) if partition == "month" else [("", batch)]
+            for directory, part in parts:
+                writer = writers.get(directory)
+                if writer is None:
+                    os.makedirs(os.path.join(path, directory), exist_ok=True)
+                    writer = writers[directory] = pq.ParquetWriter(
+                        os.path.join(path, directory, f"part-{run:05d}.parquet"),
+                        schema,
+                        compression="zstd",
+                    )
+                writer.write_batch(part)
+        # An empty table still gets a file, so the snapshot can be read back
+        if not writers:
+            os.makedirs(path, exist_ok=True)
+            pq.write_table(
+                schema.empty_table(),
+                os.path.join(path, f"part-{run:05d}.parquet"),
+                compression="zstd",
+            )
+    finally:
+        for writer in writers.values():
+            writer.close()
+    return rows
+
+
+def incremental_filters(model, incremental, watermark):
+    kind, column_name = incremental
+    column = model.__table__.c[column_name]
+    if kind == "key":
+        return [cast(column, BigInteger) > int(watermark)]
+    return [column > datetime.fromisoformat(watermark)]
+
+
+def current_watermark(session, model, incremental):
+    kind, column_name = incremental
+    column = model.__table__.c[column_name]
+    if kind == "key":
+        value = session.execute(select(func.max(cast(column, BigInteger)))).scalar()
+        return None if value is None else str(value)
+    value = session.execute(select(func.max(column))).scalar()
+    return None if value is None else value.isoformat()
+
+
+def export_table(session, directory, model, partition, incremental, run, append):
+    name = model.__tablename__
+    path = os.path.join(directory, name)
+    schema = arrow_schema(model)
+    filters = []
+    if append:
+        watermark = read_manifest(directory)["tables"][name]["watermark"]
+        filters = incremental_filters(model, incremental, watermark)
+    elif os.path.exists(path):
+        shutil.rmtree(path)
+    # Read the watermark first, rows arriving during the export are picked up
+    # again next time instead of being missed
+    watermark = current_watermark(session, model, incremental) if incremental else None
+
+    batches = record_batches(session, model, filters)
+    rows = write_batches(batches, path, schema, partition, run)
+    return rows, watermark
+
+
+# Write a snapshot of every table. With incremental=True, tables that have a
+# watermark from an earlier snapshot only get their new rows appended.
+def export_snapshot(session, directory, incremental=False):
+    os.makedirs(directory, exist_ok=True)
+    manifest = read_manifest(directory)
+    run = manifest["snapshots"] + 1
+    for model, partition, incremental_key in SNAPSHOT_TABLES:
+        name = model.__tablename__
+        stored = manifest["tables"].get(name)
+        append = bool(
+            incremental
+            and incremental_key
+            and stored
+            and stored.get("watermark") is not None
+        )
+        rows, watermark = export_table(
+            session, directory, model, partition, incremental_key, run, append
+        )
+        if append and watermark is None:
+            watermark = stored["watermark"]
+        manifest["tables"][name] = {
+            "rows": (stored["rows"] if append else 0) + rows,
+            "watermark": watermark,
+            "version": run,
+        }
+        print(f"{name}: {rows} rows {'appended' if append else 'written'}.")
+    manifest["snapshots"] = run
+    manifest["created_at"] = datetime.now(timezone.utc).replace(tzinfo=None).isoformat()
+    write_manifest(directory, manifest)
+    return manifest
+
+
+# Read a table of a snapshot, memory-mapping its Parquet files. For tables
+# snapshotted by timestamp only the newest copy of every row is kept.
+def read_table(directory, name, columns=None):
+    model, partition, incremental = next(
+        entry for entry in SNAPSHOT_TABLES if entry[0].__tablename__ == name
+    )
+    path = os.path.join(directory, name)
+    dataset = ds.dataset(
+        path,
+        format="parquet",
+        partitioning="hive" if partition else None,
+        filesystem=fs.LocalFileSystem(use_mmap=True),
+    )
+    table = dataset.to_table(columns=columns)
+    if incremental and incremental[0] == "timestamp" and columns is None:
+        key = [column.name for column in model.__table__.primary_key]
+        newest = table.group_by(key).aggregate([(incremental[1], "max")])
+        newest = newest.rename_columns(key + [incremental[1]])
+        table = table.join(newest, keys=key + [incremental[1]], join_type="inner")
+    return table
+
+
+# A table as an Arrow IPC file memory-mapped without copying. The file is
+# written from the Parquet snapshot on first use and rewritten when a newer
+# snapshot of the table exists.
+def open_table(directory, name):
+    version = read_manifest(directory)["tables"][name]["version"]
+    cache = os.path.join(directory, IPC_CACHE)
+    path = os.path.join(cache, f"{name}-{version}.arrow")
+    if not os.path.exists(path):
+        os.makedirs(cache, exist_ok=True)
+        for stale in os.listdir(cache):
+            if stale.startswith(f"{name}-"):
+                os.remove(os.path.join(cache, stale))
+        table = read_table(directory, name)
+        with pa.OSFile(path + ".tmp", "wb") as sink:
+            with pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table, max_chunksize=1_000_000)
+        os.replace(path + ".tmp", path)
+    return pa.ipc.open_file(pa.memory_map(path)).read_all()
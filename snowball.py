@@ -0,0 +1,324 @@
+import heapq
+import math
+from collections import Counter
+from sqlalchemy import func, or_, select, update
+from models import User, Tweet, Following, Follower
+from bulk_writer import BulkWriter
+from crawler import CrawlEngine
+from crawl_state import CrawlCheckpoints
+from endpoints import following_endpoint, followers_endpoint
+from user_hydration import MAX_IDS_PER_REQUEST, chunked, users_endpoint
+
+# Snowball crawl of the network around the show. Authors of topical tweets
+# (stored by 1_tweet_grabber.py) are the seeds at hop 0; expanding a user
+# fetches their following and followers, and the users found there join the
+# frontier one hop further out. Instead of walking everyone with equal
+# priority, every round expands the frontier users with the best
+#   (1 + TOPICAL_WEIGHT * topical tweets + links from expanded users) / pages
+# where pages is the request cost estimated from following_count and
+# followers_count. Users without a profile yet are assumed to need one page
+# per direction; they are hydrated, 100 per request, only once they reach the
+# top of the frontier, and then rescored with their real cost. Hub accounts are
+# expanded with at most `hub_max_pages` pages per direction, so one mega-account
+# cannot use up the budget.
+# The crawl stops once no user within `max_hops` is left or the request budget
+# is spent. Expanded users are checkpointed like the edge grabbers, so a
+# rerun rebuilds the frontier from stored edges and only fetches what is new.
+
+TOPIC_KEYWORDS = ("prostřeno", "prostreno")
+TOPICAL_WEIGHT = 5
+PAGE_SIZE = 1000
+HUB_MAX_PAGES = 5
+
+DIRECTIONS = {
+    "following": (
+        following_endpoint,
+        Following,
+        Following.following_id,
+        "following_count",
+    ),
+    "followers": (
+        followers_endpoint,
+        Follower,
+        Follower.follower_id,
+        "followers_count",
+    ),
+}
+
+
+# Number of topical tweets per author
+def topical_counts(session, keywords=TOPIC_KEYWORDS):
+    topical = or_(
+        *(func.lower(Tweet.text).like(f"%{keyword}%") for keyword in keywords)
+    )
+    return dict(
+        session.query(Tweet.author_id, func.count())
+        .filter(topical, Tweet.author_id.isnot(None))
+        .group_by(Tweet.author_id)
+        .all()
+    )
+
+
+# Requests needed to walk an edge list of `count` users, at most max_pages
+def page_cost(count, page_size=PAGE_SIZE, max_pages=HUB_MAX_PAGES):
+    pages = max(1, math.ceil((count or 0) / page_size))
+    return min(pages, max_pages) if max_pages else pages
+
+
+class Snowball:
+    # directions:    edge lists fetched per expanded user
+    # max_hops:      users this many hops from a seed are stored but not expanded
+    # budget:        stop after this many API requests, None for no limit
+    # round_size:    users expanded per round; scores are updated between rounds
+    # page_size:     max_results of the edge requests
+    # hub_max_pages: cap on pages per direction and user
+    def __init__(
+        self,
+        session,
+        base_url,
+        bearer_tokens,
+        directions=("following", "followers"),
+        max_hops=2,
+        budget=None,
+        round_size=100,
+        page_size=PAGE_SIZE,
+        hub_max_pages=HUB_MAX_PAGES,
+    ):
+        self.session = session
+        self.directions = list(directions)
+        self.max_hops = max_hops
+        self.budget = budget
+        self.round_size = round_size
+        self.page_size = page_size
+        self.hub_max_pages = hub_max_pages
+        self.writer = BulkWriter(session)
+        self.endpoints = {
+            direction: DIRECTIONS[direction][0](
+                self.writer, max_results=page_size, max_pages=hub_max_pages
+            )
+            for direction in self.directions
+        }
+        self.checkpoints = {
+            direction: CrawlCheckpoints(session, self.writer, direction)
+            for direction in self.directions
+        }
+        self.crawl_engine = CrawlEngine(base_url, bearer_tokens, writer=self.writer)
+        self.topical = {}
+        # Hop of every user seen so far
+        self.hops = {}
+        # Links from expanded users to each user
+        self.links = Counter()
+        # Profile counts and availability of frontier users, None until hydrated
+        self.profiles = {}
+        self.expanded = set()
+        self.scores = {}
+        # Max-heap of (-score, user id), entries whose score changed are stale
+        self.frontier = []
+        self.requests = 0
+        self.rounds = 0
+
+    # Estimated requests to expand a user
+    def cost(self, user_id):
+        profile = self.profiles[user_id]
+        if profile is None:
+            return len(self.directions)
+        return sum(
+            page_cost(
+                profile[DIRECTIONS[direction][3]], self.page_size, self.hub_max_pages
+            )
+            for direction in self.directions
+        )
+
+    def score(self, user_id):
+        value = 1 + TOPICAL_WEIGHT * self.topical.get(user_id, 0) + self.links[user_id]
+        return value / self.cost(user_id)
+
+    def _push(self, user_id):
+        if user_id in self.expanded or user_id not in self.profiles:
+            return
+        profile = self.profiles[user_id]
+        if profile is not None and profile["unavailable_reason"] is not None:
+            return
+        score = self.score(user_id)
+        if self.scores.get(user_id) != score:
+            self.scores[user_id] = score
+            heapq.heappush(self.frontier, (-score, user_id))
+
+    # Load the stored profiles of users not seen before
+    def _load_profiles(self, user_ids):
+        for chunk in chunked(user_ids, 1000):
+            for row in self.session.query(
+                User.id,
+                User.following_count,
+                User.followers_count,
+                User.created_at,
+                User.unavailable_reason,
+            ).filter(User.id.in_(chunk)):
+                if row.created_at is None and row.unavailable_reason is None:
+                    self.profiles[row.id] = None
+                else:
+                    self.profiles[row.id] = {
+                        "following_count": row.following_count,
+                        "followers_count": row.followers_count,
+                        "unavailable_reason": row.unavailable_reason,
+                    }
+        self.session.commit()
+
+    # Hydrate frontier users and put them back with their real score
+    def _hydrate(self, user_ids):
+        keys = [
+            ",".join(map(str, chunk))
+            for chunk in chunked(user_ids, MAX_IDS_PER_REQUEST)
+        ]
+        self.requests += self.crawl_engine.run(
+            users_endpoint(self.session), keys
+        ).requests
+        for user_id in user_ids:
+            del self.profiles[user_id]
+            self.scores.pop(user_id, None)
+        self._load_profiles(user_ids)
+        for user_id in user_ids:
+            # Users the API did not return stay unknown, do not ask again
+            if self.profiles[user_id] is None:
+                self.profiles[user_id] = {
+                    "following_count": None,
+                    "followers_count": None,
+                    "unavailable_reason": "not_returned",
+                }
+            self._push(user_id)
+
+    # Add users found at `hop`, users seen before keep their lowest hop. Users
+    # beyond the last hop are only stored. Returns the number of new users.
+    def discover(self, user_ids, hop):
+        new = [user_id for user_id in user_ids if user_id not in self.hops]
+        for user_id in user_ids:
+            self.hops[user_id] = min(hop, self.hops.get(user_id, hop))
+        candidates = [
+            user_id for user_id in set(user_ids) if self.hops[user_id] < self.max_hops
+        ]
+        self._load_profiles(
+            [user_id for user_id in candidates if user_id not in self.profiles]
+        )
+        for user_id in candidates:
+            self._push(user_id)
+        return len(new)
+
+    def seed(self):
+        self.topical = topical_counts(self.session)
+        seeds = sorted(self.topical)
+        self.discover(seeds, 0)
+        print(f"Seeded {len(seeds)} authors of topical tweets.")
+
+    # Pop the best frontier users whose estimated cost fits the budget left.
+    # Users without a profile at the top are hydrated first, up to 100 at a time.
+    def next_round(self):
+        batch = []
+        cost = 0
+        while self.frontier and len(batch) < self.round_size:
+            score, user_id = self.frontier[0]
+            if user_id in self.expanded or self.scores.get(user_id) != -score:
+                heapq.heappop(self.frontier)
+                continue
+            if self.profiles[user_id] is None:
+                if self.budget is not None and self.requests + cost + 1 > self.budget:
+                    break
+                self._hydrate(self._pop_unhydrated())
+                continue
+            user_cost = self.cost(user_id)
+            if (
+                self.budget is not None
+                and self.requests + cost + user_cost > self.budget
+            ):
+                break
+            heapq.heappop(self.frontier)
+            self.expanded.add(user_id)
+            batch.append(user_id)
+            cost += user_cost
+        return batch
+
+    # Pop the best MAX_IDS_PER_REQUEST frontier users without a profile
+    def _pop_unhydrated(self):
+        user_ids = []
+        hydrated = []
+        while self.frontier and len(user_ids) < MAX_IDS_PER_REQUEST:
+            entry = heapq.heappop(self.frontier)
+            score, user_id = entry
+            if user_id in self.expanded or self.scores.get(user_id) != -score:
+                continue
+            if self.profiles[user_id] is None:
+                user_ids.append(user_id)
+            else:
+                hydrated.append(entry)
+        for entry in hydrated:
+            heapq.heappush(self.frontier, entry)
+        return user_ids
+
+    # Fetch the edges of a round's users and return (user, neighbour) pairs
+    # from the stored edges, which also covers users crawled on earlier runs
+    def expand(self, batch):
+        for direction in self.directions:
+            stats = self.crawl_engine.run(
+                self.endpoints[direction],
+                batch,
+                checkpoints=self.checkpoints[direction],
+            )
+            self.requests += stats.requests
+        pairs = []
+        for direction in self.directions:
+            model, neighbour = DIRECTIONS[direction][1], DIRECTIONS[direction][2]
+            # The edge crawl stores new users as placeholders, discovered users
+            # are kept as regular bare rows for 2_user_grabber.py to hydrate
+            self.session.execute(
+                update(User)
+                .where(
+                    User.placeholder.is_(True),
+                    User.id.in_(select(neighbour).where(model.user_id.in_(batch))),
+                )
+                .values(placeholder=False)
+            )
+            pairs.extend(
+                self.session.query(model.user_id, neighbour).filter(
+                    model.user_id.in_(batch)
+                )
+            )
+        self.session.commit()
+        return pairs
+
+    def run(self):
+        try:
+            self._run()
+        finally:
+            self.crawl_engine.close()
+
+    def _run(self):
+        self.seed()
+        while True:
+            batch = self.next_round()
+            if not batch:
+                break
+            self.rounds += 1
+            neighbours = {}
+            for user_id, neighbour in self.expand(batch):
+                self.links[neighbour] += 1
+                hop = self.hops[user_id] + 1
+                neighbours[neighbour] = min(hop, neighbours.get(neighbour, hop))
+            new = 0
+            for hop in sorted(set(neighbours.values())):
+                new += self.discover(
+                    [user_id for user_id, found in neighbours.items() if found == hop],
+                    hop,
+                )
+            # Users whose link count changed get a new score
+            for user_id in neighbours:
+                self._push(user_id)
+            budget = f" of {self.budget}" if self.budget is not None else ""
+            print(
+                f"Round {self.rounds}: expanded {len(batch)} users, found {new} new, "
+                f"{self.requests}{budget} requests used, "
+                f"{len(self.expanded)} expanded and "
+                f"{len(self.scores) - len(self.expanded)} in the frontier."
+            )
+        print(
+            f"Snowball finished after {self.rounds} rounds: {len(self.expanded)} users "
+            f"expanded, {len(self.hops)} users found, {self.requests} requests."
+        )
@@ -0,0 +1,165 @@
+import threading
+import rate_limit
+from crawler import CrawlEngine, Endpoint
+from mock_api import MockTwitterAPI
+from rate_limit import TokenPool
+
+ENDPOINT = "following"
+
+
+# A clock that only moves when the pool sleeps
+class FakeClock:
+    def __init__(self, now=1000.0):
+        self.now = now
+        self.sleeps = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+def headers(limit, remaining, reset):
+    return {
+        "x-rate-limit-limit": str(limit),
+        "x-rate-limit-remaining": str(remaining),
+        "x-rate-limit-reset": str(reset),
+    }
+
+
+def test_routes_to_token_with_budget():
+    clock = FakeClock()
+    pool = TokenPool(["a", "b", "c"], clock=clock)
+    for slot, remaining in ((0, 2), (1, 40), (2, 0)):
+        assert pool.acquire(ENDPOINT) == slot
+        pool.update(slot, ENDPOINT, 200, headers(50, remaining, clock.now + 900))
+    # b has the most budget left until it is down to that of a, never c
+    slots = [pool.acquire(ENDPOINT) for _ in range(42)]
+    assert slots[:38] == [1] * 38
+    assert sorted(slots[38:]) == [0, 0, 1, 1]
+    assert pool.requests == [3, 41, 1]
+    assert pool.try_acquire(ENDPOINT)[0] is None
+
+
+def test_exhausted_token_is_skipped():
+    clock = FakeClock()
+    pool = TokenPool(["a", "b"], clock=clock)
+    pool.acquire(ENDPOINT)
+    pool.update(0, ENDPOINT, 429, headers(15, 0, clock.now + 300))
+    assert [pool.acquire(ENDPOINT) for _ in range(3)] == [1, 1, 1]
+    assert pool.rate_limited == 1
+
+
+def test_acquire_sleeps_until_earliest_reset(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(rate_limit.time, "sleep", clock.sleep)
+    pool = TokenPool(["a", "b"], clock=clock)
+    for slot, reset in ((0, 600), (1, 120)):
+        assert pool.acquire(ENDPOINT) == slot
+        pool.update(slot, ENDPOINT, 200, headers(15, 0, clock.now + reset))
+    start = clock.now
+    # b resets first, and acquire waits for it alone
+    assert pool.acquire(ENDPOINT) == 1
+    assert len(clock.sleeps) == 1
+    assert 120 <= clock.now - start < 121
+    assert pool.idle_time == clock.now - start
+
+
+def test_acquire_does_not_sleep_with_budget_left(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(rate_limit.time, "sleep", clock.sleep)
+    pool = TokenPool(["a"], clock=clock)
+    pool.acquire(ENDPOINT)
+    pool.update(0, ENDPOINT, 200, headers(15, 1, clock.now + 900))
+    pool.acquire(ENDPOINT)
+    assert clock.sleeps == []
+
+
+def test_busy_token_is_waited_for_not_the_reset():
+    clock = FakeClock()
+    pool = TokenPool(["a", "b"], max_in_flight=1, clock=clock)
+    assert pool.acquire(ENDPOINT) == 0
+    pool.update(0, ENDPOINT, 429, headers(15, 0, clock.now + 900))
+    assert pool.acquire(ENDPOINT) == 1
+    # b has budget and frees up with its response, a resets in 900 seconds
+    slot, wait = pool.try_acquire(ENDPOINT)
+    assert slot is None and wait < 1
+    assert pool.idle_time == 0
+
+
+def test_acquire_returns_none_once_stopped():
+    clock = FakeClock()
+    pool = TokenPool(["a"], clock=clock)
+    pool.acquire(ENDPOINT)
+    pool.update(0, ENDPOINT, 429, headers(15, 0, clock.now + 600))
+    stop = threading.Event()
+    stop.set()
+    assert pool.acquire(ENDPOINT, stop=stop) is None
+    assert pool.in_flight == [0]
+
+
+def test_429_without_reset_backs_off(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(rate_limit.time, "sleep", clock.sleep)
+    pool = TokenPool(["a"], clock=clock)
+    pool.acquire(ENDPOINT)
+    pool.update(0, ENDPOINT, 429, {})
+    pool.acquire(ENDPOINT)
+    assert rate_limit.DEFAULT_BACKOFF <= sum(clock.sleeps) < rate_limit.DEFAULT_BACKOFF + 1
+
+
+def test_update_and_state_reflect_headers():
+    clock = FakeClock()
+    pool = TokenPool(["a"], clock=clock)
+    slot = pool.acquire(ENDPOINT)
+    assert pool.state()[0]["in_flight"] == 1
+    pool.update(slot, ENDPOINT, 200, headers(15, 14, clock.now + 900))
+    assert pool.state() == [
+        {
+            "token": slot + 1,
+            "endpoint": ENDPOINT,
+            "limit": 15,
+            "remaining": 14,
+            "resets_in": 900.0,
+            "in_flight": 0,
+            "requests": 1,
+        }
+    ]
+    # Lower counts win, a late response of the same window never hands
+    # back budget, here the request reserved after the 10
+    pool.acquire(ENDPOINT)
+    pool.update(slot, ENDPOINT, 200, headers(15, 10, clock.now + 900))
+    assert pool.state()[0]["remaining"] == 10
+    pool.acquire(ENDPOINT)
+    pool.update(slot, ENDPOINT, 200, headers(15, 12, clock.now + 900))
+    assert pool.state()[0]["remaining"] == 9
+    # A new window replaces the old one
+    clock.now += 1000
+    pool.acquire(ENDPOINT)
+    pool.update(slot, ENDPOINT, 200, headers(15, 14, clock.now + 900))
+    entry = pool.state()[0]
+    assert (entry["remaining"], entry["resets_in"], entry["requests"]) == (14, 900.0, 4)
+
+
+# Against the mock API, whose windows are per token: once "a" reports its
+# window used up, every request goes to "b" and the server never answers 429
+def test_engine_routes_away_from_exhausted_token():
+    pages = []
+    endpoint = Endpoint(
+        "following",
+        "/2/users/{key}/following",
+        {"max_results": 100},
+        lambda key, data: pages.append(key),
+    )
+    with MockTwitterAPI(
+        max_edges=50, rate_limit=(100, 900), token_limits={"a": (3, 900)}
+    ) as api:
+        with CrawlEngine(api.base_url, ["a", "b"], per_token_concurrency=1) as engine:
+            stats = engine.run(endpoint, [1000 + n for n in range(40)])
+        assert api.rate_limited == 0
+    assert sorted(pages) == [1000 + n for n in range(40)]
+    assert (stats.errors, stats.rate_limited) == (0, 0)
+    assert engine.pool.requests == [3, 37]
+    assert engine.pool.idle_time == 0
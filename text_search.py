@@ -0,0 +1,432 @@
+import os
+import re
+import time
+import unicodedata
+from array import array
+from bisect import bisect_left
+from datetime import timezone
+import numpy as np
+from sqlalchemy import bindparam, func, inspect, literal_column, select, text, update
+from models import Tweet, Hashtag
+from partitions import create_index_concurrently, posted_between
+
+# Diacritic-insensitive search over the text of the collected tweets. Tweets
+# are stored with search_text, their text in lower case without diacritics
+# ("Prostřeno!" -> "prostreno!"), so "prostreno" finds every spelling once and
+# no query has to list variants. Hashtags are folded the same way. Queries
+# combine, all of them required:
+#   word        a word of the tweet
+#   prefix*     a word starting with prefix
+#   "a b c"     consecutive words
+#   #tag        a hashtag
+# with an optional created_at range. PostgreSQL answers them from a GIN index
+# on to_tsvector('simple', search_text), built by migrate_search(), which also
+# fills search_text of older rows with unaccent. SQLite databases and offline
+# snapshots use TextIndex, an inverted index kept in numpy arrays and saved
+# next to the database.
+
+BATCH_SIZE = 10_000
+SEARCH_INDEX = "ix_tweets_search_text"
+TSVECTOR = func.to_tsvector(literal_column("'simple'::regconfig"), Tweet.search_text)
+
+# Latin letters with diacritics to their base letters, the letters unaccent
+# spells out added by hand
+FOLD = {"ß": "ss", "æ": "ae", "œ": "oe", "ø": "o", "đ": "d", "ł": "l", "ħ": "h", "ŧ": "t"}
+for code in range(0xC0, 0x250):
+    base = "".join(
+        char for char in unicodedata.normalize("NFKD", chr(code)) if not unicodedata.combining(char)
+    )
+    if base != chr(code) and base.isascii():
+        FOLD[chr(code)] = base.lower()
+FOLD = str.maketrans(FOLD)
+
+# Words of folded text, with the # of hashtags
+TOKEN = re.compile(r"(#?)(\w+)")
+QUERY_PART = re.compile(r'"([^"]*)"|(#?\w+\*?)')
+
+# Positions of a word within its tweet take the low bits of a posting
+POSITION_BITS = 10
+MAX_POSITION = (1 << POSITION_BITS) - 64
+# created_at of tweets stored without one, before any other
+NO_TIME = -(2**62)
+
+
+def normalize(value):
+    if value is None:
+        return None
+    return value.lower().translate(FOLD)
+
+
+def timestamp(moment):
+    if moment is None:
+        return NO_TIME
+    return int(moment.replace(tzinfo=moment.tzinfo or timezone.utc).timestamp())
+
+
+class TextQuery:
+    def __init__(self, query):
+        self.query = query
+        self.terms = []
+        self.prefixes = []
+        self.phrases = []
+        self.hashtags = []
+        for phrase, word in QUERY_PART.findall(normalize(query)):
+            if phrase:
+                words = [match[1] for match in TOKEN.findall(phrase)]
+                if len(words) > 1:
+                    self.phrases.append(words)
+                elif words:
+                    self.terms.append(words[0])
+            elif word.startswith("#"):
+                self.hashtags.append(word[1:].rstrip("*"))
+            elif word.endswith("*"):
+                self.prefixes.append(word[:-1])
+            else:
+                self.terms.append(word)
+
+    # The same query in to_tsquery syntax. Words only hold \w characters, so
+    # they need no quoting.
+    def tsquery(self):
+        parts = list(self.terms)
+        parts += [f"{prefix}:*" for prefix in self.prefixes]
+        parts += ["(" + " <-> ".join(words) + ")" for words in self.phrases]
+        return " & ".join(parts)
+
+
+class TextIndex:
+    # tweet_ids, times: int64 per tweet in created_at order, vocabulary: sorted
+    # words (hashtags with their #), offsets: start of every word's postings in
+    # keys, keys: int64 tweet << POSITION_BITS | position, sorted per word
+    def __init__(self, tweet_ids, times, vocabulary, offsets, keys):
+        self.tweet_ids = tweet_ids
+        self.times = times
+        self.vocabulary = vocabulary
+        self.offsets = offsets
+        self.keys = keys
+
+    # Build from (id, created_at, search_text) rows in any order
+    @classmethod
+    def from_rows(cls, rows):
+        words = {}
+        tweet_ids = array("q")
+        times = array("q")
+        tokens = array("i")
+        keys = array("q")
+        for tweet, (tweet_id, created_at, search_text) in enumerate(rows):
+            tweet_ids.append(tweet_id)
+            times.append(timestamp(created_at))
+            base = tweet << POSITION_BITS
+            for position, (mark, word) in enumerate(TOKEN.findall(search_text or "")):
+                if position > MAX_POSITION:
+                    break
+                token = words.get(word)
+                if token is None:
+                    token = words[word] = len(words)
+                tokens.append(token)
+                keys.append(base | position)
+                if mark:
+                    word = "#" + word
+                    token = words.get(word)
+                    if token is None:
+                        token = words[word] = len(words)
+                    tokens.append(token)
+                    keys.append(base | position)
+        tweet_ids = np.frombuffer(tweet_ids, dtype=np.int64)
+        times = np.frombuffer(times, dtype=np.int64)
+        tokens = np.frombuffer(tokens, dtype=np.int32)
+        keys = np.frombuffer(keys, dtype=np.int64)
+        # Number words alphabetically and tweets by time
+        vocabulary = sorted(words)
+        word_rank = np.empty(len(words), dtype=np.int32)
+        word_rank[[words[word] for word in vocabulary]] = np.arange(len(words), dtype=np.int32)
+        order = np.argsort(times, kind="stable")
+        tweet_rank = np.empty(len(order), dtype=np.int64)
+        tweet_rank[order] = np.arange(len(order), dtype=np.int64)
+        tokens = word_rank[tokens]
+        keys = (tweet_rank[keys >> POSITION_BITS] << POSITION_BITS) | (
+            keys & ((1 << POSITION_BITS) - 1)
+        )
+        postings = np.lexsort((keys, tokens))
+        offsets = np.zeros(len(vocabulary) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(tokens, minlength=len(vocabulary)), out=offsets[1:])
+        return cls(tweet_ids[order], times[order], vocabulary, offsets, keys[postings])
+
+    # Build from the tweets of a database, streamed in id order
+    @classmethod
+    def from_session(cls, session, batch_size=BATCH_SIZE):
+        def rows():
+            last_id = None
+            while True:
+                query = select(Tweet.id, Tweet.created_at, Tweet.search_text, Tweet.text)
+                if last_id is not None:
+                    query = query.where(Tweet.id > last_id)
+                batch = session.execute(query.order_by(Tweet.id).limit(batch_size)).all()
+                session.commit()
+                if not batch:
+                    return
+                for tweet_id, created_at, search_text, tweet_text in batch:
+                    # Rows migrate_search() has not reached yet
+                    if search_text is None:
+                        search_text = normalize(tweet_text)
+                    yield tweet_id, created_at, search_text
+                last_id = batch[-1][0]
+
+        return cls.from_rows(rows())
+
+    # Build from the tweets of a snapshot (snapshot.py). Snapshots written
+    # before search_text existed lack the column, the text is folded here.
+    @classmethod
+    def from_snapshot(cls, directory):
+        # pyarrow is only needed for snapshots
+        from snapshot import read_table
+
+        table = read_table(directory, "tweets", columns=["id", "created_at", "text"])
+        return cls.from_rows(
+            (tweet_id, created_at, normalize(tweet_text))
+            for tweet_id, created_at, tweet_text in zip(
+                table.column("id").to_pylist(),
+                table.column("created_at").to_pylist(),
+                table.column("text").to_pylist(),
+            )
+        )
+
+    # (tweets, highest tweet id), to tell whether a saved index is current
+    def state(self):
+        return len(self.tweet_ids), int(self.tweet_ids.max()) if len(self.tweet_ids) else 0
+
+    def nbytes(self):
+        return (
+            self.tweet_ids.nbytes
+            + self.times.nbytes
+            + self.offsets.nbytes
+            + self.keys.nbytes
+            + sum(len(word) for word in self.vocabulary)
+        )
+
+    def save(self, path):
+        np.savez(
+            path + ".tmp.npz",
+            tweet_ids=self.tweet_ids,
+            times=self.times,
+            vocabulary=np.frombuffer("\n".join(self.vocabulary).encode(), dtype=np.uint8),
+            offsets=self.offsets,
+            keys=self.keys,
+        )
+        os.replace(path + ".tmp.npz", path)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as arrays:
+            vocabulary = arrays["vocabulary"].tobytes().decode()
+            return cls(
+                arrays["tweet_ids"],
+                arrays["times"],
+                vocabulary.split("\n") if vocabulary else [],
+                arrays["offsets"],
+                arrays["keys"],
+            )
+
+    # Postings of one word, restricted to tweets first to last - 1
+    def _postings(self, word, first, last):
+        index = bisect_left(self.vocabulary, word)
+        if index == len(self.vocabulary) or self.vocabulary[index] != word:
+            return self.keys[:0]
+        keys = self.keys[self.offsets[index] : self.offsets[index + 1]]
+        start, end = np.searchsorted(
+            keys, [first << POSITION_BITS, last << POSITION_BITS], side="left"
+        )
+        return keys[start:end]
+
+    def _tweets_with_prefix(self, prefix, first, last):
+        start = bisect_left(self.vocabulary, prefix)
+        end = bisect_left(self.vocabulary, prefix + "\uffff")
+        tweets = self.keys[self.offsets[start] : self.offsets[end]] >> POSITION_BITS
+        return np.unique(tweets[(tweets >= first) & (tweets < last)])
+
+    def _tweets_with_phrase(self, words, first, last):
+        keys = self._postings(words[0], first, last)
+        for shift, word in enumerate(words[1:], 1):
+            following = self._postings(word, first, last)
+            following = following[(following & ((1 << POSITION_BITS) - 1)) >= shift] - shift
+            keys = np.intersect1d(keys, following, assume_unique=True)
+        return np.unique(keys >> POSITION_BITS)
+
+    # Ids of the tweets matching `query` (a TextQuery or a query string)
+    # posted from start until before end, in created_at order
+    def search(self, query, start=None, end=None, limit=None):
+        if isinstance(query, str):
+            query = TextQuery(query)
+        first = 0 if start is None else int(np.searchsorted(self.times, timestamp(start)))
+        last = len(self.times) if end is None else int(np.searchsorted(self.times, timestamp(end)))
+        matches = []
+        for word in query.terms + ["#" + tag for tag in query.hashtags]:
+            matches.append(np.unique(self._postings(word, first, last) >> POSITION_BITS))
+        for prefix in query.prefixes:
+            matches.append(self._tweets_with_prefix(prefix, first, last))
+        for words in query.phrases:
+            matches.append(self._tweets_with_phrase(words, first, last))
+        if not matches:
+            tweets = np.arange(first, last)
+        else:
+            matches.sort(key=len)
+            tweets = matches[0]
+            for other in matches[1:]:
+                tweets = np.intersect1d(tweets, other, assume_unique=True)
+        if limit is not None:
+            tweets = tweets[:limit]
+        return self.tweet_ids[tweets].tolist()
+
+
+# Ids of the tweets matching `query` from the GIN index and the hashtags
+# table of a PostgreSQL database, in created_at order
+def search_postgres(session, query, start=None, end=None, limit=None):
+    if isinstance(query, str):
+        query = TextQuery(query)
+    statement = select(Tweet.id)
+    tsquery = query.tsquery()
+    if tsquery:
+        statement = statement.where(
+            TSVECTOR.op("@@")(func.to_tsquery(literal_column("'simple'::regconfig"), tsquery))
+        )
+    for tag in query.hashtags:
+        statement = statement.where(
+            Tweet.id.in_(select(Hashtag.tweet_id).where(Hashtag.tag == tag))
+        )
+    # An id can be stored under two created_at values, in two partitions
+    statement = statement.where(*posted_between(start, end)).group_by(Tweet.id)
+    statement = statement.order_by(func.min(Tweet.created_at), Tweet.id)
+    if limit is not None:
+        statement = statement.limit(limit)
+    return session.execute(statement).scalars().all()
+
+
+# The TextIndex of a database, loaded from `path` while it still covers
+# every stored tweet, otherwise built again and saved there
+def open_index(session, path):
+    count, highest = session.execute(select(func.count(), func.max(Tweet.id))).one()
+    session.commit()
+    if path and os.path.exists(path):
+        index = TextIndex.load(path)
+        if index.state() == (count, highest or 0):
+            return index
+    start_time = time.time()
+    index = TextIndex.from_session(session)
+    print(
+        f"Indexed {count} tweets, {len(index.vocabulary)} words, "
+        f"{index.nbytes() / 2**20:.1f} MB in {time.time() - start_time:.1f} seconds."
+    )
+    if path:
+        index.save(path)
+    return index
+
+
+# Search a database: PostgreSQL through its GIN index, others through the
+# TextIndex saved at index_path
+def search_tweets(session, query, start=None, end=None, limit=None, index_path=None):
+    if session.get_bind().dialect.name == "postgresql":
+        return search_postgres(session, query, start, end, limit)
+    return open_index(session, index_path).search(query, start, end, limit)
+
+
+# Fill search_text of the tweets stored before it existed, batch_size rows
+# per transaction. PostgreSQL folds them in place with unaccent. Returns the
+# rows updated.
+def backfill_search_text(engine, batch_size):
+    updated = 0
+    last_id = None
+    while True:
+        with engine.begin() as connection:
+            if connection.dialect.name == "postgresql":
+                ids = connection.execute(
+                    text(
+                        "UPDATE tweets SET search_text = lower(unaccent(text)) WHERE id IN ("
+                        "SELECT id FROM tweets WHERE search_text IS NULL AND text IS NOT NULL "
+                        "AND id > :last ORDER BY id LIMIT :batch) RETURNING id"
+                    ),
+                    {"last": last_id if last_id is not None else -(2**63), "batch": batch_size},
+                ).scalars().all()
+            else:
+                query = select(Tweet.id, Tweet.text).where(
+                    Tweet.search_text.is_(None), Tweet.text.isnot(None)
+                )
+                if last_id is not None:
+                    query = query.where(Tweet.id > last_id)
+                rows = connection.execute(query.order_by(Tweet.id).limit(batch_size)).all()
+                if rows:
+                    connection.execute(
+                        update(Tweet)
+                        .where(Tweet.id == bindparam("tweet_id"))
+                        .values(search_text=bindparam("folded")),
+                        [
+                            {"tweet_id": tweet_id, "folded": normalize(tweet_text)}
+                            for tweet_id, tweet_text in rows
+                        ],
+                    )
+                ids = [tweet_id for tweet_id, _ in rows]
+        if not ids:
+            return updated
+        updated += len(ids)
+        last_id = max(ids)
+        print(f"Folded the text of {updated} tweets.")
+
+
+# Fold the hashtags stored before they were folded on the way in. A tweet
+# with both spellings keeps one row.
+def fold_hashtags(engine):
+    with engine.begin() as connection:
+        if connection.dialect.name == "postgresql":
+            connection.execute(
+                text(
+                    "INSERT INTO hashtags (tweet_id, tag) "
+                    "SELECT tweet_id, lower(unaccent(tag)) FROM hashtags "
+                    "WHERE tag <> lower(unaccent(tag)) ON CONFLICT DO NOTHING"
+                )
+            )
+            return connection.execute(
+                text("DELETE FROM hashtags WHERE tag <> lower(unaccent(tag))")
+            ).rowcount
+        folded = [
+            (tweet_id, tag)
+            for tweet_id, tag in connection.execute(select(Hashtag.tweet_id, Hashtag.tag))
+            if normalize(tag) != tag
+        ]
+        for tweet_id, tag in folded:
+            connection.execute(
+                text("INSERT OR IGNORE INTO hashtags (tweet_id, tag) VALUES (:tweet_id, :tag)"),
+                {"tweet_id": tweet_id, "tag": normalize(tag)},
+            )
+            connection.execute(
+                text("DELETE FROM hashtags WHERE tweet_id = :tweet_id AND tag = :tag"),
+                {"tweet_id": tweet_id, "tag": tag},
+            )
+        return len(folded)
+
+
+# Bring a database up to date for text search: the search_text column,
+# its backfill, folded hashtags and on PostgreSQL the GIN index, built
+# CONCURRENTLY so the crawl keeps writing meanwhile
+def migrate_search(engine, batch_size=BATCH_SIZE):
+    postgres = engine.dialect.name == "postgresql"
+    inspector = inspect(engine)
+    if "search_text" not in [column["name"] for column in inspector.get_columns("tweets")]:
+        with engine.begin() as connection:
+            connection.execute(text("ALTER TABLE tweets ADD COLUMN search_text VARCHAR"))
+    if postgres:
+        with engine.begin() as connection:
+            connection.execute(text("CREATE EXTENSION IF NOT EXISTS unaccent"))
+    backfill_search_text(engine, batch_size)
+    folded = fold_hashtags(engine)
+    if folded:
+        print(f"Folded {folded} hashtags.")
+    if not postgres:
+        return
+    if SEARCH_INDEX in [index["name"] for index in inspector.get_indexes("tweets")]:
+        return
+    print(f"Creating index {SEARCH_INDEX} on tweets.")
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+        create_index_concurrently(
+            connection,
+            SEARCH_INDEX,
+            "tweets",
+            "USING gin (to_tsvector('simple'::regconfig, search_text))",
+        )
@@ -0,0 +1,219 @@
+import time
+from collections import Counter
+from datetime import datetime, timezone
+from itertools import groupby
+from operator import itemgetter
+from sqlalchemy import and_, delete, select, tuple_
+from models import Tweet, TweetReference, Thread, ThreadUpdate
+
+# Reply trees of the collected conversations. The tweets of a conversation are
+# read with one range scan of ix_tweets_conversation_id_id and linked to the
+# tweet they reply to through tweet_references (kind replied_to), so no
+# recursive query is needed. Statistics per conversation go to the threads
+# table:
+#   tweets          tweets stored, the root included
+#   depth           longest reply chain below the root
+#   breadth         replies on the widest level of the tree
+#   direct_replies  replies to the root
+#   participants    distinct authors
+#   started_at      time of the root
+#   first_reply_at  time of the first reply, last_reply_at of the latest
+# The search and timeline endpoints queue the conversation of every tweet they
+# store in thread_updates, build_threads() rebuilds only the queued ones.
+# rebuild_threads() walks the whole tweets table once, for tweets stored
+# before the queue existed or after an interaction backfill.
+
+BATCH_SIZE = 10_000
+# Conversations rebuilt per transaction by build_threads()
+QUEUE_BATCH_SIZE = 1000
+
+THREAD_COLUMNS = [column.name for column in Thread.__table__.columns if not column.primary_key]
+
+
+def now():
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+# Declare thread_updates on a writer that stores tweets
+def register_thread_updates(writer):
+    writer.register(ThreadUpdate, conflict="update", update=["marked_at"])
+
+
+# Queue conversations for build_threads()
+def mark_conversations(writer, conversation_ids):
+    marked_at = now()
+    writer.add_many(
+        ThreadUpdate,
+        [
+            {"conversation_id": conversation_id, "marked_at": marked_at}
+            for conversation_id in set(conversation_ids)
+            if conversation_id is not None
+        ],
+    )
+
+
+# Tweets matching `condition` as (conversation id, id, author id, created at,
+# id of the tweet replied to), in conversation and id order
+def thread_query(condition):
+    return (
+        select(
+            Tweet.conversation_id,
+            Tweet.id,
+            Tweet.author_id,
+            Tweet.created_at,
+            TweetReference.referenced_id,
+        )
+        .outerjoin(
+            TweetReference,
+            and_(TweetReference.tweet_id == Tweet.id, TweetReference.kind == "replied_to"),
+        )
+        .where(condition)
+        .order_by(Tweet.conversation_id, Tweet.id)
+    )
+
+
+# Add the depth in the reply tree to the rows of one conversation. Ids grow
+# with time, so a parent always comes before its replies; a reply to a tweet
+# that is not stored hangs from the root.
+def link_replies(conversation_id, rows):
+    depths = {conversation_id: 0}
+    for row in rows:
+        tweet_id = row[1]
+        depth = 0 if tweet_id == conversation_id else depths.get(row[4], 0) + 1
+        depths[tweet_id] = depth
+        yield row, depth
+
+
+# threads row of one conversation from its thread_query() rows
+def thread_row(conversation_id, rows, updated_at):
+    levels = Counter()
+    authors = set()
+    reply_times = []
+    root_author_id = None
+    started_at = None
+    tweets = 0
+    for (_, _, author_id, created_at, _), depth in link_replies(conversation_id, rows):
+        tweets += 1
+        if author_id is not None:
+            authors.add(author_id)
+        if depth == 0:
+            root_author_id = author_id
+            started_at = created_at
+            continue
+        levels[depth] += 1
+        if created_at is not None:
+            reply_times.append(created_at)
+    return {
+        "conversation_id": conversation_id,
+        "root_author_id": root_author_id,
+        "tweets": tweets,
+        "depth": max(levels, default=0),
+        "breadth": max(levels.values(), default=0),
+        "direct_replies": levels[1],
+        "participants": len(authors),
+        "started_at": started_at,
+        "first_reply_at": min(reply_times, default=None),
+        "last_reply_at": max(reply_times, default=None),
+        "updated_at": updated_at,
+    }
+
+
+# threads rows of every conversation with tweets matching `condition`
+def thread_rows(session, condition):
+    updated_at = now()
+    rows = session.execute(thread_query(condition)).all()
+    return [
+        thread_row(conversation_id, list(group), updated_at)
+        for conversation_id, group in groupby(rows, key=itemgetter(0))
+    ]
+
+
+# The tweets of one conversation as dicts in id order, each with the id it
+# replies to (parent_id) and its depth in the reply tree
+def load_thread(session, conversation_id):
+    rows = session.execute(thread_query(Tweet.conversation_id == conversation_id)).all()
+    return [
+        {
+            "id": row[1],
+            "author_id": row[2],
+            "created_at": row[3],
+            "parent_id": row[4],
+            "depth": depth,
+        }
+        for row, depth in link_replies(conversation_id, rows)
+    ]
+
+
+# Rebuild the threads of the queued conversations, batch_size conversations
+# per transaction. A queue entry is only removed if it was not marked again
+# while its batch was built. Returns the number of threads written.
+def build_threads(session, writer, batch_size=QUEUE_BATCH_SIZE):
+    writer.register(Thread, conflict="update", update=THREAD_COLUMNS)
+    written = 0
+    last = None
+    start_time = time.time()
+    while True:
+        query = select(ThreadUpdate.conversation_id, ThreadUpdate.marked_at)
+        if last is not None:
+            query = query.where(ThreadUpdate.conversation_id > last)
+        queued = [
+            tuple(row)
+            for row in session.execute(
+                query.order_by(ThreadUpdate.conversation_id).limit(batch_size)
+            )
+        ]
+        if not queued:
+            break
+        rows = thread_rows(
+            session, Tweet.conversation_id.in_([conversation_id for conversation_id, _ in queued])
+        )
+        writer.add_many(Thread, rows)
+        session.execute(
+            delete(ThreadUpdate).where(
+                tuple_(ThreadUpdate.conversation_id, ThreadUpdate.marked_at).in_(queued)
+            )
+        )
+        # Commits the threads and the queue entries they replace together
+        writer.flush()
+        written += len(rows)
+        last = queued[-1][0]
+    print(f"Updated {written} threads in {time.time() - start_time:.1f} seconds.")
+    return written
+
+
+# Rebuild every thread from the tweets table, in batches of about batch_size
+# tweets cut at conversation boundaries. Returns the number of threads written.
+def rebuild_threads(session, writer, batch_size=BATCH_SIZE, progress_every=100):
+    writer.register(Thread, conflict="update", update=THREAD_COLUMNS)
+    written = 0
+    batches = 0
+    last = None
+    start_time = time.time()
+    while True:
+        if last is None:
+            lower = Tweet.conversation_id.isnot(None)
+        else:
+            lower = Tweet.conversation_id > last
+        # The conversation batch_size tweets further down the index ends the batch
+        upper = session.execute(
+            select(Tweet.conversation_id)
+            .where(lower)
+            .order_by(Tweet.conversation_id)
+            .offset(batch_size)
+            .limit(1)
+        ).scalar()
+        condition = lower if upper is None else and_(lower, Tweet.conversation_id <= upper)
+        rows = thread_rows(session, condition)
+        writer.add_many(Thread, rows)
+        writer.flush()
+        written += len(rows)
+        batches += 1
+        if batches % progress_every == 0:
+            print(
+                f"Rebuilt {written} threads, {written / (time.time() - start_time):.0f} threads/s."
+            )
+        if upper is None:
+            break
+        last = upper
+    print(f"Rebuilt {written} threads in {time.time() - start_time:.1f} seconds.")
+    return written
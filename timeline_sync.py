@@ -0,0 +1,207 @@
+from datetime import datetime, timezone
+from crawler import Endpoint, batched_keys
+from models import Tweet, TimelineSync
+from user_hydration import parse_twitter_time
+from interactions import INTERACTION_FIELDS, add_interactions, register_interactions
+from thread_index import mark_conversations, register_thread_updates
+from text_search import normalize
+
+# Incremental sync of /2/users/{id}/tweets. Each user is walked in one of three
+# modes, chosen from their timeline_sync row:
+#   full      no row yet, walk the whole timeline
+#   refresh   only tweets newer than newest_id (since_id), at most
+#             REFRESH_MAX_PAGES pages; if that is not enough the rest is
+#             recorded as a gap
+#   backfill  a gap is open, walk it with since_id/until_id, at most
+#             BACKFILL_MAX_PAGES pages per run
+# The new timeline_sync row is buffered with the chain's last page, so it is
+# committed together with the tweets it describes. With CrawlCheckpoints the
+# newest id seen so far is kept with every page's checkpoint, so a chain
+# resumed after a crash still records the tweets of its first pages.
+
+REFRESH_MAX_PAGES = 5
+BACKFILL_MAX_PAGES = 10
+
+
+def newer(a, b):
+    if a is None:
+        return b
+    if b is None:
+        return a
+    return max(a, b)
+
+
+def older(a, b):
+    if a is None:
+        return b
+    if b is None:
+        return a
+    return min(a, b)
+
+
+class TimelineSyncEndpoint(Endpoint):
+    def __init__(self, session, writer, checkpoints=None):
+        super().__init__(
+            "tweets",
+            "/2/users/{key}/tweets",
+            {
+                "tweet.fields": "created_at,conversation_id,public_metrics," + INTERACTION_FIELDS,
+                "max_results": 100,
+            },
+            self._on_page,
+            on_done=self._on_done,
+            on_failed=self._on_failed,
+        )
+        self.session = session
+        self.writer = writer
+        self.checkpoints = checkpoints
+        # Tweets stored before conversation_id and search_text existed get them
+        # filled in, and every sync refreshes the public metrics
+        self.writer.register(
+            Tweet,
+            conflict="merge",
+            update=[
+                "search_text",
+                "conversation_id",
+                "retweet_count",
+                "reply_count",
+                "like_count",
+                "quote_count",
+            ],
+        )
+        register_interactions(self.writer)
+        register_thread_updates(self.writer)
+        self.writer.register(
+            TimelineSync,
+            conflict="update",
+            update=["newest_id", "gap_since_id", "gap_until_id", "synced_at"],
+        )
+        # Stored sync rows of the keys about to be crawled
+        self._stored = {}
+        # Keys that never went through prepare(), as in a replay, keep the row
+        # their last chain wrote for the next one
+        self._prepared = False
+        # Newest and oldest tweet id seen by each running chain
+        self._chains = {}
+        self.modes = {"full": 0, "refresh": 0, "backfill": 0}
+
+    # Load the sync rows of the keys in batches as they stream past
+    def prepare(self, keys, batch_size=1000):
+        self._prepared = True
+        return batched_keys(keys, batch_size, self._prepare_batch)
+
+    def _prepare_batch(self, keys):
+        for row in self.session.query(TimelineSync).filter(
+            TimelineSync.user_id.in_(keys)
+        ):
+            self._stored[row.user_id] = {
+                "user_id": row.user_id,
+                "newest_id": row.newest_id,
+                "gap_since_id": row.gap_since_id,
+                "gap_until_id": row.gap_until_id,
+            }
+            self.session.expunge(row)
+        return keys
+
+    def mode(self, key):
+        stored = self._stored.get(key)
+        if stored is None or stored["newest_id"] is None:
+            return "full"
+        if stored["gap_until_id"] is not None:
+            return "backfill"
+        return "refresh"
+
+    def request_params(self, key, pagination_token=None):
+        params = super().request_params(key, pagination_token)
+        stored = self._stored.get(key)
+        mode = self.mode(key)
+        if mode == "refresh":
+            params["since_id"] = stored["newest_id"]
+        elif mode == "backfill":
+            params["until_id"] = stored["gap_until_id"]
+            if stored["gap_since_id"] is not None:
+                params["since_id"] = stored["gap_since_id"]
+        return params
+
+    def page_limit(self, key):
+        return {
+            "full": None,
+            "refresh": REFRESH_MAX_PAGES,
+            "backfill": BACKFILL_MAX_PAGES,
+        }[self.mode(key)]
+
+    def _on_page(self, user_id, data):
+        chain = self._chains.get(user_id)
+        if chain is None:
+            newest = None
+            if self.checkpoints is not None:
+                newest = self.checkpoints.resume_newest(user_id)
+            chain = self._chains[user_id] = {"newest": newest, "oldest": None}
+        conversation_ids = []
+        for tweet_data in data.get("data", []):
+            # Check if the required fields are present in the tweet data
+            if not all(field in tweet_data for field in ["id", "text", "created_at"]):
+                print(f"Missing required field(s) in tweet {tweet_data['id']}.")
+                continue
+            tweet_id = int(tweet_data["id"])
+            conversation_id = tweet_data.get("conversation_id")
+            if conversation_id is not None:
+                conversation_id = int(conversation_id)
+                conversation_ids.append(conversation_id)
+            public_metrics = tweet_data.get("public_metrics", {})
+            self.writer.add(
+                Tweet,
+                {
+                    "id": tweet_id,
+                    "text": tweet_data["text"],
+                    "search_text": normalize(tweet_data["text"]),
+                    "created_at": parse_twitter_time(tweet_data["created_at"]),
+                    "author_id": int(user_id),
+                    "conversation_id": conversation_id,
+                    "retweet_count": public_metrics.get("retweet_count"),
+                    "reply_count": public_metrics.get("reply_count"),
+                    "like_count": public_metrics.get("like_count"),
+                    "quote_count": public_metrics.get("quote_count"),
+                },
+            )
+            add_interactions(self.writer, [tweet_data], user_id)
+            chain["newest"] = newer(chain["newest"], tweet_id)
+            chain["oldest"] = older(chain["oldest"], tweet_id)
+        mark_conversations(self.writer, conversation_ids)
+        if self.checkpoints is not None:
+            self.checkpoints.keep_newest(user_id, chain["newest"])
+
+    # The chain's newest id is kept with its failed checkpoint, a later run
+    # resumes it from there
+    def _on_failed(self, user_id):
+        self._chains.pop(user_id, None)
+        self._stored.pop(user_id, None)
+
+    def _on_done(self, user_id, truncated):
+        mode = self.mode(user_id)
+        self.modes[mode] += 1
+        chain = self._chains.pop(user_id, {"newest": None, "oldest": None})
+        stored = self._stored.pop(user_id, None) or {
+            "user_id": user_id,
+            "newest_id": None,
+            "gap_since_id": None,
+            "gap_until_id": None,
+        }
+
+        row = dict(stored)
+        row["newest_id"] = newer(stored["newest_id"], chain["newest"])
+        if mode == "refresh" and truncated:
+            # Tweets between the old newest and the oldest one fetched are missing
+            row["gap_since_id"] = stored["newest_id"]
+            row["gap_until_id"] = chain["oldest"]
+        elif mode == "backfill":
+            if truncated:
+                row["gap_until_id"] = chain["oldest"]
+            else:
+                row["gap_since_id"] = None
+                row["gap_until_id"] = None
+        # A user without tweets keeps newest_id NULL and is walked in full again
+        row["synced_at"] = datetime.now(timezone.utc).replace(tzinfo=None)
+        self.writer.add(TimelineSync, row)
+        if not self._prepared:
+            self._stored[user_id] = {name: row[name] for name in stored}
@@ -0,0 +1,238 @@
+import json
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import requests
+import tweepy
+from crawler import CrawlStats, key_failed
+from rate_limit import TokenPool
+
+# Synchronous crawl path of the V2 grabbers on tweepy. One tweepy.Client is
+# built per bearer token and kept for the whole run. Requests go through
+# tweepy's own request layer (auth, error types) but are scheduled by a
+# TokenPool on the x-rate-limit-* headers: every request goes to the token
+# with the most budget left, and the crawler only sleeps once all of them are
+# exhausted, instead of one client sleeping through its window while the
+# others sit unused. One thread per client walks the pagination chain of a key
+# and streams its pages back, each client carries one request at a time. Rows,
+# checkpoints and flushes stay on the calling thread, through the same Endpoint
+# descriptors the asyncio CrawlEngine uses, so page caps and on_start/on_done
+# bookkeeping behave the same on both paths. With a ResponseArchive every page
+# is archived raw as well, as the asyncio path does.
+
+# Attempts per page on server errors and dropped connections
+RETRIES = 3
+
+# Marks the end of a key's pages on the results queue
+_DONE = object()
+
+
+# Raised in a walker when the run stops while it waits for a token
+class _Stopped(Exception):
+    pass
+
+
+class TweepyCrawler:
+    # writer:  BulkWriter the endpoint buffers rows in, flushed between pages
+    # archive: optional ResponseArchive every successful response is appended to
+    def __init__(
+        self, bearer_tokens, writer=None, progress_every=100, pool=None, archive=None
+    ):
+        self.pool = pool or TokenPool(bearer_tokens, max_in_flight=1)
+        self.clients = [
+            tweepy.Client(bearer_token=token, wait_on_rate_limit=False)
+            for token in self.pool.tokens
+        ]
+        self.writer = writer
+        self.archive = archive
+        self.progress_every = progress_every
+        self._stats_lock = threading.Lock()
+        self._stop = threading.Event()
+
+    def _count(self, stats, name):
+        with self._stats_lock:
+            setattr(stats, name, getattr(stats, name) + 1)
+
+    # GET one page with the client that has the most budget left. Returns the
+    # token slot and the raw response body, raises tweepy.HTTPException once
+    # the page keeps failing.
+    def request(self, endpoint, key, params, stats):
+        path = endpoint.path.format(key=key)
+        attempt = 0
+        while True:
+            slot = self.pool.acquire(endpoint.path, stop=self._stop)
+            if slot is None:
+                raise _Stopped()
+            # Stopped while the token was handed out, give it back unused
+            if self._stop.is_set():
+                self.pool.update(slot, endpoint.path, None, {})
+                raise _Stopped()
+            status = None
+            headers = {}
+            try:
+                response = self.clients[slot].request("GET", path, params=params)
+                status = response.status_code
+                headers = response.headers
+                return slot, response.content
+            except tweepy.TooManyRequests as e:
+                status = 429
+                headers = e.response.headers
+            except (tweepy.TwitterServerError, requests.ConnectionError) as e:
+                response = getattr(e, "response", None)
+                status = getattr(response, "status_code", None)
+                headers = response.headers if response is not None else {}
+                attempt += 1
+                self._count(stats, "errors")
+                if attempt >= RETRIES:
+                    raise
+                if self._stop.wait(attempt):
+                    raise _Stopped()
+            except tweepy.HTTPException as e:
+                status = e.response.status_code
+                headers = e.response.headers
+                raise
+            finally:
+                self._count(stats, "requests")
+                self.pool.update(slot, endpoint.path, status, headers)
+
+    # Stream the pages of one key's pagination chain as (page, next token,
+    # truncated). The chain ends when the next token is None, truncated is True
+    # when the endpoint's page limit cut it short.
+    def pages(self, endpoint, key, stats, pagination_token=None, pages=0):
+        max_pages = endpoint.page_limit(key)
+        while not self._stop.is_set():
+            params = endpoint.request_params(key, pagination_token)
+            slot, body = self.request(endpoint, key, params, stats)
+            data = json.loads(body)
+            pages += 1
+            next_token = data.get("meta", {}).get("next_token")
+            truncated = False
+            if not endpoint.paginate:
+                next_token = None
+            if max_pages and pages >= max_pages and next_token:
+                next_token = None
+                truncated = True
+            if self.archive is not None:
+                self.archive.record(
+                    endpoint.name,
+                    key,
+                    params,
+                    slot,
+                    body,
+                    last=next_token is None,
+                    truncated=truncated,
+                )
+            yield data, next_token, truncated
+            if next_token is None:
+                return
+            pagination_token = next_token
+
+    # Worker thread: walk one key's pages onto the results queue, then _DONE
+    # or the exception that ended the chain
+    def _walk(self, endpoint, key, resume, stats, results):
+        try:
+            for page in self.pages(endpoint, key, stats, *resume):
+                results.put((key, page))
+        except _Stopped:
+            return
+        except Exception as e:
+            results.put((key, e))
+        else:
+            results.put((key, _DONE))
+
+    # Store one streamed page. Returns the key's new resume point.
+    def _page_done(self, endpoint, checkpoints, key, page, pages, stats):
+        data, next_token, truncated = page
+        stats.pages += 1
+        pages += 1
+        endpoint.on_page(key, data)
+        if next_token is None and endpoint.on_done is not None:
+            endpoint.on_done(key, truncated)
+        # Store the checkpoint with the page's rows, then flush both together
+        if checkpoints is not None:
+            checkpoints.page_done(key, next_token, pages)
+        if self.writer is not None:
+            self.writer.flush_if_due()
+        return next_token, pages
+
+    def _progress(self, endpoint, checkpoints, stats, total, start_time):
+        if total:
+            # Skipped keys count as done for the estimate
+            done = stats.keys_done + (checkpoints.skipped if checkpoints else 0)
+            elapsed_time = time.time() - start_time
+            estimated_time_remaining = (elapsed_time / done) * max(total - done, 0)
+            print(
+                f"Processed {endpoint.name} {done} of {total}. "
+                f"Estimated time remaining: {estimated_time_remaining / 60:.2f} minutes."
+            )
+        else:
+            print(f"Processed {endpoint.name} {stats.keys_done}.")
+        print(f"Quota: {self.pool.summary()}")
+
+    # Crawl every key with the endpoint, as many keys at a time as there are
+    # clients. Checkpoints work as in CrawlEngine.run().
+    def run(self, endpoint, keys, checkpoints=None, total=None):
+        if total is None and hasattr(keys, "__len__"):
+            total = len(keys)
+        if checkpoints is not None:
+            keys = checkpoints.pending(keys)
+        keys = iter(keys)
+        stats = CrawlStats()
+        start_time = time.time()
+        rate_limited = self.pool.rate_limited
+        idle_time = self.pool.idle_time
+        results = queue.Queue()
+        # Resume point (pagination token, pages) of every key being walked
+        walking = {}
+        more_keys = True
+        self._stop.clear()
+        executor = ThreadPoolExecutor(max_workers=len(self.clients))
+        try:
+            while True:
+                while more_keys and len(walking) < len(self.clients):
+                    key = next(keys, _DONE)
+                    if key is _DONE:
+                        more_keys = False
+                        break
+                    resume = (None, 0)
+                    if checkpoints is not None:
+                        resume = checkpoints.resume(key)
+                    if endpoint.on_start is not None:
+                        endpoint.on_start(key, resume[0] is not None)
+                    walking[key] = resume
+                    executor.submit(self._walk, endpoint, key, resume, stats, results)
+                if not walking:
+                    break
+                key, item = results.get()
+                if isinstance(item, tuple):
+                    walking[key] = self._page_done(
+                        endpoint, checkpoints, key, item, walking[key][1], stats
+                    )
+                    continue
+                pagination_token, pages = walking.pop(key)
+                if isinstance(item, Exception):
+                    if not isinstance(item, (tweepy.HTTPException, requests.ConnectionError)):
+                        raise item
+                    print(f"Error fetching {endpoint.name} for {key}: {item}")
+                    key_failed(endpoint, checkpoints, key, pagination_token, pages)
+                stats.keys_done += 1
+                if stats.keys_done % self.progress_every == 0 or stats.keys_done == total:
+                    self._progress(endpoint, checkpoints, stats, total, start_time)
+        finally:
+            # Walkers stop after their current request, or at once while they
+            # wait for a token. Whatever is buffered belongs to finished pages,
+            # keep it on Ctrl-C too
+            self._stop.set()
+            executor.shutdown(wait=True)
+            if self.writer is not None:
+                self.writer.flush()
+            if self.archive is not None:
+                self.archive.flush()
+        stats.elapsed = time.time() - start_time
+        stats.rate_limited = self.pool.rate_limited - rate_limited
+        stats.idle_time = self.pool.idle_time - idle_time
+        print(f"Finished {endpoint.name}: {stats}")
+        if checkpoints is not None:
+            print(f"Checkpoints for {endpoint.name}: {checkpoints.summary()}")
+        return stats
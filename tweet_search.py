@@ -0,0 +1,277 @@
+import math
+import time
+import requests
+from crawler import Endpoint
+from models import Tweet, User
+from user_hydration import USER_FIELDS, parse_twitter_time, user_row
+from interactions import INTERACTION_FIELDS, add_interactions, register_interactions
+from thread_index import mark_conversations, register_thread_updates
+from text_search import normalize
+
+# Full-archive search split into time windows that are crawled concurrently.
+# The range is planned from /2/tweets/counts/all: day buckets are merged into
+# windows holding about the same number of tweets, and days denser than that
+# are subdivided into hours first. Every window is one pagination chain for the
+# CrawlEngine, so the windows run in parallel across the bearer tokens.
+
+SEARCH_PATH = "/2/tweets/search/all"
+COUNTS_PATH = "/2/tweets/counts/all"
+MAX_RESULTS = 500
+TIME_FORMAT = "%Y-%m-%dT%H:%M:%SZ"
+
+
+def format_time(moment):
+    return moment.strftime(TIME_FORMAT)
+
+
+class Window:
+    # count: matching tweets reported by the counts endpoint, None if unknown
+    def __init__(self, start, end, count=None):
+        self.start = start
+        self.end = end
+        self.count = count
+        self.fetched = 0
+
+    @property
+    def key(self):
+        return f"{format_time(self.start)}/{format_time(self.end)}"
+
+
+# Tweet counts for [start, end) in buckets of `granularity` (day, hour or
+# minute), or None if the counts endpoint cannot be used. Pass a
+# requests.Session as `http` to reuse its connections.
+def fetch_counts(base_url, pool, query, start, end, granularity, http=None):
+    http = http or requests
+    buckets = []
+    next_token = None
+    while True:
+        params = {
+            "query": query,
+            "start_time": format_time(start),
+            "end_time": format_time(end),
+            "granularity": granularity,
+        }
+        if next_token:
+            params["pagination_token"] = next_token
+        slot = pool.acquire(COUNTS_PATH)
+        headers = {
+            "Authorization": f"Bearer {pool.tokens[slot]}",
+            "Content-Type": "application/json",
+        }
+        status = None
+        response_headers = {}
+        try:
+            response = http.get(base_url + COUNTS_PATH, headers=headers, params=params)
+            status = response.status_code
+            response_headers = response.headers
+        finally:
+            pool.update(slot, COUNTS_PATH, status, response_headers)
+
+        # If the status code is 429, retry once a token has budget again
+        if status == 429:
+            continue
+
+        if status != 200:
+            print(f"Error fetching tweet counts: {status}, {response.text}")
+            return None
+
+        data = response.json()
+        for bucket in data.get("data", []):
+            buckets.append(
+                Window(
+                    parse_twitter_time(bucket["start"]),
+                    parse_twitter_time(bucket["end"]),
+                    bucket["tweet_count"],
+                )
+            )
+        next_token = data.get("meta", {}).get("next_token")
+        if not next_token:
+            return buckets
+
+
+# Split [start_time, end_time) into about `windows` windows of similar volume.
+# Windows without any matching tweet are left out.
+def plan_windows(base_url, pool, query, start_time, end_time, windows, http=None):
+    start = parse_twitter_time(start_time)
+    end = parse_twitter_time(end_time)
+    buckets = fetch_counts(base_url, pool, query, start, end, "day", http)
+    if buckets is None:
+        # Without counts fall back to slices of equal length
+        step = (end - start) / windows
+        planned = [Window(start + step * i, start + step * (i + 1)) for i in range(windows)]
+        planned[-1].end = end
+        return planned
+
+    total = sum(bucket.count for bucket in buckets)
+    target = max(math.ceil(total / windows), MAX_RESULTS)
+
+    # Days denser than one window are subdivided into hours
+    refined = []
+    for bucket in buckets:
+        if bucket.count > target:
+            hours = fetch_counts(
+                base_url, pool, query, bucket.start, bucket.end, "hour", http
+            )
+            refined.extend(hours or [bucket])
+        else:
+            refined.append(bucket)
+
+    # Merge neighbouring buckets until a window holds about `target` tweets
+    planned = []
+    current = None
+    for bucket in refined:
+        if current is not None and current.count + bucket.count > target:
+            planned.append(current)
+            current = None
+        if current is None:
+            current = Window(bucket.start, bucket.end, bucket.count)
+        else:
+            current.end = bucket.end
+            current.count += bucket.count
+    if current is not None:
+        planned.append(current)
+    planned = [window for window in planned if window.count]
+
+    print(
+        f"Planned {len(planned)} windows for {total} tweets "
+        f"between {start_time} and {end_time}."
+    )
+    return planned
+
+
+# Map one search page to author rows and tweet rows. Authors are indexed by id
+# once per page from the includes.users expansion; an author missing from it
+# still gets a row so the tweet's foreign key holds. Authors stored as
+# placeholders by the edge grabbers become regular users.
+def search_page_rows(data):
+    authors = {
+        user["id"]: dict(user_row(user), placeholder=False)
+        for user in data.get("includes", {}).get("users", [])
+    }
+    tweets = []
+    for tweet in data.get("data", []):
+        author = authors.get(tweet["author_id"])
+        if author is None:
+            author = authors[tweet["author_id"]] = dict(
+                user_row({"id": tweet["author_id"]}), placeholder=False
+            )
+        public_metrics = tweet["public_metrics"]
+        tweets.append(
+            {
+                "id": int(tweet["id"]),
+                "text": tweet["text"],
+                "search_text": normalize(tweet["text"]),
+                "created_at": parse_twitter_time(tweet["created_at"]),
+                "author_id": author["id"],
+                "author_username": author["username"],
+                "conversation_id": int(tweet["conversation_id"]),
+                "retweet_count": public_metrics["retweet_count"],
+                "reply_count": public_metrics["reply_count"],
+                "like_count": public_metrics["like_count"],
+                "quote_count": public_metrics["quote_count"],
+            }
+        )
+    return list(authors.values()), tweets
+
+
+class SearchEndpoint(Endpoint):
+    # progress_every: pages between two progress lines
+    def __init__(self, writer, query, windows, progress_every=20):
+        super().__init__(
+            "search",
+            SEARCH_PATH,
+            {
+                "query": query,
+                "tweet.fields": "created_at,author_id,conversation_id,public_metrics,"
+                + INTERACTION_FIELDS,
+                "expansions": "author_id",
+                "user.fields": USER_FIELDS,
+                "max_results": MAX_RESULTS,
+            },
+            self._on_page,
+            on_done=self._on_done,
+        )
+        # Authors are registered first so they are always written before their
+        # tweets. Their profiles come with the page, so they are stored as
+        # hydrated; missing fields never overwrite stored ones.
+        self.writer = writer
+        self.writer.register(
+            User,
+            conflict="merge",
+            update=[
+                "username",
+                "description",
+                "location",
+                "followers_count",
+                "following_count",
+                "tweet_count",
+                "created_at",
+                "placeholder",
+            ],
+        )
+        self.writer.register(
+            Tweet,
+            conflict="update",
+            update=[
+                "search_text",
+                "conversation_id",
+                "retweet_count",
+                "reply_count",
+                "like_count",
+                "quote_count",
+            ],
+        )
+        register_interactions(self.writer)
+        register_thread_updates(self.writer)
+        self.windows = {window.key: window for window in windows}
+        self.progress_every = progress_every
+        self.pages = 0
+        self.fetched = 0
+        self.windows_done = 0
+        self.start_time = time.time()
+
+    def request_params(self, key, pagination_token=None):
+        params = super().request_params(key, pagination_token)
+        window = self.windows[key]
+        params["start_time"] = format_time(window.start)
+        params["end_time"] = format_time(window.end)
+        return params
+
+    def _on_page(self, key, data):
+        authors, tweets = search_page_rows(data)
+        self.writer.add_many(User, authors)
+        self.writer.add_many(Tweet, tweets)
+        add_interactions(self.writer, data.get("data", []))
+        mark_conversations(self.writer, [tweet["conversation_id"] for tweet in tweets])
+        # Replayed pages have no window
+        if key in self.windows:
+            self.windows[key].fetched += len(tweets)
+        self.fetched += len(tweets)
+        self.pages += 1
+        if self.pages % self.progress_every == 0:
+            print(self.progress())
+
+    def _on_done(self, key, truncated):
+        self.windows_done += 1
+        # Replayed pages have no window
+        if key in self.windows:
+            print(f"Finished window {key}: {self.windows[key].fetched} tweets. {self.progress()}")
+
+    # Estimate from the tweets still expected in all windows when the counts
+    # are known, otherwise from the windows still running
+    def progress(self):
+        elapsed_time = time.time() - self.start_time
+        expected = [window.count for window in self.windows.values()]
+        if None not in expected:
+            total = sum(expected)
+            done = self.fetched
+            line = f"Fetched {done} of {total} tweets"
+        else:
+            total = len(self.windows)
+            done = self.windows_done
+            line = f"Fetched {self.fetched} tweets"
+        line += f", {self.windows_done} of {len(self.windows)} windows done."
+        if done:
+            estimated_time_remaining = elapsed_time / done * max(total - done, 0)
+            line += f" Estimated time remaining: {estimated_time_remaining / 60:.2f} minutes."
+        return line
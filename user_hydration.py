@@ -0,0 +1,140 @@
+from datetime import datetime
+from itertools import islice
+from sqlalchemy import update
+from crawler import CrawlEngine, Endpoint
+from models import User
+from user_source import count_users, iter_user_ids, not_hydrated
+
+# The /2/users endpoint accepts up to 100 comma-separated ids per request
+MAX_IDS_PER_REQUEST = 100
+
+USER_FIELDS = "description,location,public_metrics,created_at"
+
+
+# Split an iterable into consecutive lists of at most `size` items
+def chunked(items, size):
+    items = iter(items)
+    while True:
+        chunk = list(islice(items, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+# Convert an API timestamp like "2023-04-01T12:00:00.000Z" into a naive UTC datetime
+def parse_twitter_time(value):
+    if value is None:
+        return None
+    return datetime.fromisoformat(value.replace("Z", "+00:00")).replace(tzinfo=None)
+
+
+# Turn an entry of the "errors" array into the reason stored on the user row
+def unavailable_reason(error):
+    detail = (error.get("detail") or "").lower()
+    if "suspended" in detail:
+        return "suspended"
+    if error.get("type", "").endswith("resource-not-found"):
+        return "not_found"
+    return error.get("title") or "unavailable"
+
+
+# Map a user object requested with USER_FIELDS to a row of the users table
+def user_row(user_data):
+    public_metrics = user_data.get("public_metrics", {})
+    return {
+        "id": int(user_data["id"]),
+        "username": user_data.get("username"),
+        "description": user_data.get("description"),
+        "location": user_data.get("location"),
+        "followers_count": public_metrics.get("followers_count"),
+        "following_count": public_metrics.get("following_count"),
+        "tweet_count": public_metrics.get("tweet_count"),
+        "created_at": parse_twitter_time(user_data.get("created_at")),
+    }
+
+
+# Map the "data" and "errors" arrays of a /2/users response to rows for a bulk UPDATE.
+# Requested ids the response does not mention at all are marked "missing", so
+# they are not asked for again forever, unless a request level error explains
+# their absence.
+def build_user_updates(data, requested=()):
+    hydrated = [user_row(user_data) for user_data in data.get("data", [])]
+
+    unavailable = []
+    request_error = False
+    for error in data.get("errors", []):
+        # Only per-id resource errors identify a user, request level errors do not
+        if error.get("parameter") != "ids":
+            request_error = True
+            continue
+        unavailable.append(
+            {
+                "id": int(error.get("resource_id") or error["value"]),
+                "unavailable_reason": unavailable_reason(error),
+            }
+        )
+
+    if not request_error:
+        seen = {row["id"] for row in hydrated + unavailable}
+        unavailable.extend(
+            {"id": user_id, "unavailable_reason": "missing"}
+            for user_id in dict.fromkeys(requested)
+            if user_id not in seen
+        )
+
+    return hydrated, unavailable
+
+
+# Write one chunk of hydrated and unavailable users with bulk UPDATEs by primary key
+def apply_user_updates(session, hydrated, unavailable):
+    if hydrated:
+        session.execute(update(User), hydrated)
+    if unavailable:
+        session.execute(update(User), unavailable)
+    session.commit()
+
+
+# Endpoint descriptor for the /2/users lookup, keyed by comma-joined id chunks.
+# With a history.History the public_metrics of every page are recorded too.
+def users_endpoint(session, history=None):
+    def on_page(key, data):
+        requested = [int(user_id) for user_id in key.split(",")]
+        hydrated, unavailable = build_user_updates(data, requested)
+        try:
+            apply_user_updates(session, hydrated, unavailable)
+        except Exception:
+            session.rollback()
+            raise
+        if history is not None:
+            history.record_metrics(hydrated)
+
+    return Endpoint(
+        "users",
+        "/2/users",
+        {"user.fields": USER_FIELDS},
+        on_page,
+        key_param="ids",
+        paginate=False,
+    )
+
+
+# Hydrate all pending users in chunks of `batch_size` ids per request, or the
+# users matching `filters` (user_source conditions) to refresh their profiles.
+# Returns the crawl stats.
+def hydrate_pending_users(
+    session,
+    base_url,
+    bearer_tokens,
+    batch_size=MAX_IDS_PER_REQUEST,
+    history=None,
+    filters=None,
+    **engine_options,
+):
+    if filters is None:
+        filters = not_hydrated()
+    # Stream the ids of users that still need to be hydrated
+    user_ids = iter_user_ids(session, filters)
+    total = -(-count_users(session, filters) // batch_size)
+    keys = (",".join(map(str, chunk)) for chunk in chunked(user_ids, batch_size))
+    with CrawlEngine(base_url, bearer_tokens, **engine_options) as engine:
+        return engine.run(users_endpoint(session, history), keys, total=total)
@@ -0,0 +1,82 @@
+from sqlalchemy import exists
+from models import User, Following, Follower, CrawlState
+from crawl_state import DONE
+
+# Streaming access to the users table. Rows are read in primary key order one
+# batch at a time (keyset pagination), so memory use does not grow with the
+# size of the table the way session.query(User).all() does.
+
+
+# Users collected by the crawl, not placeholders stored for the far end of an edge
+def collected():
+    return [User.placeholder.isnot(True)]
+
+
+# Collected users that are not known to be suspended or deleted
+def available():
+    return collected() + [User.unavailable_reason.is_(None)]
+
+
+# Users that have not been hydrated by 2_user_grabber.py yet
+def not_hydrated():
+    return available() + [User.created_at.is_(None)]
+
+
+# Users without any stored following edges
+def has_no_following():
+    return [~exists().where(Following.user_id == User.id)]
+
+
+# Users without any stored follower edges
+def has_no_followers():
+    return [~exists().where(Follower.user_id == User.id)]
+
+
+# Users whose crawl of `endpoint` is not finished
+def not_crawled(endpoint):
+    return collected() + [
+        ~exists().where(
+            CrawlState.endpoint == endpoint,
+            CrawlState.user_id == User.id,
+            CrawlState.status == DONE,
+        )
+    ]
+
+
+def count_users(session, filters=()):
+    return session.query(User.id).filter(*filters).count()
+
+
+# Yield user ids matching all filters, batch_size rows per query
+def iter_user_ids(session, filters=(), batch_size=1000):
+    last_id = None
+    while True:
+        query = session.query(User.id).filter(*filters)
+        if last_id is not None:
+            query = query.filter(User.id > last_id)
+        rows = query.order_by(User.id).limit(batch_size).all()
+        if not rows:
+            return
+        for row in rows:
+            yield row.id
+        last_id = rows[-1].id
+
+
+# Yield User objects matching all filters. Each batch is expunged from the
+# session before the next one is loaded, so the identity map stays small.
+# Changes made to a batch must be committed before iterating further.
+def iter_users(session, filters=(), batch_size=1000):
+    last_id = None
+    while True:
+        query = session.query(User).filter(*filters)
+        if last_id is not None:
+            query = query.filter(User.id > last_id)
+        users = query.order_by(User.id).limit(batch_size).all()
+        if not users:
+            return
+        last_id = users[-1].id
+        for user in users:
+            yield user
+        for user in users:
+            if user in session:
+                session.expunge(user)
@@ -0,0 +1,309 @@
+import asyncio
+import os
+import socket
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import DateTime, Integer, func, literal, select, true, update
+from models import User, WorkItem, QueueWorker
+from bulk_writer import dialect_insert
+
+# Shared crawl frontier in the database, so several crawler processes, on one
+# machine or many and each with its own bearer tokens, can split the users of a
+# job between them. Workers claim batches of pending users with
+# UPDATE ... WHERE user_id IN (SELECT ... FOR UPDATE SKIP LOCKED), so concurrent
+# claims never block on or return the same rows. A claim is a lease: a
+# background thread extends it with heartbeats, and the leases of a worker
+# that stopped heartbeating (crashed, killed, lost its connection) expire and
+# are handed out again. Finished users are marked through the worker's
+# BulkWriter, in the same transaction as their rows and checkpoints.
+
+PENDING = "pending"
+LEASED = "leased"
+DONE = "done"
+FAILED = "failed"
+JOBS = ("tweets", "following", "followers")
+
+
+def utc_now():
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+# Add every user matching the filters to a job's queue, users already in it are
+# left alone. Returns the number of users added.
+def enqueue_users(session, job, filters=()):
+    # The WHERE keeps SQLite from reading ON CONFLICT as part of the SELECT
+    users = select(
+        literal(job),
+        User.id,
+        literal(PENDING),
+        literal(0, Integer),
+        literal(utc_now(), DateTime),
+    ).where(true(), *filters)
+    statement = (
+        dialect_insert(session, WorkItem.__table__)
+        .from_select(["job", "user_id", "status", "attempts", "updated_at"], users)
+        .on_conflict_do_nothing(index_elements=["job", "user_id"])
+    )
+    added = session.execute(statement).rowcount
+    session.commit()
+    return added
+
+
+# Put a job's users with the given status back in the queue
+def requeue(session, job, status=FAILED):
+    requeued = session.execute(
+        update(WorkItem)
+        .where(WorkItem.job == job, WorkItem.status == status)
+        .values(status=PENDING, worker=None, lease_expires_at=None, attempts=0)
+    ).rowcount
+    session.commit()
+    return requeued
+
+
+# Users per status and the workers of a job
+def progress(session, job):
+    counts = dict.fromkeys((PENDING, LEASED, DONE, FAILED), 0)
+    counts.update(
+        session.query(WorkItem.status, func.count())
+        .filter(WorkItem.job == job)
+        .group_by(WorkItem.status)
+        .all()
+    )
+    workers = (
+        session.query(QueueWorker)
+        .filter(QueueWorker.job == job)
+        .order_by(QueueWorker.worker)
+        .all()
+    )
+    return counts, workers
+
+
+def print_progress(session, job):
+    counts, workers = progress(session, job)
+    total = sum(counts.values())
+    share = counts[DONE] / total * 100 if total else 0
+    print(
+        f"Queue {job}: {counts[DONE]} done, {counts[FAILED]} failed, "
+        f"{counts[LEASED]} leased, {counts[PENDING]} pending ({share:.1f}% done)."
+    )
+    now = utc_now()
+    for worker in workers:
+        seconds = (now - worker.heartbeat_at).total_seconds()
+        print(
+            f"  {worker.worker}: {worker.tokens} tokens, {worker.claimed} claimed, "
+            f"{worker.done} done, {worker.failed} failed, last heartbeat {seconds:.0f}s ago"
+        )
+
+
+class WorkQueue:
+    # job:           queue to work on, e.g. "following"
+    # worker:        unique name of this worker, host and pid by default
+    # lease_seconds: how long claimed users stay reserved without a heartbeat
+    # batch_size:    users claimed per query
+    # max_attempts:  a user that failed is handed out again until it has been
+    #                tried this often
+    # tokens:        bearer tokens this worker uses, for the progress report
+    def __init__(
+        self,
+        session,
+        writer,
+        job,
+        worker=None,
+        lease_seconds=300,
+        batch_size=100,
+        max_attempts=3,
+        tokens=0,
+    ):
+        self.session = session
+        self.engine = session.get_bind()
+        self.writer = writer
+        self.job = job
+        self.worker = worker or f"{socket.gethostname()}-{os.getpid()}"
+        self.lease_seconds = lease_seconds
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.tokens = tokens
+        self.writer.register(
+            WorkItem,
+            conflict="update",
+            update=["status", "worker", "lease_expires_at", "updated_at"],
+        )
+        self.claimed = 0
+        self.done = 0
+        self.failed = 0
+        # Attempts of the users leased and not finished yet
+        self._leased = {}
+        self._started_at = utc_now()
+        self._stop = threading.Event()
+        self._thread = None
+
+    # Claim up to `count` users, handing out expired leases again first.
+    # Queue statements run on their own short transactions, not the session's.
+    def claim(self, count=None):
+        now = utc_now()
+        with self.engine.begin() as connection:
+            connection.execute(
+                update(WorkItem)
+                .where(
+                    WorkItem.job == self.job,
+                    WorkItem.status == LEASED,
+                    WorkItem.lease_expires_at < now,
+                )
+                .values(status=PENDING, worker=None, lease_expires_at=None)
+            )
+            claimable = (
+                select(WorkItem.user_id)
+                .where(WorkItem.job == self.job, WorkItem.status == PENDING)
+                .order_by(WorkItem.user_id)
+                .limit(count or self.batch_size)
+                .with_for_update(skip_locked=True)
+            )
+            rows = connection.execute(
+                update(WorkItem)
+                .where(WorkItem.job == self.job, WorkItem.user_id.in_(claimable))
+                .values(
+                    status=LEASED,
+                    worker=self.worker,
+                    lease_expires_at=now + timedelta(seconds=self.lease_seconds),
+                    attempts=func.coalesce(WorkItem.attempts, 0) + 1,
+                    updated_at=now,
+                )
+                .returning(WorkItem.user_id, WorkItem.attempts)
+            ).all()
+        # RETURNING gives no order guarantee
+        rows.sort()
+        for user_id, attempts in rows:
+            self._leased[user_id] = attempts
+        self.claimed += len(rows)
+        return [user_id for user_id, _ in rows]
+
+    # Stream claimed users a batch at a time until the queue has none left.
+    # An async iterator for CrawlEngine: every claim runs in a thread, so the
+    # requests in flight keep going while it waits on the database.
+    async def keys(self):
+        while True:
+            user_ids = await asyncio.to_thread(self.claim)
+            if not user_ids:
+                return
+            for user_id in user_ids:
+                yield user_id
+
+    def _finish(self, key, status):
+        attempts = self._leased.pop(key, None)
+        now = utc_now()
+        self.writer.add(
+            WorkItem,
+            {
+                "job": self.job,
+                "user_id": key,
+                "status": status,
+                "worker": self.worker if status != PENDING else None,
+                "lease_expires_at": None,
+                "attempts": attempts,
+                "updated_at": now,
+            },
+        )
+
+    # Called once a user's rows are buffered in the writer
+    def mark_done(self, key):
+        self.done += 1
+        self._finish(key, DONE)
+
+    def mark_failed(self, key):
+        attempts = self._leased.get(key) or self.max_attempts
+        if attempts < self.max_attempts:
+            self._finish(key, PENDING)
+        else:
+            self.failed += 1
+            self._finish(key, FAILED)
+
+    # Extend the leases held by this worker and report its counters
+    def heartbeat(self):
+        now = utc_now()
+        with self.engine.begin() as connection:
+            connection.execute(
+                update(WorkItem)
+                .where(
+                    WorkItem.job == self.job,
+                    WorkItem.worker == self.worker,
+                    WorkItem.status == LEASED,
+                )
+                .values(lease_expires_at=now + timedelta(seconds=self.lease_seconds))
+            )
+            row = {
+                "worker": self.worker,
+                "job": self.job,
+                "tokens": self.tokens,
+                "claimed": self.claimed,
+                "done": self.done,
+                "failed": self.failed,
+                "started_at": self._started_at,
+                "heartbeat_at": now,
+            }
+            statement = dialect_insert(self.session, QueueWorker.__table__)
+            statement = statement.on_conflict_do_update(
+                index_elements=["worker"],
+                set_={
+                    name: statement.excluded[name]
+                    for name in row
+                    if name not in ("worker", "started_at")
+                },
+            )
+            connection.execute(statement, [row])
+
+    def _heartbeats(self):
+        while not self._stop.wait(self.lease_seconds / 3):
+            try:
+                self.heartbeat()
+            except Exception as e:
+                print(f"Heartbeat failed: {e}")
+
+    def start(self):
+        self.heartbeat()
+        self._thread = threading.Thread(target=self._heartbeats, daemon=True)
+        self._thread.start()
+
+    # Whether anything is left to claim, waiting while only other workers'
+    # leases are outstanding: they either finish or expire and come back
+    def wait_for_work(self, poll_seconds=5):
+        while True:
+            now = utc_now()
+            with self.engine.connect() as connection:
+                pending = connection.execute(
+                    select(func.count())
+                    .select_from(WorkItem)
+                    .where(WorkItem.job == self.job, WorkItem.status == PENDING)
+                ).scalar()
+                leased, expired = connection.execute(
+                    select(
+                        func.count(),
+                        func.count().filter(WorkItem.lease_expires_at < now),
+                    )
+                    .select_from(WorkItem)
+                    .where(WorkItem.job == self.job, WorkItem.status == LEASED)
+                ).one()
+            if pending or expired:
+                return True
+            if not leased:
+                return False
+            time.sleep(poll_seconds)
+
+    # Stop heartbeating and give back the users claimed but not finished. Call
+    # after the writer has been flushed.
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        with self.engine.begin() as connection:
+            connection.execute(
+                update(WorkItem)
+                .where(
+                    WorkItem.job == self.job,
+                    WorkItem.worker == self.worker,
+                    WorkItem.status == LEASED,
+                )
+                .values(status=PENDING, worker=None, lease_expires_at=None)
+            )
+        self._leased.clear()
+        self.heartbeat()